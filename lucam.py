@@ -73,6 +73,12 @@ References
 (1) `Lumenera Corporation <http://www.lumenera.com/>`_
 (2) Lumenera USB Camera API Reference Manual Release 5.0. Lumenera Corporation.
 
+The LuCam API is loaded on the first call of an API function, e.g. when
+opening a camera, from lucamapi.dll unless the LUCAM_API environment variable
+is set to 'simulated', in which case the pure NumPy camera simulator in
+lucam_sim.py is used, e.g. to run acquisition code on hosts without Lumenera
+drivers. Other backends can be added with register_backend().
+
 Examples
 --------
 >>> from lucam import Lucam
@@ -83,30 +89,45 @@ Examples
 Refer to the test() function at the end of the document for more examples.
 
 """
+import os
 import sys
+import json
+import mmap
+import time
 import ctypes
+import weakref
+import threading
+import traceback
+import collections
+import concurrent.futures
 
 import numpy
 import copy
 
 __version__ = '2013.01.18'
 __docformat__ = 'restructuredtext en'
-__all__ = ['API', 'Lucam', 'LucamEnumCameras', 'LucamNumCameras',
-           'LucamError', 'LucamGetLastError', 'LucamSynchronousSnapshots',
-           'LucamPreviewAVI', 'LucamConvertBmp24ToRgb24']
+__all__ = ['API', 'load_api', 'register_backend', 'Lucam', 'LucamEnumCameras',
+           'LucamNumCameras', 'LucamError', 'LucamGetLastError',
+           'LucamSynchronousSnapshots', 'LucamPreviewAVI',
+           'LucamConvertBmp24ToRgb24']
 
 
-def API():
-    """Return ctypes interface to the lucamapi.dll dynamic library.
+def declarations():
+    """Return ctypes types, structures, and constants of the LuCam API.
 
-    Raise WindowsError if the LuCam drivers are not installed.
+    The returned dictionary contains all definitions/declarations found in
+    the lucam.h C header. Function prototypes are tuples of return and
+    argument types, keyed by function name.
+
+    No dynamic library is loaded.
 
     """
     from numpy.ctypeslib import ndpointer
-    from ctypes import c_int, c_char_p, c_void_p, POINTER, WINFUNCTYPE
+    from ctypes import c_int, c_char_p, c_void_p, POINTER
     from ctypes.wintypes import (BOOL, BYTE, FLOAT, LONG, ULONG, USHORT,
                                  DWORD, LPCSTR, LPCWSTR, HANDLE, HWND, HMENU)
 
+    WINFUNCTYPE = getattr(ctypes, 'WINFUNCTYPE', ctypes.CFUNCTYPE)
     pUCHAR_LUT = ndpointer(dtype=numpy.uint8, ndim=1, flags='C_CONTIGUOUS')
     pUCHAR_RGB = ndpointer(dtype=numpy.uint8, ndim=3, flags='C_CONTIGUOUS')
     pFLOAT_MATRIX33 = ndpointer(dtype=numpy.float32, ndim=2, shape=(3, 3),
@@ -574,22 +595,131 @@ def API():
     LUCAM_EVENT_GPI4_CHANGED = 7
     LUCAM_EVENT_DEVICE_SURPRISE_REMOVAL = 32
 
-    if sys.platform == 'win32':
-        _api = ctypes.windll.LoadLibrary('lucamapi.dll')
+    return dict((k, v) for k, v in locals().items()
+                if not k.startswith('_'))
+
+
+DECLARATIONS = declarations()
+
+
+def load_api(backend=None):
+    """Return ctypes interface to the lucamapi.dll dynamic library.
+
+    Parameters
+    ----------
+    backend : str, object, or None
+        Name of backend registered with register_backend(): 'lucamapi'
+        loads lucamapi.dll, 'simulated' returns a camera simulator, see
+        lucam_sim.LucamSimulator. Else an object implementing the Lucam*
+        API functions used.
+        If None (default), the LUCAM_API environment variable is used,
+        which defaults to 'lucamapi'.
+
+    Raise WindowsError if the LuCam drivers are not installed.
+
+    """
+    if backend is None:
+        backend = os.environ.get('LUCAM_API', 'lucamapi')
+    if isinstance(backend, str):
+        try:
+            backend = BACKENDS[backend]
+        except KeyError:
+            raise ValueError("Unknown LuCam API backend '%s'. Choose one of "
+                             "%s" % (backend, ', '.join(sorted(BACKENDS))))
+        api = backend()
     else:
-        raise NotImplementedError("Only Windows is supported")
+        api = backend
+    for name, value in DECLARATIONS.items():
+        if name.startswith('Lucam'):
+            if not isinstance(api, ctypes.CDLL):
+                continue
+            func = getattr(api, name)
+            setattr(func, 'restype', value[0])
+            setattr(func, 'argtypes', value[1:])
+        else:
+            setattr(api, name, value)
+    return api
+
+
+def register_backend(name, factory):
+    """Register LuCam API backend for use with load_api().
+
+    Parameters
+    ----------
+    name : str
+        Name of the backend, e.g. to be used in the LUCAM_API environment
+        variable.
+    factory : function
+        Called without arguments to create an object implementing the
+        Lucam* API functions, e.g. a ctypes.CDLL.
+
+    """
+    BACKENDS[name] = factory
+
+
+def _lucamapi():
+    """Return lucamapi.dll dynamic library."""
+    if sys.platform != 'win32':
+        raise NotImplementedError("Only Windows is supported. "
+                                  "Set LUCAM_API=simulated to use the "
+                                  "camera simulator.")
+    return ctypes.windll.LoadLibrary('lucamapi.dll')
+
+
+def _simulator():
+    """Return simulated LuCam API."""
+    from .lucam_sim import LucamSimulator
+    return LucamSimulator()
+
+
+BACKENDS = {'lucamapi': _lucamapi, 'simulated': _simulator}
+
+
+class LazyAPI(object):
+    """LuCam API interface loaded on first call of an API function.
+
+    Types, structures, and constants are available without loading the
+    backend.
+
+    """
 
-    for _name, _value in list(locals().items()):
-        if _name.startswith('Lucam'):
-            _func = getattr(_api, _name)
-            setattr(_func, 'restype', _value[0])
-            setattr(_func, 'argtypes', _value[1:])
-        elif not _name.startswith('_'):
-            setattr(_api, _name, _value)
-    return _api
+    def __init__(self, backend=None):
+        self.__dict__.update((k, v) for k, v in DECLARATIONS.items()
+                             if not k.startswith('Lucam'))
+        self._backend = backend
+        self._api = None
+        self._lock = threading.Lock()
 
+    def __getattr__(self, name):
+        """Return API function of loaded backend."""
+        if not name.startswith('Lucam'):
+            raise AttributeError("'LazyAPI' object has no attribute '%s'"
+                                 % name)
+        func = getattr(self.bind(), name)
+        setattr(self, name, func)
+        return func
 
-API = API()
+    def bind(self, backend=None):
+        """Load backend if not already done and return API interface.
+
+        Parameters
+        ----------
+        backend : str, object, or None
+            Passed to load_api(). Defaults to backend passed to LazyAPI().
+            Raise RuntimeError if a different backend was already loaded.
+
+        """
+        with self._lock:
+            if self._api is None:
+                if backend is not None:
+                    self._backend = backend
+                self._api = load_api(self._backend)
+            elif backend is not None and backend != self._backend:
+                raise RuntimeError("LuCam API backend already loaded")
+        return self._api
+
+
+API = LazyAPI()
 
 
 class Lucam(object):
@@ -616,63 +746,200 @@ class Lucam(object):
     ConversionParams = API.LUCAM_CONVERSION_PARAMS
     ImageFormat = API.LUCAM_IMAGE_FORMAT
 
-    PROPERTY = {}
-    PROP_FLAG = {}
-    PROP_FLIPPING = {}
-    PIXEL_FORMAT = {}
-    COLOR_FORMAT = {}
-    DEMOSAIC_METHOD = {}
-    CORRECT_MATRIX = {}
-    EXTERN_INTERFACE = {}
-    AVI_TYPE = {}
-    EVENT_ID = {}
-
-    for name in dir(API):
-        value = getattr(API, name)
-        if name.startswith('_'):
-            continue
-        elif name.startswith('LUCAM_PROP_FLAG_'):
-            PROP_FLAG[name[16:].lower()] = value
-        elif name.startswith('LUCAM_PROP_FLIPPING_'):
-            PROP_FLIPPING[name[20:].lower()] = value
-        elif name.startswith('LUCAM_PROP_'):
-            PROPERTY[name[11:].lower()] = value
-        elif name.startswith('LUCAM_PF_'):
-            PIXEL_FORMAT[name[9:].lower()] = value
-        elif name.startswith('LUCAM_CF_'):
-            COLOR_FORMAT[name[9:].lower()] = value
-        elif name.startswith('LUCAM_CM_'):
-            CORRECT_MATRIX[name[9:].lower()] = value
-        elif name.startswith('LUCAM_DM_'):
-            DEMOSAIC_METHOD[name[9:].lower()] = value
-        elif name.startswith('LUCAM_EVENT_'):
-            EVENT_ID[name[12:].lower()] = value
-        elif name.startswith('AVI_'):
-            AVI_TYPE[name[4:].lower()] = value
-        elif name.startswith('LUCAM_EXTERN_INTERFACE_'):
-            EXTERN_INTERFACE[value] = name[23:]
-    #del value
-    #del name
+    PROPERTY = {
+        'abs_focus': 85,
+        'auto_exp_maximum': 107,
+        'auto_exp_target': 103,
+        'auto_gain_maximum': 170,
+        'auto_iris_max': 123,
+        'auto_sharpness_gain_threshold_high': 172,
+        'auto_sharpness_gain_threshold_low': 171,
+        'auto_sharpness_high': 174,
+        'auto_sharpness_low': 173,
+        'black_level': 86,
+        'brightness': 0,
+        'color_format': 80,
+        'contrast': 1,
+        'correction_matrix': 65,
+        'demosaicing_method': 64,
+        'digital_gain': 71,
+        'digital_gain_blue': 74,
+        'digital_gain_green': 73,
+        'digital_gain_red': 72,
+        'digital_whitebalance_u': 69,
+        'digital_whitebalance_v': 70,
+        'exposure': 20,
+        'exposure_interval': 113,
+        'fan': 118,
+        'flipping': 66,
+        'focus': 22,
+        'frame_gate': 112,
+        'gain': 40,
+        'gain_blue': 42,
+        'gain_cyan': 42,
+        'gain_green1': 43,
+        'gain_green2': 44,
+        'gain_magenta': 41,
+        'gain_red': 41,
+        'gain_yellow1': 43,
+        'gain_yellow2': 44,
+        'gamma': 5,
+        'hue': 2,
+        'iris': 21,
+        'jpeg_quality': 256,
+        'knee1_exposure': 96,
+        'knee1_level': 99,
+        'knee2_exposure': 97,
+        'knee2_level': 163,
+        'lens_stabilization': 124,
+        'light_frequency': 168,
+        'lsc_x': 121,
+        'lsc_y': 122,
+        'luminance': 169,
+        'max_height': 82,
+        'max_width': 81,
+        'memory': 115,
+        'pan': 16,
+        'pwm': 114,
+        'roll': 18,
+        'saturation': 3,
+        'sharpness': 4,
+        'snapshot_clock_speed': 106,
+        'snapshot_count': 120,
+        'still_exposure': 50,
+        'still_gain': 51,
+        'still_gain_blue': 55,
+        'still_gain_cyan': 55,
+        'still_gain_green1': 53,
+        'still_gain_green2': 54,
+        'still_gain_magenta': 52,
+        'still_gain_red': 52,
+        'still_gain_yellow1': 53,
+        'still_gain_yellow2': 54,
+        'still_knee1_exposure': 96,
+        'still_knee2_exposure': 97,
+        'still_knee3_exposure': 98,
+        'still_strobe_duration': 116,
+        'sync_mode': 119,
+        'temperature': 108,
+        'temperature2': 167,
+        'threshold': 101,
+        'threshold_high': 166,
+        'threshold_low': 165,
+        'tilt': 17,
+        'timestamps': 105,
+        'trigger': 110,
+        'video_knee': 99,
+        'video_trigger': 125,
+        'zoom': 19}
+    PROP_FLAG = {
+        'alternate': 0x00080000,
+        'auto': 0x40000000,
+        'backlash_compensation': 0x20000000,
+        'blue': 0x00000008,
+        'busy': 0x00040000,
+        'green1': 0x00000002,
+        'green2': 0x00000004,
+        'hw_enable': 0x40000000,
+        'little_endian': 0x80000000,
+        'master': 0x40000000,
+        'memory_readback': 0x08000000,
+        'polarity': 0x10000000,
+        'readonly': 0x00010000,
+        'red': 0x00000001,
+        'strobe_from_start_of_exposure': 0x20000000,
+        'sw_trigger': 0x00200000,
+        'unknown_maximum': 0x00020000,
+        'unknown_minimum': 0x00010000,
+        'use': 0x80000000,
+        'use_for_snapshots': 0x04000000}
+    PROP_FLIPPING = {
+        'none': 0,
+        'x': 1,
+        'xy': 3,
+        'y': 2}
+    PIXEL_FORMAT = {
+        '16': 1,
+        '24': 2,
+        '32': 6,
+        '48': 7,
+        '8': 0,
+        'count': 4,
+        'filter': 5,
+        'yuv422': 3}
+    COLOR_FORMAT = {
+        'bayer_bggr': 11,
+        'bayer_cyym': 16,
+        'bayer_gbrg': 10,
+        'bayer_grbg': 9,
+        'bayer_myyc': 19,
+        'bayer_rggb': 8,
+        'bayer_ycmy': 17,
+        'bayer_ymcy': 18,
+        'mono': 0}
+    DEMOSAIC_METHOD = {
+        'fast': 1,
+        'higher_quality': 3,
+        'high_quality': 2,
+        'none': 0,
+        'simple': 8}
+    CORRECT_MATRIX = {
+        'custom': 15,
+        'daylight': 2,
+        'fluorescent': 1,
+        'halogen': 5,
+        'identity': 14,
+        'incandescent': 3,
+        'none': 0,
+        'xenon_flash': 4}
+    EXTERN_INTERFACE = {
+        1: 'USB1',
+        2: 'USB2'}
+    AVI_TYPE = {
+        'raw_lumenera': 0,
+        'standard_24': 1,
+        'standard_32': 2,
+        'standard_8': 4,
+        'xvid_24': 3}
+    EVENT_ID = {
+        'device_surprise_removal': 32,
+        'gpi1_changed': 4,
+        'gpi2_changed': 5,
+        'gpi3_changed': 6,
+        'gpi4_changed': 7,
+        'start_of_readout': 2}
 
     VIDEO_CONTROL = dict(stop_streaming=0, start_streaming=1, start_display=2,
                          pause_stream=3, start_rgbstream=6)
 
-    def __init__(self, number=1):
+    def __init__(self, number=1, api=None):
         """Open connection to Lumenera camera.
 
         number : int
             Camera number. Must be in range 1 through LucamNumCameras().
+        api : object or None
+            LuCam API interface returned by load_api(), e.g.
+            load_api('simulated'). If None (default), the module level
+            API is used.
 
         """
-        self._handle = API.LucamCameraOpen(number)
+        self._api = API if api is None else api
+        self.property_cache = None  # see enable_property_cache()
+        self._capabilities = None  # see capabilities()
+        self._auto_exposure = False  # continuous auto exposure enabled
+        self._snapshot = None  # see snapshot_settings()
+        self._handle = self._api.LucamCameraOpen(number)
         if not self._handle:
-            raise LucamError(API.LucamGetLastError())
+            raise LucamError(self._api.LucamGetLastError())
         self._byteorder = '<' if self.is_little_endian() else '>'
         self._default_frameformat, self._default_framerate = self.GetFormat()
         self._fastframe = None  # frame format while in fast frame mode
         self._streaming = None  # frame format while in streaming mode
         self._callbacks = {}  # references to callback functions
         self._displaying_window = False
+        self.frame_pool = FramePool()  # buffers returned if out is None
+        self._conversion_plans = {}  # see conversion_plan()
+        self._format = None  # format and rate read since last SetFormat
 
     def __del__(self):
         """Close connection to camera."""
@@ -680,7 +947,7 @@ class Lucam(object):
         assert self._fastframe is None
         assert self._streaming is None
         if self._handle:
-            API.LucamCameraClose(self._handle)
+            self._api.LucamCameraClose(self._handle)
 
     def __str__(self):
         """Return detailed information about camera as string."""
@@ -730,7 +997,7 @@ class Lucam(object):
         flags = API.LONG()
         for name in sorted(Lucam.PROPERTY):
             prop = Lucam.PROPERTY[name]
-            if API.LucamGetProperty(self._handle, prop, value, flags):
+            if self._api.LucamGetProperty(self._handle, prop, value, flags):
                 name = name.capitalize().replace('_', ' ')
                 if flags.value:
                     result.append("%s: %s (%s)" % (
@@ -749,7 +1016,11 @@ class Lucam(object):
         if name in Lucam.PROPERTY:
             return self.GetProperty(name)[0]
         elif name.endswith("_range"):
-            result = self.PropertyRange(name[:-6])
+            prop = name[:-6]
+            if self._capabilities and prop in self._capabilities['ranges']:
+                result = self._capabilities['ranges'][prop]
+            else:
+                result = self.PropertyRange(prop)
             setattr(self, name, result)
             return result
         raise AttributeError("'Lucam' object has no attribute '%s'" % name)
@@ -773,6 +1044,21 @@ class Lucam(object):
         snapshot.bufferlastframe = 0
         return snapshot
 
+    def snapshot_settings(self):
+        """Return cached default Snapshot settings.
+
+        The settings are created by default_snapshot() on first use and
+        updated by SetFormat() and SetProperty() of exposure and gain.
+        They are re-read from the camera after auto functions or while
+        continuous auto exposure is enabled.
+
+        The returned structure must not be modified. Use a copy instead.
+
+        """
+        if self._snapshot is None or self._auto_exposure:
+            self._snapshot = self.default_snapshot()
+        return self._snapshot
+
     def default_conversion(self):
         """Return default Conversion settings for ConvertFrameToRgb24()."""
         return API.LUCAM_CONVERSION(DemosaicMethod=API.LUCAM_DM_NONE,
@@ -789,15 +1075,124 @@ class Lucam(object):
             if name.endswith('_flag'):
                 continue
             prop = Lucam.PROPERTY[name]
-            flag = kwargs.get(name + '_flag', 0)
-            if not API.LucamSetProperty(self._handle, prop, value, flag):
-                raise LucamError(self)
+            self.SetProperty(prop, value, kwargs.get(name + '_flag', 0))
+
+    def capabilities(self, refresh=False, cache=None):
+        """Return dictionary of camera capabilities.
+
+        Parameters
+        ----------
+        refresh : bool
+            If True, query the camera even if its capabilities are cached.
+        cache : CapabilityCache or None
+            Persistent table of capabilities. If None, CAPABILITIES is used.
+
+        Capabilities are discovered once per camera model and firmware
+        version by discover_capabilities() and reloaded from the cache on
+        subsequent connects. The '<property>_range' attributes are
+        served from the returned table.
+
+        """
+        if self._capabilities is not None and not refresh:
+            return self._capabilities
+        if cache is None:
+            cache = CAPABILITIES
+        key = "%03X/%s" % (self.GetCameraId(),
+                           print_version(self.QueryVersion().firmware))
+        result = None if refresh else cache.get(key)
+        if result is None:
+            result = self.discover_capabilities()
+            cache.set(key, result)
+        for name in list(self.__dict__):
+            if name.endswith('_range'):
+                delattr(self, name)
+        self._capabilities = result
+        return result
+
+    def discover_capabilities(self):
+        """Query camera for supported properties, ranges and frame rates.
+
+        Return dictionary with keys:
+            properties: names of properties that can be read,
+            ranges: (min, max, default, flags) of properties by name,
+            frame_rates: available frame rates,
+            max_width, max_height: sensor size.
+
+        """
+        properties = []
+        ranges = {}
+        supported = {}  # property number -> range or None
+        for name, prop in sorted(Lucam.PROPERTY.items()):
+            if prop not in supported:
+                try:
+                    self.GetProperty(prop)
+                except LucamError:
+                    continue
+                try:
+                    supported[prop] = self.PropertyRange(prop)
+                except LucamError:
+                    supported[prop] = None
+            properties.append(name)
+            if supported[prop] is not None:
+                ranges[name] = supported[prop]
+        return dict(
+            properties=tuple(properties),
+            ranges=ranges,
+            frame_rates=self.EnumAvailableFrameRates(),
+            max_width=int(self.GetProperty('max_width')[0]),
+            max_height=int(self.GetProperty('max_height')[0]))
+
+    def enable_property_cache(self, ttl=1.0, ttls=None):
+        """Serve GetProperty() from memory and return PropertyCache.
+
+        Parameters
+        ----------
+        ttl : float or None
+            Time in seconds property values are cached. If None, values
+            are cached until written or invalidated.
+        ttls : dict or None
+            Time to live of individual properties, e.g. {'exposure': 10}.
+
+        Values written with SetProperty() or set_properties() update the
+        cache. The temperature, memory and luminance properties are never
+        cached. Hit and miss counts are returned by property_cache.stats().
+
+        """
+        self.property_cache = PropertyCache(ttl, ttls)
+        if self._auto_exposure:
+            self.property_cache.exclude.update(
+                (API.LUCAM_PROP_EXPOSURE, API.LUCAM_PROP_GAIN))
+        return self.property_cache
+
+    def disable_property_cache(self):
+        """Read all properties from camera."""
+        self.property_cache = None
+
+    def _invalidate_properties(self, *props):
+        """Remove properties changed by camera from property cache."""
+        if self.property_cache is not None:
+            self.property_cache.invalidate(*props)
+        props = set(Lucam.PROPERTY.get(p, p) for p in props)
+        if not props or (API.LUCAM_PROP_EXPOSURE in props
+                         or API.LUCAM_PROP_GAIN in props):
+            self._snapshot = None
+
+    def release_frame(self, data):
+        """Return image array obtained from this camera to the frame pool.
+
+        Arrays returned by TakeSnapshot(), TakeFastFrame(), TakeVideo(),
+        ConvertFrameToRgb24() etc. if out is None are taken from the frame
+        pool. Releasing an array, or a view of it, allows it to be reused
+        by the next call. The array must not be used after release.
+
+        """
+        return self.frame_pool.release(data)
 
     def CameraClose(self):
         """Close connection to camera."""
         if self._displaying_window:
             self.DestroyDisplayWindow()
-        if not API.LucamCameraClose(self._handle):
+        if not self._api.LucamCameraClose(self._handle):
             raise LucamError(self)
         self._fastframe = None
         self._streaming = None
@@ -805,15 +1200,19 @@ class Lucam(object):
 
     def CameraReset(self):
         """Reset camera to its power-on default state."""
-        if not API.LucamCameraReset(self._handle):
+        if not self._api.LucamCameraReset(self._handle):
             raise LucamError(self)
+        self.frame_pool.clear()
+        self._conversion_plans.clear()
+        self._format = None
+        self._invalidate_properties()
         self._fastframe = None
         self._streaming = None
 
     def QueryVersion(self):
         """Return camera version information as API.LUCAM_VERSION."""
         result = API.LUCAM_VERSION()
-        if not API.LucamQueryVersion(self._handle, result):
+        if not self._api.LucamQueryVersion(self._handle, result):
             raise LucamError(self)
         return result
 
@@ -824,41 +1223,42 @@ class Lucam(object):
 
         """
         result = API.ULONG()
-        if not API.LucamQueryExternInterface(self._handle, result):
+        if not self._api.LucamQueryExternInterface(self._handle, result):
             raise LucamError(self)
         return result.value
 
     def GetCameraId(self):
         """Return camera model ID, one of CAMERA_MODEL keys."""
         result = API.ULONG()
-        if not API.LucamGetCameraId(self._handle, result):
+        if not self._api.LucamGetCameraId(self._handle, result):
             raise LucamError(self)
         return result.value
 
     def EnumAvailableFrameRates(self):
         """Return available frame rates based on camera's clock rates."""
         result = API.FLOAT()
-        size = API.LucamEnumAvailableFrameRates(self._handle, 0, result)
+        size = self._api.LucamEnumAvailableFrameRates(self._handle, 0, result)
         result = (API.FLOAT * size)()
-        if not API.LucamEnumAvailableFrameRates(self._handle, size, result):
+        if not self._api.LucamEnumAvailableFrameRates(self._handle,
+                                                      size, result):
             raise LucamError(self)
         return tuple(result)
 
     def QueryDisplayFrameRate(self):
         """Return average displayed frame rate since preview started."""
         result = API.FLOAT()
-        if not API.LucamQueryDisplayFrameRate(self._handle, result):
+        if not self._api.LucamQueryDisplayFrameRate(self._handle, result):
             raise LucamError(self)
         return result.value
 
     def DisplayPropertyPage(self, parent):
         """Open a DirectShow dialog window with camera properties."""
-        if not API.LucamDisplayPropertyPage(self._handle, parent):
+        if not self._api.LucamDisplayPropertyPage(self._handle, parent):
             raise LucamError(self)
 
     def DisplayVideoFormatPage(self, parent):
         """Open a DirectShow dialog window with video properties."""
-        if not API.LucamDisplayVideoFormatPage(self._handle, parent):
+        if not self._api.LucamDisplayVideoFormatPage(self._handle, parent):
             raise LucamError(self)
 
     def CreateDisplayWindow(self, title=b"", style=282001408,
@@ -880,14 +1280,14 @@ class Lucam(object):
         The window is not automatically resized to the video frame size.
 
         """
-        if not API.LucamCreateDisplayWindow(
+        if not self._api.LucamCreateDisplayWindow(
                 self._handle, title, style, x, y, width, height, parent, menu):
             raise LucamError(self)
         self._displaying_window = True
 
     def DestroyDisplayWindow(self):
         """Destroy display window created with CreateDisplayWindow()."""
-        if not API.LucamDestroyDisplayWindow(self._handle):
+        if not self._api.LucamDestroyDisplayWindow(self._handle):
             raise LucamError(self)
         self._displaying_window = False
 
@@ -906,15 +1306,15 @@ class Lucam(object):
             Extent of scaled video stream in pixels. Can be used to zoom.
 
         """
-        if not API.LucamAdjustDisplayWindow(self._handle, title,
-                                            x, y, width, height):
+        if not self._api.LucamAdjustDisplayWindow(self._handle, title,
+                                                  x, y, width, height):
             raise LucamError(self)
 #        self._displaying_window = True #rwb27 commented this out as it's wrong when used to adjust a window I create...
 
     def GetTruePixelDepth(self):
         """Return actual pixel depth when running in 16 bit mode."""
         result = API.ULONG()
-        if not API.LucamGetTruePixelDepth(self._handle, result):
+        if not self._api.LucamGetTruePixelDepth(self._handle, result):
             raise LucamError(self)
         return result.value
 
@@ -928,7 +1328,7 @@ class Lucam(object):
 
         """
         result = API.LUCAM_IMAGE_FORMAT()
-        if not API.LucamGetVideoImageFormat(self._handle, result):
+        if not self._api.LucamGetVideoImageFormat(self._handle, result):
             raise LucamError(self)
         return result
 
@@ -938,7 +1338,7 @@ class Lucam(object):
         Error codes and messages can be found in LucamError.CODES.
 
         """
-        return API.LucamGetLastErrorForCamera(self._handle)
+        return self._api.LucamGetLastErrorForCamera(self._handle)
 
     def SetProperty(self, prop, value, flags=0):
         """Set value of camera property.
@@ -960,8 +1360,17 @@ class Lucam(object):
             flags, flagseq = 0x0, flags
             for f in flagseq:
                 flags |= Lucam.PROP_FLAG[f]
-        if not API.LucamSetProperty(self._handle, prop, value, flags):
+        if not self._api.LucamSetProperty(self._handle, prop, value, flags):
             raise LucamError(self)
+        if self.property_cache is not None:
+            self.property_cache.set(prop, float(value), flags)
+        if self._snapshot is not None:
+            if flags & API.LUCAM_PROP_FLAG_AUTO:
+                self._invalidate_properties(prop)
+            elif prop == API.LUCAM_PROP_EXPOSURE:
+                self._snapshot.exposure = value
+            elif prop == API.LUCAM_PROP_GAIN:
+                self._snapshot.gain = value
 
     def GetProperty(self, prop):
         """Return value and capability flag of camera property.
@@ -971,12 +1380,22 @@ class Lucam(object):
         prop : int or str
             Camera property. One of Lucam.PROPERTY keys or values.
 
+        If the property cache is enabled, the value may be served from
+        memory, see enable_property_cache().
+
         """
+        prop = Lucam.PROPERTY.get(prop, prop)
+        cache = self.property_cache
+        if cache is not None:
+            result = cache.get(prop)
+            if result is not None:
+                return result
         value = API.FLOAT()
         flags = API.LONG()
-        prop = Lucam.PROPERTY.get(prop, prop)
-        if not API.LucamGetProperty(self._handle, prop, value, flags):
+        if not self._api.LucamGetProperty(self._handle, prop, value, flags):
             raise LucamError(self)
+        if cache is not None:
+            cache.set(prop, value.value, flags.value)
         return value.value, flags.value
 
     def PropertyRange(self, prop):
@@ -994,21 +1413,27 @@ class Lucam(object):
         default = API.FLOAT()
         flags = API.LONG()
         prop = Lucam.PROPERTY.get(prop, prop)
-        if not API.LucamPropertyRange(self._handle, prop, mn, mx,
-                                      default, flags):
+        if not self._api.LucamPropertyRange(self._handle, prop, mn, mx,
+                                            default, flags):
             raise LucamError(self)
         return mn.value, mx.value, default.value, flags.value
 
-    def GetFormat(self):
+    def GetFormat(self, cached=False):
         """Return frame format and rate of video data.
 
         Return type is tuple of API.LUCAM_FRAME_FORMAT and framerate.
 
+        If cached is True, the values last read from the camera are returned
+        unless SetFormat() or CameraReset() were called since.
+
         """
+        if cached and self._format is not None:
+            return copy.copy(self._format[0]), self._format[1]
         frameformat = API.LUCAM_FRAME_FORMAT()
         framerate = API.FLOAT()
-        if not API.LucamGetFormat(self._handle, frameformat, framerate):
+        if not self._api.LucamGetFormat(self._handle, frameformat, framerate):
             raise LucamError(self)
+        self._format = copy.copy(frameformat), framerate.value
         return frameformat, framerate.value
 
     def SetFormat(self, frameformat, framerate):
@@ -1025,8 +1450,13 @@ class Lucam(object):
         must be evenly divisible by 8.
 
         """
-        if not API.LucamSetFormat(self._handle, frameformat, framerate):
+        if not self._api.LucamSetFormat(self._handle, frameformat, framerate):
             raise LucamError(self)
+        self.frame_pool.clear()
+        self._conversion_plans.clear()
+        self._format = None
+        if self._snapshot is not None:
+            self._snapshot.format = frameformat
         if self._fastframe:
             self._fastframe = frameformat
         if self._streaming:
@@ -1044,7 +1474,8 @@ class Lucam(object):
 
         """
         result = (API.LONG * numreg)()
-        if not API.LucamReadRegister(self._handle, address, numreg, result):
+        if not self._api.LucamReadRegister(self._handle,
+                                           address, numreg, result):
             raise LucamError(self)
         return [v.value for v in result]
 
@@ -1063,7 +1494,8 @@ class Lucam(object):
         pvalue = (API.LONG * numreg)()
         for i in range(numreg):
             pvalue[i] = values[i]
-        if not API.LucamWriteRegister(self._handle, address, numreg, pvalue):
+        if not self._api.LucamWriteRegister(self._handle,
+                                            address, numreg, pvalue):
             raise LucamError(self)
 
     def SetTimeout(self, still, timeout):
@@ -1078,7 +1510,7 @@ class Lucam(object):
             function.
 
         """
-        if not API.LucamSetTimeout(self._handle, still, timeout):
+        if not self._api.LucamSetTimeout(self._handle, still, timeout):
             raise LucamError(self)
 
     def SetTriggerMode(self, usehwtrigger):
@@ -1090,7 +1522,7 @@ class Lucam(object):
             If True, the camera is set to use the hardware trigger.
 
         """
-        if not API.LucamSetTriggerMode(self._handle, usehwtrigger):
+        if not self._api.LucamSetTriggerMode(self._handle, usehwtrigger):
             raise LucamError(self)
 
     def TriggerFastFrame(self):
@@ -1101,7 +1533,7 @@ class Lucam(object):
         TakeFastFrame() or TakeFastFrameNoTrigger() to take the snapshot.
 
         """
-        if not API.LucamTriggerFastFrame(self._handle):
+        if not self._api.LucamTriggerFastFrame(self._handle):
             raise LucamError(self)
 
     def CancelTakeFastFrame(self):
@@ -1112,7 +1544,7 @@ class Lucam(object):
         function will raise LucamError(48).
 
         """
-        if not API.LucamCancelTakeFastFrame(self._handle):
+        if not self._api.LucamCancelTakeFastFrame(self._handle):
             raise LucamError(self)
 
     def EnableFastFrames(self, snapshot=None):
@@ -1122,7 +1554,7 @@ class Lucam(object):
         ----------
         snapshot : API.LUCAM_SNAPSHOT or None
             Settings to use for the snapshot. If None (default),
-            settings returned by default_snapshot() will be used.
+            the cached settings of snapshot_settings() will be used.
 
         If video is streaming when a snapshot is taken, the stream will
         automatically be stopped (pausing video in the display window if
@@ -1131,9 +1563,9 @@ class Lucam(object):
 
         """
         if snapshot is None:
-            snapshot = self.default_snapshot()
-        self._fastframe = snapshot.format
-        if not API.LucamEnableFastFrames(self._handle, snapshot):
+            snapshot = self.snapshot_settings()
+        self._fastframe = copy.copy(snapshot.format)
+        if not self._api.LucamEnableFastFrames(self._handle, snapshot):
             self._fastframe = None
             raise LucamError(self)
 
@@ -1153,8 +1585,9 @@ class Lucam(object):
         The camera should be in Fast Frames mode using EnableFastFrames().
 
         """
-        data, pdata = ndarray(self._fastframe, self._byteorder, out, validate)
-        if not API.LucamTakeFastFrame(self._handle, pdata):
+        data, pdata = ndarray(self._fastframe, self._byteorder, out, validate,
+                              pool=self.frame_pool)
+        if not self._api.LucamTakeFastFrame(self._handle, pdata):
             raise LucamError(self)
         if out is None:
             return data
@@ -1175,8 +1608,9 @@ class Lucam(object):
         Return a snapshot frame without waiting for the next HW trigger.
 
         """
-        data, pdata = ndarray(self._fastframe, self._byteorder, out, validate)
-        if not API.LucamForceTakeFastFrame(self._handle, pdata):
+        data, pdata = ndarray(self._fastframe, self._byteorder, out, validate,
+                              pool=self.frame_pool)
+        if not self._api.LucamForceTakeFastFrame(self._handle, pdata):
             raise LucamError(self)
         if out is None:
             return data
@@ -1202,8 +1636,8 @@ class Lucam(object):
 
         """
         data, pdata = ndarray(self._fastframe, self._byteorder,
-                              out, validate)
-        if not API.LucamTakeFastFrameNoTrigger(self._handle, pdata):
+                              out, validate, pool=self.frame_pool)
+        if not self._api.LucamTakeFastFrameNoTrigger(self._handle, pdata):
             raise LucamError(self)
         if out is None:
             return data
@@ -1216,9 +1650,52 @@ class Lucam(object):
 
         """
         self._fastframe = None
-        if not API.LucamDisableFastFrames(self._handle):
+        if not self._api.LucamDisableFastFrames(self._handle):
             raise LucamError(self)
 
+    def fast_frames(self, snapshot=None, numframes=None, take='wait',
+                    hw_trigger=False, prefetch=True):
+        """Return context manager iterating over frames in Fast Frames mode.
+
+        Fast Frames mode is enabled once on entering the context and
+        frames are taken into two alternating buffers. A frame is valid
+        until the next frame is requested.
+
+        Parameters
+        ----------
+        snapshot : API.LUCAM_SNAPSHOT or None
+            Settings to use for the snapshots. If None (default),
+            the cached settings of snapshot_settings() will be used.
+        numframes : int or None
+            Number of frames to iterate over. If None, iterate until the
+            context is exited.
+        take : str
+            One of FastFrames.TAKE keys:
+                'wait'
+                    TakeFastFrame, waits for the next frame or HW trigger.
+                'force'
+                    ForceTakeFastFrame, SW trigger in HW triggered mode.
+                'no_trigger'
+                    TakeFastFrameNoTrigger, returns last HW triggered frame.
+        hw_trigger : bool
+            If True, enable the hardware trigger input in the snapshot
+            settings.
+        prefetch : bool
+            If True (default), the next frame is taken in a background
+            thread while the current frame is processed.
+
+        Examples
+        --------
+        >>> with camera.fast_frames(numframes=100) as frames:
+        ...     for frame in frames:
+        ...         total = frame.sum()
+        >>> frames.fps > 0
+        True
+
+        """
+        return FastFrames(self, snapshot, numframes, take, hw_trigger,
+                          prefetch)
+
     def TakeSnapshot(self, snapshot=None, out=None, validate=True):
         """Return single image as numpy array using still imaging.
 
@@ -1226,7 +1703,7 @@ class Lucam(object):
         ----------
         snapshot : API.LUCAM_SNAPSHOT or None
             Settings to use for the snapshot. If None (default),
-            settings returned by default_snapshot() will be used.
+            the cached settings of snapshot_settings() will be used.
         out : numpy array, or None
             Output buffer. If None, a new numpy.array containing the image
             data is returned. Else image data will be copied into the
@@ -1237,9 +1714,10 @@ class Lucam(object):
 
         """
         if snapshot is None:
-            snapshot = self.default_snapshot()
-        data, pdata = ndarray(snapshot.format, self._byteorder, out, validate)
-        if not API.LucamTakeSnapshot(self._handle, snapshot, pdata):
+            snapshot = self.snapshot_settings()
+        data, pdata = ndarray(snapshot.format, self._byteorder, out, validate,
+                              pool=self.frame_pool)
+        if not self._api.LucamTakeSnapshot(self._handle, snapshot, pdata):
             raise LucamError(self)
         if out is None:
             return data
@@ -1270,8 +1748,8 @@ class Lucam(object):
             (4, 1): API.LUCAM_PF_32,
             (2, 2): API.LUCAM_PF_16,
             (3, 2): API.LUCAM_PF_48}[(data.ndim, data.dtype.itemsize)]
-        if not API.LucamSaveImageWEx(self._handle, width, height,
-                                     pixelformat, pdata, filename):
+        if not self._api.LucamSaveImageWEx(self._handle, width, height,
+                                           pixelformat, pdata, filename):
             raise LucamError(self)
 
     def StreamVideoControl(self, ctrltype, window=0):
@@ -1297,7 +1775,8 @@ class Lucam(object):
             self._streaming = self.GetFormat()[0]
         else:
             self._streaming = None
-        if not API.LucamStreamVideoControl(self._handle, ctrltype, window):
+        if not self._api.LucamStreamVideoControl(self._handle,
+                                                 ctrltype, window):
             self._streaming = None
             raise LucamError(self)
 
@@ -1321,10 +1800,10 @@ class Lucam(object):
 
         """
         data, pdata = ndarray(self._streaming, self._byteorder, out,
-                              validate, numframes)
+                              validate, numframes, pool=self.frame_pool)
         if numframes is None:
             numframes = data.shape[0]
-        if not API.LucamTakeVideo(self._handle, numframes, pdata):
+        if not self._api.LucamTakeVideo(self._handle, numframes, pdata):
             raise LucamError(self)
         if out is None:
             return data
@@ -1343,7 +1822,7 @@ class Lucam(object):
         The cancelled function will raise LucamError(48).
 
         """
-        if not API.LucamCancelTakeVideo(self._handle):
+        if not self._api.LucamCancelTakeVideo(self._handle):
             raise LucamError(self)
 
     def StreamVideoControlAVI(self, ctrltype, filename='', window=0):
@@ -1370,8 +1849,8 @@ class Lucam(object):
 
         """
         ctrltype = Lucam.VIDEO_CONTROL.get(ctrltype, ctrltype)
-        if not API.LucamStreamVideoControlAVI(self._handle, ctrltype,
-                                              filename, window):
+        if not self._api.LucamStreamVideoControlAVI(self._handle, ctrltype,
+                                                    filename, window):
             raise LucamError(self)
 
     def ConvertRawAVIToStdVideo(self, outfile, inputfile, outtype=1):
@@ -1388,52 +1867,127 @@ class Lucam(object):
 
         """
         outtype = Lucam.AVI_TYPE.get(outtype, outtype)
-        if not API.LucamConvertRawAVIToStdVideo(self._handle, outfile,
-                                                inputfile, outtype):
+        if not self._api.LucamConvertRawAVIToStdVideo(self._handle, outfile,
+                                                      inputfile, outtype):
             raise LucamError(self)
 
-    def ConvertFrameToRgb24(self, frameformat, source_frame_pointer, conversion_params=None):
-        """Return RGB24 image from raw Bayer data."""
+    def ConvertFrameToRgb24(self, frameformat, source_frame_pointer,
+                            conversion_params=None, out=None):
+        """Return RGB24 image from raw Bayer data.
+
+        Parameters
+        ----------
+        frameformat : API.LUCAM_FRAME_FORMAT
+            Frame format of the raw data.
+        source_frame_pointer : ctypes pointer or numpy array
+            Raw Bayer data.
+        conversion_params : API.LUCAM_CONVERSION or None
+            Demosaic method and color correction matrix.
+            If None, fast demosaicing and no color correction is used.
+        out : numpy array, or None
+            If None, a new array is taken from the frame pool.
+
+        The returned image is in BGR order. The structures and dimensions
+        used for the conversion are cached, see conversion_plan().
+
         """
-        LucamConvertFrameToRgb24 = (
-        BOOL, HANDLE, pUCHAR_RGB, pBYTE, ULONG, ULONG, ULONG,
-        pLUCAM_CONVERSION)
-    LucamConvertFrameToRgb32 = (
-        BOOL, HANDLE, pBYTE, pBYTE, ULONG, ULONG, ULONG, pLUCAM_CONVERSION)
-    LucamConvertFrameToRgb48 = (
-        BOOL, HANDLE, pUSHORT, pUSHORT, ULONG, ULONG, ULONG, pLUCAM_CONVERSION)
-    LucamConvertFrameToGreyscale8 = (
-        BOOL, HANDLE, pBYTE, pBYTE, ULONG, ULONG, ULONG, pLUCAM_CONVERSION)
-    LucamConvertFrameToGreyscale16 = (
-        BOOL, HANDLE, pUSHORT, pUSHORT, ULONG, ULONG, ULONG, pLUCAM_CONVERSION)"""
-        if conversion_params is None:
-                conversion_params = self.default_conversion()
-                conversion_params.DemosaicMethod = API.LUCAM_DM_FAST #need to think about defaults
-        f = frameformat
-        outputformat = copy.copy(frameformat)
-        outputformat.pixelFormat = API.LUCAM_PF_24 #need to modify the frame format for the output
-        dest, pDest = ndarray(outputformat)
-        w, h = f.width // (f.binningX * f.subSampleX), f.height // (f.binningY * f.subSampleY)
-        if not API.LucamConvertFrameToRgb24(self._handle, dest, source_frame_pointer, 
-                                            w, h, frameformat.pixelFormat, conversion_params):
-            raise LucamError(self)
-        return dest
-
-    def ConvertFrameToRgb32(self):
-        """Return RGB32 image from raw Bayer data."""
-        raise NotImplementedError()
+        return self._convert_frame('rgb24', frameformat, source_frame_pointer,
+                                   conversion_params, out)
 
-    def ConvertFrameToRgb48(self):
-        """Return RGB48 image from raw Bayer data."""
-        raise NotImplementedError()
+    def ConvertFrameToRgb32(self, frameformat, source_frame_pointer,
+                            conversion_params=None, out=None):
+        """Return RGB32 image from raw Bayer data.
 
-    def ConvertFrameToGreyscale8(self, data, out=None, settings=None):
-        """Return 8 bit grayscale image from raw Bayer data."""
-        raise NotImplementedError()
+        The returned image is in BGRA order.
+        See ConvertFrameToRgb24() for parameters.
 
-    def ConvertFrameToGreyscale16(self, data, out=None, settings=None):
-        """Return 16 bit grayscale image from raw Bayer data."""
-        raise NotImplementedError()
+        """
+        return self._convert_frame('rgb32', frameformat, source_frame_pointer,
+                                   conversion_params, out)
+
+    def ConvertFrameToRgb48(self, frameformat, source_frame_pointer,
+                            conversion_params=None, out=None):
+        """Return RGB48 image from raw Bayer data.
+
+        The returned image is in BGR order with 16 bit samples.
+        See ConvertFrameToRgb24() for parameters.
+
+        """
+        return self._convert_frame('rgb48', frameformat, source_frame_pointer,
+                                   conversion_params, out)
+
+    def ConvertFrameToGreyscale8(self, frameformat, source_frame_pointer,
+                                 conversion_params=None, out=None):
+        """Return 8 bit grayscale image from raw Bayer data.
+
+        See ConvertFrameToRgb24() for parameters.
+
+        """
+        return self._convert_frame('grey8', frameformat, source_frame_pointer,
+                                   conversion_params, out)
+
+    def ConvertFrameToGreyscale16(self, frameformat, source_frame_pointer,
+                                  conversion_params=None, out=None):
+        """Return 16 bit grayscale image from raw Bayer data.
+
+        See ConvertFrameToRgb24() for parameters.
+
+        """
+        return self._convert_frame('grey16', frameformat,
+                                   source_frame_pointer, conversion_params,
+                                   out)
+
+    def _convert_frame(self, output, frameformat, source, conversion, out):
+        """Convert raw frame using cached conversion plan."""
+        plan = self.conversion_plan(frameformat, conversion, output)
+        if out is None:
+            out = self.frame_pool.acquire(
+                (output, bytes(plan.frameformat), bytes(plan.conversion)),
+                plan.shape, plan.dtype)
+        return plan(source, out)
+
+    def conversion_plan(self, frameformat=None, conversion=None,
+                        output='rgb24', demosaic='fast', matrix='none',
+                        engine='auto'):
+        """Return cached ConversionPlan for frame format and conversion.
+
+        Parameters
+        ----------
+        frameformat : API.LUCAM_FRAME_FORMAT or None
+            Frame format of raw data. If None, the current format is used.
+        conversion : API.LUCAM_CONVERSION or None
+            Conversion settings. If None, a structure is built from
+            demosaic and matrix.
+        output : str
+            Output format. One of ConversionPlan.OUTPUT.
+        demosaic : str or int
+            Demosaic method. One of Lucam.DEMOSAIC_METHOD.
+        matrix : str or int
+            Color correction matrix. One of Lucam.CORRECT_MATRIX.
+        engine : str
+            'dll', 'numpy', or 'auto'. See ConversionPlan.
+
+        Plans are discarded by SetFormat() and CameraReset().
+
+        """
+        if frameformat is None:
+            current = self._format
+            if current is None:
+                current = self.GetFormat()
+            frameformat = current[0]
+        if conversion is None:
+            conversion = API.LUCAM_CONVERSION(
+                DemosaicMethod=Lucam.DEMOSAIC_METHOD.get(demosaic, demosaic),
+                CorrectionMatrix=Lucam.CORRECT_MATRIX.get(matrix, matrix))
+        key = (output, bytes(frameformat), bytes(conversion), engine)
+        try:
+            return self._conversion_plans[key]
+        except KeyError:
+            pass
+        plan = ConversionPlan(self, frameformat, conversion, output,
+                              engine=engine)
+        self._conversion_plans[key] = plan
+        return plan
 
     def Setup8bitsLUT(self, lut):
         """Populate 8 bit LUT inside camera.
@@ -1444,7 +1998,7 @@ class Lucam(object):
 
         """
         lut = numpy.array(lut if lut else [], numpy.uint8)
-        if not API.LucamSetup8bitsLUT(self._handle, lut, lut.size):
+        if not self._api.LucamSetup8bitsLUT(self._handle, lut, lut.size):
             raise LucamError(self)
 
     def Setup8bitsColorLUT(self, lut, red=False, green1=False,
@@ -1461,8 +2015,8 @@ class Lucam(object):
 
         """
         lut = numpy.array(lut if lut else [], numpy.uint8)
-        if not API.LucamSetup8bitsColorLUT(self._handle, lut, lut.size,
-                                           red, green1, green2, blue):
+        if not self._api.LucamSetup8bitsColorLUT(self._handle, lut, lut.size,
+                                                 red, green1, green2, blue):
             raise LucamError(self)
 
     def SetupCustomMatrix(self, matrix):
@@ -1480,13 +2034,13 @@ class Lucam(object):
 
         """
         matrix = numpy.array(matrix, numpy.float32, copy=False)
-        if not API.LucamSetupCustomMatrix(self._handle, matrix):
+        if not self._api.LucamSetupCustomMatrix(self._handle, matrix):
             raise LucamError(self)
 
     def GetCurrentMatrix(self):
         """Return current color correction matrix."""
         matrix = numpy.empty((3, 3), numpy.float32)
-        if not API.LucamGetCurrentMatrix(self._handle, matrix):
+        if not self._api.LucamGetCurrentMatrix(self._handle, matrix):
             raise LucamError(self)
         return matrix
 
@@ -1509,8 +2063,8 @@ class Lucam(object):
         callback = API.VideoFilterCallback(callback)
         if context is not None:
             context = ctypes.py_object(context)
-        callbackid = API.LucamAddStreamingCallback(self._handle,
-                                                   callback, context)
+        callbackid = self._api.LucamAddStreamingCallback(self._handle,
+                                                         callback, context)
         if callbackid == -1:
             raise LucamError(self)
         self._callbacks[(API.VideoFilterCallback, callbackid)] = callback
@@ -1535,7 +2089,8 @@ class Lucam(object):
             AddStreamingCallback().
 
         """
-        if not API.LucamRemoveStreamingCallback(self._handle, callbackid):
+        if not self._api.LucamRemoveStreamingCallback(self._handle,
+                                                      callbackid):
             raise LucamError(self)
         del self._callbacks[(API.VideoFilterCallback, callbackid)]
 
@@ -1555,8 +2110,8 @@ class Lucam(object):
         callback = API.SnapshotCallback(callback)
         if context is not None:
             context = ctypes.py_object(context)
-        callbackid = API.LucamAddSnapshotCallback(self._handle,
-                                                  callback, context)
+        callbackid = self._api.LucamAddSnapshotCallback(self._handle,
+                                                        callback, context)
         if callbackid == -1:
             raise LucamError(self)
         self._callbacks[(API.SnapshotCallback, callbackid)] = callback
@@ -1572,7 +2127,7 @@ class Lucam(object):
             AddSnapshotCallback().
 
         """
-        if not API.LucamRemoveSnapshotCallback(self._handle, callbackid):
+        if not self._api.LucamRemoveSnapshotCallback(self._handle, callbackid):
             raise LucamError(self)
         del self._callbacks[(API.SnapshotCallback, callbackid)]
 
@@ -1597,8 +2152,8 @@ class Lucam(object):
         pixelformat = Lucam.PIXEL_FORMAT.get(pixelformat, pixelformat)
         if context is not None:
             context = ctypes.py_object(context)
-        callbackid = API.LucamAddRgbPreviewCallback(self._handle, callback,
-                                                    context, pixelformat)
+        callbackid = self._api.LucamAddRgbPreviewCallback(
+            self._handle, callback, context, pixelformat)
         if callbackid == -1:
             raise LucamError(self)
         self._callbacks[(API.RgbVideoFilterCallback, callbackid)] = callback
@@ -1614,14 +2169,16 @@ class Lucam(object):
             AddRgbPreviewCallback().
 
         """
-        if not API.LucamRemoveRgbPreviewCallback(self._handle, callbackid):
+        if not self._api.LucamRemoveRgbPreviewCallback(self._handle,
+                                                       callbackid):
             raise LucamError(self)
         del self._callbacks[(API.RgbVideoFilterCallback, callbackid)]
 
     def QueryRgbPreviewPixelFormat(self):
         """Return pixel format for preview window."""
         pixelformat = API.ULONG()
-        if not API.LucamQueryRgbPreviewPixelFormat(self._handle, pixelformat):
+        if not self._api.LucamQueryRgbPreviewPixelFormat(self._handle,
+                                                         pixelformat):
             raise LucamError(self)
         return pixelformat.value
 
@@ -1636,9 +2193,10 @@ class Lucam(object):
             Window coordinates after any subsampling or binning.
 
         """
-        if not API.LucamOneShotAutoExposure(self._handle, target,
-                                            startx, starty, width, height):
+        if not self._api.LucamOneShotAutoExposure(
+                self._handle, target, startx, starty, width, height):
             raise LucamError(self)
+        self._invalidate_properties('exposure', 'gain')
 
     def OneShotAutoWhiteBalance(self, startx, starty, width, height):
         """Perform one iteration of analog gain adjustment.
@@ -1652,9 +2210,11 @@ class Lucam(object):
         in order to color balance the image.
 
         """
-        if not API.LucamOneShotAutoWhiteBalance(self._handle,
-                                                startx, starty, width, height):
+        if not self._api.LucamOneShotAutoWhiteBalance(
+                self._handle, startx, starty, width, height):
             raise LucamError(self)
+        self._invalidate_properties(
+            'gain_red', 'gain_blue', 'gain_green1', 'gain_green2')
 
     def OneShotAutoWhiteBalanceEx(self, redovergreen, blueovergreen,
                                   startx, starty, width, height):
@@ -1672,10 +2232,12 @@ class Lucam(object):
         in order to color balance the image to a specific target color.
 
         """
-        if not API.LucamOneShotAutoWhiteBalanceEx(
+        if not self._api.LucamOneShotAutoWhiteBalanceEx(
                 self._handle, redovergreen, blueovergreen,
                 startx, starty, width, height):
             raise LucamError(self)
+        self._invalidate_properties(
+            'gain_red', 'gain_blue', 'gain_green1', 'gain_green2')
 
     def DigitalWhiteBalance(self, startx, starty, width, height):
         """Perform one iteration of digital color gain adjustment.
@@ -1689,9 +2251,11 @@ class Lucam(object):
         in order to color balance the image.
 
         """
-        if not API.LucamDigitalWhiteBalance(self._handle,
-                                            startx, starty, width, height):
+        if not self._api.LucamDigitalWhiteBalance(
+                self._handle, startx, starty, width, height):
             raise LucamError(self)
+        self._invalidate_properties(
+            'digital_gain_red', 'digital_gain_green', 'digital_gain_blue')
 
     def LucamDigitalWhiteBalanceEx(self, redovergreen, blueovergreen,
                                    startx, starty, width, height):
@@ -1709,10 +2273,12 @@ class Lucam(object):
         in order to color balance the image to a specific target color.
 
         """
-        if not API.LucamDigitalWhiteBalanceEx(
+        if not self._api.LucamDigitalWhiteBalanceEx(
                 self._handle, redovergreen, blueovergreen,
                 startx, starty, width, height):
             raise LucamError(self)
+        self._invalidate_properties(
+            'digital_gain_red', 'digital_gain_green', 'digital_gain_blue')
 
     def AdjustWhiteBalanceFromSnapshot(self, snapshot, data, redovergreen,
                                        blueovergreen, startx, starty,
@@ -1737,10 +2303,12 @@ class Lucam(object):
 
         """
         pdata = data.ctypes.data_as(API.pBYTE)
-        if not API.LucamAdjustWhiteBalanceFromSnapshot(
+        if not self._api.LucamAdjustWhiteBalanceFromSnapshot(
                 self._handle, snapshot, pdata, redovergreen, blueovergreen,
                 startx, starty, width, height):
             raise LucamError(self)
+        self._invalidate_properties(
+            'digital_gain_red', 'digital_gain_green', 'digital_gain_blue')
 
     def OneShotAutoIris(self, target, startx, starty, width, height):
         """Perform one iteration of iris adjustment to reach target brightness.
@@ -1753,22 +2321,32 @@ class Lucam(object):
             Window coordinates after any subsampling or binning.
 
         """
-        if not API.LucamOneShotAutoIris(self._handle, target,
-                                        startx, starty, width, height):
+        if not self._api.LucamOneShotAutoIris(
+                self._handle, target, startx, starty, width, height):
             raise LucamError(self)
+        self._invalidate_properties('exposure', 'gain')
 
     def ContinuousAutoExposureEnable(self, target, startx, starty,
                                      width, height, lightingperiod):
         """Undocumented function."""
-        if not API.LucamContinuousAutoExposureEnable(
+        if not self._api.LucamContinuousAutoExposureEnable(
                 self._handle, target, startx, starty,
                 width, height, lightingperiod):
             raise LucamError(self)
+        self._auto_exposure = True
+        if self.property_cache is not None:
+            self.property_cache.exclude.update(
+                (API.LUCAM_PROP_EXPOSURE, API.LUCAM_PROP_GAIN))
+            self.property_cache.invalidate('exposure', 'gain')
 
     def ContinuousAutoExposureDisable(self):
         """Undocumented function."""
-        if not API.LucamContinuousAutoExposureDisable(self._handle):
+        if not self._api.LucamContinuousAutoExposureDisable(self._handle):
             raise LucamError(self)
+        self._auto_exposure = False
+        if self.property_cache is not None:
+            self.property_cache.exclude.difference_update(
+                (API.LUCAM_PROP_EXPOSURE, API.LUCAM_PROP_GAIN))
 
     def LucamAutoFocusStart(self, startx, starty, width, height,
                             callback=None, context=None):
@@ -1789,10 +2367,11 @@ class Lucam(object):
         callback = API.ProgressCallback(callback if callback else 0)
         if context is not None:
             context = ctypes.py_object(context)
-        if not API.LucamAutoFocusStart(self._handle, startx, starty,
-                                       width, height, 0., 0., 0.,
-                                       callback, context):
+        if not self._api.LucamAutoFocusStart(self._handle, startx, starty,
+                                             width, height, 0., 0., 0.,
+                                             callback, context):
             raise LucamError(self)
+        self._invalidate_properties('focus', 'iris')
         self._callbacks[API.ProgressCallback] = callback
 
     def LucamAutoFocusWait(self, timeout):
@@ -1805,12 +2384,13 @@ class Lucam(object):
             if the proper focus value is not found.
 
         """
-        if not API.LucamAutoFocusWait(self._handle, timeout):
+        if not self._api.LucamAutoFocusWait(self._handle, timeout):
             raise LucamError(self)
+        self._invalidate_properties('focus', 'iris')
 
     def LucamAutoFocusStop(self):
         """Stop auto focus calibration prematurely."""
-        if not API.LucamAutoFocusStop(self._handle):
+        if not self._api.LucamAutoFocusStop(self._handle):
             raise LucamError(self)
 
     def AutoFocusQueryProgress(self):
@@ -1820,7 +2400,8 @@ class Lucam(object):
 
         """
         percentcomplete = API.FLOAT()
-        if not API.LucamAutoFocusQueryProgress(self._handle, percentcomplete):
+        if not self._api.LucamAutoFocusQueryProgress(self._handle,
+                                                     percentcomplete):
             raise LucamError(self)
         return percentcomplete.value
 
@@ -1833,8 +2414,9 @@ class Lucam(object):
             If True, force a recalibration of lens parameters.
 
         """
-        if not API.LucamInitAutoLens(self._handle):
+        if not self._api.LucamInitAutoLens(self._handle):
             raise LucamError(self)
+        self._invalidate_properties('focus', 'iris')
 
     def PermanentBufferRead(self, offset=0, size=2048):
         """Return data read from user-defined non-volatile memory.
@@ -1845,7 +2427,8 @@ class Lucam(object):
         assert 0 <= (size - offset) <= 2048
         data = numpy.zeros((size,), numpy.uint8)
         pdata = data.ctypes.data_as(API.pUCHAR)
-        if not API.LucamPermanentBufferRead(self._handle, pdata, offset, size):
+        if not self._api.LucamPermanentBufferRead(self._handle,
+                                                  pdata, offset, size):
             raise LucamError(self)
         return data
 
@@ -1860,8 +2443,8 @@ class Lucam(object):
         pdata = data.ctypes.data_as(API.pUCHAR)
         size = data.size
         assert 0 <= (size - offset) <= 2048
-        if not API.LucamPermanentBufferWrite(self._handle, pdata,
-                                             offset, size):
+        if not self._api.LucamPermanentBufferWrite(self._handle, pdata,
+                                                   offset, size):
             raise LucamError(self)
 
     def GpioRead(self):
@@ -1872,7 +2455,7 @@ class Lucam(object):
         """
         gpo = API.BYTE()
         gpi = API.BYTE()
-        if not API.LucamGpioRead(self._handle, gpo, gpi):
+        if not self._api.LucamGpioRead(self._handle, gpo, gpi):
             raise LucamError(self)
         return gpo.value, gpi.value
 
@@ -1885,7 +2468,7 @@ class Lucam(object):
             Value of the output bits of the register.
 
         """
-        if not API.LucamGpioWrite(self._handle, gpovalues):
+        if not self._api.LucamGpioWrite(self._handle, gpovalues):
             raise LucamError(self)
 
     def GpoSelect(self, gpoenable):
@@ -1895,7 +2478,7 @@ class Lucam(object):
             Bit flags used to enable/disable alternate functionality.
 
         """
-        if not API.LucamGpoSelect(self._handle, gpoenable):
+        if not self._api.LucamGpoSelect(self._handle, gpoenable):
             raise LucamError(self)
 
     def GpioConfigure(self, enableoutput):
@@ -1911,7 +2494,7 @@ class Lucam(object):
         This function is only available on Lm-based cameras.
 
         """
-        if not API.LucamGpioConfigure(self._handle, enableoutput):
+        if not self._api.LucamGpioConfigure(self._handle, enableoutput):
             raise LucamError(self)
 
     def Rs232Transmit(self):
@@ -2219,19 +2802,20 @@ class LucamSynchronousSnapshots(object):
         Parameters
         ----------
         cameras : sequence of Lucam instances, or None.
-            If None (default), snapshots are taken from all connected cameras.
+            If None (default), snapshots are taken from all connected cameras,
+            which are opened concurrently.
         settings : sequence of API.LUCAM_SNAPSHOT, or None
-            Settings to use for the snapshot. If None (default), the settings
-            returned by Lucam.default_snapshot() will be used for each camera.
+            Settings to use for the snapshot. If None (default), copies of
+            the cached Lucam.snapshot_settings() are used for each camera.
 
         """
         if cameras is None:
-            cameras = [Lucam(i + 1) for i in range(len(LucamEnumCameras()))]
+            cameras = open_cameras()
         numcams = len(cameras)
         phcameras = (API.HANDLE * numcams)()
         ppsettings = (API.pLUCAM_SNAPSHOT * numcams)()
         if settings is None:
-            settings = [cam.default_snapshot() for cam in cameras]
+            settings = [copy.copy(cam.snapshot_settings()) for cam in cameras]
         for i in range(numcams):
             phcameras[i] = cameras[i]._handle
             ppsettings[i] = ctypes.pointer(settings[i])
@@ -2403,6 +2987,1348 @@ class LucamPreviewAVI(object):
         return width.value, height.value, filetype.value, bitdepth.value
 
 
+class PropertyCache(object):
+    """Cache of camera property values and flags.
+
+    Values are served from memory for ttl seconds after they were read
+    from or written to the camera. Volatile properties, and properties
+    under automatic control of the camera, are not cached.
+
+    """
+
+    VOLATILE = ('luminance', 'memory', 'temperature', 'temperature2')
+
+    def __init__(self, ttl=1.0, ttls=None, exclude=VOLATILE):
+        """Initialize empty property cache.
+
+        Parameters
+        ----------
+        ttl : float or None
+            Time in seconds cached values are valid. If None, values do
+            not expire.
+        ttls : dict or None
+            Time to live of individual properties, overriding ttl.
+            Keys are Lucam.PROPERTY keys or values.
+        exclude : sequence of str or int
+            Properties that are never cached.
+
+        """
+        self.ttl = ttl
+        self.ttls = dict((Lucam.PROPERTY.get(k, k), v)
+                         for k, v in (ttls or {}).items())
+        self.exclude = set(Lucam.PROPERTY.get(k, k) for k in exclude)
+        self.hits = 0
+        self.misses = 0
+        self._values = {}  # property -> (value, flags, expiration time)
+        self._lock = threading.Lock()
+
+    def get(self, prop):
+        """Return cached (value, flags) of property or None."""
+        if prop in self.exclude:
+            return None
+        with self._lock:
+            entry = self._values.get(prop)
+            if entry is not None:
+                if entry[2] is None or entry[2] > time.monotonic():
+                    self.hits += 1
+                    return entry[:2]
+                del self._values[prop]
+            self.misses += 1
+        return None
+
+    def set(self, prop, value, flags):
+        """Store value and flags of property read from or written to camera."""
+        if prop in self.exclude or flags & API.LUCAM_PROP_FLAG_AUTO:
+            self.invalidate(prop)
+            return
+        ttl = self.ttls.get(prop, self.ttl)
+        if ttl is not None and ttl <= 0:
+            return
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._values[prop] = (value, flags, expires)
+
+    def invalidate(self, *props):
+        """Remove properties from cache. Remove all if none are given."""
+        with self._lock:
+            if not props:
+                self._values.clear()
+            for prop in props:
+                self._values.pop(Lucam.PROPERTY.get(prop, prop), None)
+
+    def stats(self):
+        """Return dictionary of cache statistics."""
+        with self._lock:
+            requests = self.hits + self.misses
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                hit_rate=self.hits / requests if requests else 0.0,
+                size=len(self._values))
+
+
+class FastFrames(object):
+    """Context manager and iterator over frames in Fast Frames mode.
+
+    Use Lucam.fast_frames() to create instances.
+
+    """
+
+    TAKE = {'wait': 'TakeFastFrame', 'force': 'ForceTakeFastFrame',
+            'no_trigger': 'TakeFastFrameNoTrigger'}
+
+    def __init__(self, camera, snapshot=None, numframes=None, take='wait',
+                 hw_trigger=False, prefetch=True):
+        """Initialize iterator. Fast Frames are enabled on context entry."""
+        if take not in FastFrames.TAKE:
+            raise ValueError("unknown fast frame function %r" % take)
+        if snapshot is None:
+            snapshot = camera.snapshot_settings()
+        if hw_trigger:
+            snapshot = copy.copy(snapshot)
+            snapshot.useHwTrigger = 1
+        self.camera = camera
+        self.snapshot = snapshot
+        self.numframes = numframes
+        self.count = 0  # frames returned
+        self.start = None
+        self.stop = None
+        self._take = getattr(camera, FastFrames.TAKE[take])
+        self._prefetch = prefetch
+        self._buffers = None
+        self._next = 0  # index of buffer receiving next frame
+        self._executor = None  # thread taking next frame
+        self._pending = None  # future of next frame
+        self._enabled = False
+
+    @property
+    def fps(self):
+        """Return frames per second achieved so far."""
+        if not self.count:
+            return 0.0
+        stop = self.stop if self.stop is not None else time.perf_counter()
+        return self.count / (stop - self.start)
+
+    def __enter__(self):
+        shape, dtype = frame_shape(self.snapshot.format,
+                                   self.camera._byteorder)
+        self._buffers = [empty_aligned(shape, dtype) for _ in range(2)]
+        self.camera.EnableFastFrames(self.snapshot)
+        if self._prefetch:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                1, thread_name_prefix='FastFrames')
+        self._enabled = True
+        self.start = time.perf_counter()
+        self.stop = None
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self._enabled:
+            raise StopIteration
+        if self.numframes is not None and self.count >= self.numframes:
+            self.close()
+            raise StopIteration
+        if self._pending is None:
+            exc, data = self._fetch(self._next)
+        else:
+            exc, data = self._pending.result()
+            self._pending = None
+        if exc is not None:
+            raise exc
+        self.count += 1
+        self._next ^= 1
+        if self._executor is not None and (self.numframes is None
+                                           or self.count < self.numframes):
+            self._pending = self._executor.submit(self._fetch, self._next)
+        return data
+
+    def close(self):
+        """Wait for pending frame and disable Fast Frames mode."""
+        if not self._enabled:
+            return
+        self.stop = time.perf_counter()
+        if self._pending is not None:
+            done, _ = concurrent.futures.wait(
+                [self._pending], self.snapshot.timeout / 1000.0 + 0.1)
+            if not done:
+                try:
+                    self.camera.CancelTakeFastFrame()
+                except LucamError:
+                    pass
+                self._pending.result()
+            self._pending = None
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self._enabled = False
+        self.camera.DisableFastFrames()
+
+    def _fetch(self, index):
+        """Take frame into buffer and return (exception, data)."""
+        data = self._buffers[index]
+        try:
+            self._take(out=data, validate=False)
+            return None, data
+        except LucamError as exc:
+            return exc, None
+
+
+class FramePool(object):
+    """Pool of reusable, page-aligned image arrays.
+
+    Arrays are keyed by frame format, byte order and number of frames.
+    Released arrays are kept for reuse up to a byte budget, evicting the
+    least recently used keys first.
+
+    """
+
+    def __init__(self, maxbytes=256 * 2**20):
+        """Initialize empty frame pool.
+
+        Parameters
+        ----------
+        maxbytes : int
+            Maximum number of bytes held by released arrays. If 0, arrays
+            are not pooled.
+
+        """
+        self.maxbytes = maxbytes
+        self.nbytes = 0  # bytes held by released arrays
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._free = collections.OrderedDict()  # key -> list of arrays
+        self._leased = {}  # id of buffer -> (weakref, key, view)
+        self._lock = threading.Lock()
+
+    def acquire(self, key, shape, dtype):
+        """Return array of shape and dtype from pool or newly allocated."""
+        with self._lock:
+            free = self._free.get(key)
+            if free:
+                self.hits += 1
+                data = free.pop()
+                self.nbytes -= data.nbytes
+                if free:
+                    self._free.move_to_end(key)
+                else:
+                    del self._free[key]
+            else:
+                self.misses += 1
+                data = empty_aligned(shape, dtype)
+            root = base_array(data)
+            offset = data.ctypes.data - root.ctypes.data
+            ref = weakref.ref(root, self._forget(id(root)))
+            self._leased[id(root)] = (ref, key, offset, data.shape, data.dtype)
+        return data
+
+    def release(self, data):
+        """Return array or view obtained from acquire() to the pool.
+
+        Return False if the array was not obtained from this pool.
+
+        """
+        root = base_array(data)
+        with self._lock:
+            lease = self._leased.get(id(root))
+            if lease is None or lease[0]() is not root:
+                return False
+            del self._leased[id(root)]
+            key, offset, shape, dtype = lease[1:]
+            nbytes = int(numpy.prod(shape)) * dtype.itemsize
+            if nbytes > self.maxbytes:
+                return True
+            data = root[offset:offset + nbytes].view(dtype).reshape(shape)
+            self._free.setdefault(key, []).append(data)
+            self._free.move_to_end(key)
+            self.nbytes += nbytes
+            while self.nbytes > self.maxbytes:
+                oldest = next(iter(self._free))
+                free = self._free[oldest]
+                self.nbytes -= free.pop(0).nbytes
+                self.evictions += 1
+                if not free:
+                    del self._free[oldest]
+        return True
+
+    def clear(self):
+        """Discard released arrays and forget arrays in use."""
+        with self._lock:
+            self._free.clear()
+            self._leased.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """Return dictionary of pool statistics."""
+        with self._lock:
+            requests = self.hits + self.misses
+            return dict(
+                hits=self.hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                hit_rate=self.hits / requests if requests else 0.0,
+                nbytes=self.nbytes,
+                leased=len(self._leased))
+
+    def _forget(self, rootid):
+        """Return weakref callback removing lease of collected array."""
+        poolref = weakref.ref(self)
+
+        def callback(ref):
+            pool = poolref()
+            if pool is not None:
+                lease = pool._leased.get(rootid)
+                if lease is not None and lease[0] is ref:
+                    del pool._leased[rootid]
+
+        return callback
+
+
+class ConversionPlan(object):
+    """Precompiled conversion of raw frames of one format to color or grey.
+
+    A plan holds the LUCAM_CONVERSION structure, the frame dimensions, and
+    a ring of output buffers with their ctypes pointers, such that
+    converting a frame costs only the call to the conversion function.
+    The ring is allocated on the first conversion without output array.
+
+    Plans may be called concurrently, e.g. from FrameDispatcher workers.
+    Ring buffers are handed out in turn and are reused after numbuffers
+    calls; callers holding results longer should pass output arrays.
+
+    Conversions are done by lucamapi.dll if the function is available.
+    Else, e.g. on Linux, the raw frames are demosaiced with NumPy, see
+    lucam_demosaic. The NumPy engine does not apply color correction
+    matrices. Color outputs are in BGR(A) order for both engines.
+
+    Plans are obtained from Lucam.conversion_plan() and are discarded when
+    the camera's frame format changes.
+
+    """
+
+    OUTPUT = {
+        # output: (function, dtype, samples per pixel, pointer type)
+        'rgb24': ('LucamConvertFrameToRgb24', numpy.uint8, 3, None),
+        'rgb32': ('LucamConvertFrameToRgb32', numpy.uint8, 4, 'pBYTE'),
+        'rgb48': ('LucamConvertFrameToRgb48', numpy.uint16, 3, 'pUSHORT'),
+        'grey8': ('LucamConvertFrameToGreyscale8', numpy.uint8, 1, 'pBYTE'),
+        'grey16': ('LucamConvertFrameToGreyscale16', numpy.uint16, 1,
+                   'pUSHORT')}
+
+    # LUCAM_DM value: lucam_demosaic method
+    DEMOSAIC = {0: 'nearest', 1: 'bilinear', 2: 'malvar', 3: 'malvar',
+                8: 'nearest'}
+
+    # weights of blue, green, and red samples for greyscale output
+    LUMA = (0.114, 0.587, 0.299)
+
+    def __init__(self, camera, frameformat, conversion, output='rgb24',
+                 numbuffers=3, engine='auto'):
+        """Initialize conversion plan.
+
+        Parameters
+        ----------
+        camera : Lucam
+            Camera the raw frames are obtained from.
+        frameformat : API.LUCAM_FRAME_FORMAT
+            Frame format of the raw frames.
+        conversion : API.LUCAM_CONVERSION
+            Demosaic method and color correction matrix.
+        output : str
+            Output format. One of ConversionPlan.OUTPUT.
+        numbuffers : int
+            Number of output buffers cycled through by convert() if out is
+            None. The buffers are allocated on first use.
+        engine : str
+            'dll', 'numpy', or 'auto'. If 'auto' (default), NumPy is used
+            if the API function is missing or not supported.
+
+        """
+        function, dtype, samples, pointer = ConversionPlan.OUTPUT[output]
+        if engine not in ('auto', 'dll', 'numpy'):
+            raise ValueError("unknown conversion engine %r" % engine)
+        self.output = output
+        self.frameformat = copy.copy(frameformat)
+        self.conversion = copy.copy(conversion)
+        # binningX and subSampleX share memory
+        self.width = frameformat.width // frameformat.binningX
+        self.height = frameformat.height // frameformat.binningY
+        self.pixelformat = frameformat.pixelFormat
+        if samples == 1:
+            self.shape = (self.height, self.width)
+        else:
+            self.shape = (self.height, self.width, samples)
+        self.dtype = numpy.dtype(dtype)
+        self.numbuffers = max(int(numbuffers), 1)
+        self.buffers = None  # allocated by first convert() without out
+        self.engine = engine
+        self._index = 0
+        self._camera = camera
+        self._pointer = None if pointer is None else getattr(API, pointer)
+        self._pointers = None
+        self._lock = threading.Lock()  # guards ring allocation and index
+        self._scratch = threading.local()  # per thread float32 RGB image
+        self._args = (self.width, self.height, self.pixelformat,
+                      ctypes.byref(self.conversion))
+        self._function = None
+        self._numpy = None  # arguments of NumPy conversion
+        if engine != 'numpy':
+            try:
+                self._function = getattr(camera._api, function)
+            except AttributeError:
+                if engine == 'dll':
+                    raise
+                self.engine = 'numpy'
+
+    def __call__(self, source, out=None):
+        """Convert raw frame and return output array.
+
+        Parameters
+        ----------
+        source : numpy array or ctypes pointer
+            Raw frame data, e.g. as passed to a streaming callback.
+        out : numpy array, or None
+            If None, the next buffer of the plan is returned. The buffer
+            is overwritten after numbuffers calls.
+
+        """
+        if out is None:
+            with self._lock:
+                if self.buffers is None:
+                    self.buffers = [empty_aligned(self.shape, self.dtype)
+                                    for _ in range(self.numbuffers)]
+                    self._pointers = [self._dest(b) for b in self.buffers]
+                index = self._index
+                self._index = (index + 1) % self.numbuffers
+            out = self.buffers[index]
+            dest = self._pointers[index]
+        elif out.shape != self.shape or out.dtype != self.dtype:
+            raise ValueError("numpy array does not match image size or type")
+        else:
+            dest = self._dest(out)
+        if self.engine != 'numpy':
+            if isinstance(source, numpy.ndarray):
+                source = source.ctypes.data_as(self._pointer or API.pBYTE)
+            elif self._pointer is not None:
+                source = ctypes.cast(source, self._pointer)
+            if self._function(self._camera._handle, dest, source,
+                              *self._args):
+                self.engine = 'dll'
+                return out
+            error = LucamError(self._camera)
+            if self.engine == 'dll' or error.value != 98:
+                raise error
+            self.engine = 'numpy'  # FunctionNotSupported
+        self._convert_numpy(source, out)
+        return out
+
+    convert = __call__
+
+    def _dest(self, out):
+        """Return output array or pointer passed to conversion function."""
+        if self._pointer is None:
+            return out
+        return out.ctypes.data_as(self._pointer)
+
+    def _convert_numpy(self, source, out):
+        """Convert raw frame to output array using NumPy."""
+        from .lucam_demosaic import demosaic
+
+        if self._numpy is None:
+            self._numpy = self._prepare_numpy()
+        dtype, pattern, method, grey = self._numpy
+        if isinstance(source, numpy.ndarray):
+            raw = source.reshape(-1).view(dtype)[:self.width * self.height]
+        else:
+            address = ctypes.cast(source, ctypes.c_void_p).value
+            buffer = (ctypes.c_char * (self.width * self.height *
+                                       dtype.itemsize)).from_address(address)
+            raw = numpy.frombuffer(buffer, dtype)
+        raw = raw.reshape(self.height, self.width)
+        shift = 8 * (dtype.itemsize - self.dtype.itemsize)
+
+        if pattern is None:
+            # monochrome sensor
+            if shift > 0:
+                raw = raw >> shift
+            elif shift < 0:
+                raw = raw.astype(self.dtype) << -shift
+            if out.ndim == 2:
+                out[:] = raw
+            else:
+                out[..., :3] = raw[..., numpy.newaxis]
+        elif not grey:
+            demosaic(raw, out, method, pattern, bgr=True, shift=shift)
+        else:
+            scratch = getattr(self._scratch, 'data', None)
+            if scratch is None:
+                scratch = self._scratch.data = numpy.empty(
+                    self.shape + (3, ), numpy.float32)
+            demosaic(raw, scratch, method, pattern, bgr=True, shift=shift)
+            grey = numpy.dot(scratch, numpy.float32(ConversionPlan.LUMA))
+            numpy.clip(grey, 0, numpy.iinfo(self.dtype).max, out=grey)
+            numpy.rint(grey, out=out, casting='unsafe')
+        if out.ndim == 3 and out.shape[2] == 4:
+            out[..., 3] = numpy.iinfo(self.dtype).max
+
+    def _prepare_numpy(self):
+        """Return raw dtype, Bayer pattern, method and if demosaic to grey."""
+        if self.pixelformat == API.LUCAM_PF_8:
+            dtype = numpy.dtype('uint8')
+        elif self.pixelformat == API.LUCAM_PF_16:
+            dtype = numpy.dtype(self._camera._byteorder + 'u2')
+        else:
+            raise ValueError("NumPy conversion requires LUCAM_PF_8 or 16")
+        pattern = int(self._camera.GetProperty('color_format')[0])
+        if pattern == API.LUCAM_CF_MONO:
+            pattern = None
+        elif pattern not in (API.LUCAM_CF_BAYER_RGGB, API.LUCAM_CF_BAYER_GRBG,
+                             API.LUCAM_CF_BAYER_GBRG, API.LUCAM_CF_BAYER_BGGR):
+            raise ValueError("NumPy conversion requires Bayer RGB sensor")
+        method = ConversionPlan.DEMOSAIC.get(self.conversion.DemosaicMethod,
+                                             'bilinear')
+        grey = pattern is not None and len(self.shape) == 2
+        return dtype, pattern, method, grey
+
+
+Frame = collections.namedtuple('Frame', 'data sequence timestamp')
+
+
+class FrameRing(object):
+    """Ring buffer of raw frames filled by a streaming callback.
+
+    The ring holds numslots preallocated frames in one page-aligned array.
+    The streaming callback copies each frame into the next slot with a
+    single memmove and records its sequence number, counting all frames
+    received from the camera, and a time.perf_counter() timestamp.
+
+    Consumers read frames through FrameReader instances as NumPy views of
+    the slots, without copying. If the ring is full, the 'overwrite'
+    policy replaces the oldest frame, while the 'drop' policy discards the
+    new frame as long as any reader has not yet read the oldest one.
+    Either way, frames missed by a reader are counted by the reader.
+
+    Examples
+    --------
+    >>> ring = FrameRing(camera.GetFormat()[0], numslots=8)
+    >>> ring.attach(camera)
+    >>> camera.StreamVideoControl('start_streaming')
+    >>> reader = ring.reader()
+    >>> frame = reader.read(timeout=1.0)
+    >>> camera.StreamVideoControl('stop_streaming')
+    >>> ring.detach()
+
+    """
+
+    POLICY = ('overwrite', 'drop')
+
+    def __init__(self, frameformat, numslots=8, policy='overwrite',
+                 byteorder='='):
+        """Initialize ring buffer.
+
+        Parameters
+        ----------
+        frameformat : API.LUCAM_FRAME_FORMAT
+            Frame format of streamed frames.
+        numslots : int
+            Number of frames the ring holds.
+        policy : str
+            'overwrite' or 'drop'. What to do with a new frame if the ring
+            is full.
+        byteorder : char
+            Byte order of 16 bit camera data.
+
+        """
+        if policy not in FrameRing.POLICY:
+            raise ValueError("unknown ring buffer policy %r" % policy)
+        if numslots < 2:
+            raise ValueError("ring buffer needs at least two slots")
+        shape, dtype = frame_shape(frameformat, byteorder)
+        self.frameformat = copy.copy(frameformat)
+        self.numslots = int(numslots)
+        self.policy = policy
+        self.data = empty_aligned((self.numslots, ) + shape, dtype)
+        self.sequences = numpy.full(self.numslots, -1, numpy.int64)
+        self.timestamps = numpy.zeros(self.numslots, numpy.float64)
+        self.received = 0  # frames passed to callback
+        self.written = 0  # frames stored in ring
+        self.dropped = 0  # frames discarded by 'drop' policy
+        self.callback_time = 0.0  # total duration of callbacks in s
+        self.callback_max = 0.0  # maximum duration of a callback in s
+        self.closed = False
+        self.callbackid = None
+        self._slotsize = self.data[0].nbytes
+        self._addresses = [self.data[i].ctypes.data
+                           for i in range(self.numslots)]
+        self._readers = weakref.WeakSet()
+        self._camera = None
+        self._cond = threading.Condition()
+
+    def callback(self, context, pointer, size):
+        """Copy frame at pointer to next slot. API.VideoFilterCallback."""
+        timestamp = time.perf_counter()
+        with self._cond:
+            sequence = self.received
+            self.received += 1
+            index = self.written
+            if self.policy == 'drop' and self._readers:
+                oldest = min(reader.position for reader in self._readers)
+                if index - oldest >= self.numslots:
+                    self.dropped += 1
+                    self._timed(timestamp)
+                    return
+            slot = index % self.numslots
+            self.sequences[slot] = -1  # slot is invalid while copying
+        ctypes.memmove(self._addresses[slot], pointer,
+                       min(size, self._slotsize))
+        with self._cond:
+            self.sequences[slot] = sequence
+            self.timestamps[slot] = timestamp
+            self.written = index + 1
+            self._cond.notify_all()
+            self._timed(timestamp)
+
+    def _timed(self, start):
+        """Record duration of callback started at time start."""
+        duration = time.perf_counter() - start
+        self.callback_time += duration
+        if duration > self.callback_max:
+            self.callback_max = duration
+
+    def reader(self):
+        """Return FrameReader starting at the next frame."""
+        reader = FrameReader(self)
+        with self._cond:
+            reader.position = self.written
+            self._readers.add(reader)
+        return reader
+
+    def valid(self, frame):
+        """Return True if frame has not been overwritten since read."""
+        slot = self._slot(frame.data)
+        return self.sequences[slot] == frame.sequence
+
+    def attach(self, camera):
+        """Register callback with camera's streaming video."""
+        self.callbackid = camera.AddStreamingCallback(self.callback)
+        self._camera = camera
+
+    def detach(self):
+        """Remove callback from camera and wake up waiting readers."""
+        if self._camera is not None:
+            self._camera.RemoveStreamingCallback(self.callbackid)
+            self._camera = None
+            self.callbackid = None
+        self.close()
+
+    def close(self):
+        """Wake up readers waiting for frames."""
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def stats(self):
+        """Return dictionary of ring buffer statistics."""
+        with self._cond:
+            return dict(
+                received=self.received,
+                written=self.written,
+                dropped=self.dropped,
+                readers=len(self._readers),
+                callback_mean=(self.callback_time / self.received
+                               if self.received else 0.0),
+                callback_max=self.callback_max)
+
+    def _slot(self, data):
+        """Return slot index of frame view."""
+        offset = data.ctypes.data - self._addresses[0]
+        return offset // (self._addresses[1] - self._addresses[0])
+
+
+class FrameReader(object):
+    """Cursor reading frames from FrameRing.
+
+    Frames are NumPy views of ring slots. With the 'overwrite' policy,
+    a frame is overwritten once numslots newer frames were received; use
+    FrameRing.valid() to check a frame after processing it, or copy it.
+
+    """
+
+    def __init__(self, ring):
+        """Initialize reader. Use FrameRing.reader() instead."""
+        self.ring = ring
+        self.position = 0  # index of next frame to read
+        self.read_count = 0  # frames returned by read()
+        self.missed = 0  # frames overwritten or skipped before read
+
+    def read(self, timeout=None, latest=False):
+        """Return next Frame, or None on timeout or if ring is closed.
+
+        Parameters
+        ----------
+        timeout : float or None
+            Seconds to wait for a new frame. If None, wait indefinitely.
+        latest : bool
+            If True, return the most recent frame and skip older ones,
+            e.g. for display.
+
+        """
+        ring = self.ring
+        with ring._cond:
+            if not ring._cond.wait_for(
+                    lambda: ring.written > self.position or ring.closed,
+                    timeout):
+                return None
+            if ring.written <= self.position:
+                return None
+            index = ring.written - 1 if latest else self.position
+            oldest = max(ring.written - ring.numslots, 0)
+            if ring.sequences[oldest % ring.numslots] < 0:
+                oldest += 1  # slot is being overwritten
+            index = max(index, oldest)
+            self.missed += index - self.position
+            self.position = index + 1
+            self.read_count += 1
+            slot = index % ring.numslots
+            return Frame(ring.data[slot], int(ring.sequences[slot]),
+                         float(ring.timestamps[slot]))
+
+    def pending(self):
+        """Return number of frames received but not yet read."""
+        return max(self.ring.written - self.position, 0)
+
+    def close(self):
+        """Stop holding back the ring's 'drop' policy."""
+        self.ring._readers.discard(self)
+
+
+class FrameDispatcher(object):
+    """Deliver frames of FrameRing to subscribers from worker threads.
+
+    The driver's streaming callback only copies frames into the ring.
+    Worker threads read the frames, apply the conversions requested by
+    subscribers once per frame, and call the subscribers. With more than
+    one worker, frames are processed concurrently and may be delivered
+    out of order; subscribers and conversion functions must then be
+    thread-safe.
+
+    Examples
+    --------
+    >>> dispatcher = FrameDispatcher(ring)
+    >>> dispatcher.subscribe(print, convert=camera.conversion_plan())
+    >>> dispatcher.start()
+    >>> dispatcher.stop()
+    >>> dispatcher.stats()['queue_depth']
+    0
+
+    """
+
+    def __init__(self, ring, workers=1, latest=False):
+        """Initialize dispatcher.
+
+        Parameters
+        ----------
+        ring : FrameRing or None
+            Source of frames. May be replaced while the dispatcher is
+            stopped, e.g. after the frame format changed.
+        workers : int
+            Number of worker threads.
+        latest : bool
+            If True, skip to the most recent frame when workers fall
+            behind instead of processing all buffered frames.
+
+        """
+        self.ring = ring
+        self.workers = max(int(workers), 1)
+        self.latest = latest
+        self.dispatched = 0  # frames delivered to subscribers
+        self._reader = None
+        self._threads = []
+        self._running = False
+        self._subscribers = {}  # id -> Subscriber
+        self._nextid = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback, convert=None, max_rate=None):
+        """Register function called with each frame and return its id.
+
+        Parameters
+        ----------
+        callback : function
+            Called as callback(frame) with Frame tuples. The data of the
+            frame are the raw ring slot, or the result of convert.
+        convert : function or None
+            Called as convert(raw) to compute the frame data passed to
+            callback, e.g. a ConversionPlan. Called once per frame for all
+            subscribers sharing the same function.
+        max_rate : float or None
+            Maximum number of frames per second delivered to callback.
+            Frames arriving earlier are skipped without conversion.
+
+        """
+        with self._lock:
+            self._nextid += 1
+            self._subscribers[self._nextid] = Subscriber(callback, convert,
+                                                         max_rate)
+            return self._nextid
+
+    def unsubscribe(self, subscriberid):
+        """Remove subscriber and return number of remaining subscribers."""
+        with self._lock:
+            del self._subscribers[subscriberid]
+            return len(self._subscribers)
+
+    def start(self):
+        """Start worker threads reading from ring."""
+        if self._running:
+            return
+        self._reader = self.ring.reader()
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._run, name='FrameDispatcher-%i' % i,
+                             daemon=True)
+            for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=None):
+        """Stop worker threads after current frames are delivered."""
+        self._running = False
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self._reader is not None:
+            self._reader.close()
+
+    def stats(self):
+        """Return dictionary of dispatch statistics.
+
+        Keys are queue_depth, the number of frames waiting in the ring,
+        missed, the number of frames overwritten or skipped, dispatched,
+        callback_mean and callback_max, the duration of the driver
+        callback in seconds, and subscribers, a dictionary of subscriber
+        statistics by id, including the latency from frame arrival to
+        the return of the subscriber in seconds.
+
+        """
+        reader = self._reader
+        result = self.ring.stats() if self.ring is not None else {}
+        result.update(
+            queue_depth=reader.pending() if reader else 0,
+            missed=reader.missed if reader else 0,
+            dispatched=self.dispatched)
+        with self._lock:
+            result['subscribers'] = dict(
+                (i, s.stats()) for i, s in self._subscribers.items())
+        return result
+
+    def _run(self):
+        """Read frames from ring and deliver them to subscribers."""
+        reader = self._reader
+        while self._running:
+            frame = reader.read(timeout=0.1, latest=self.latest)
+            if frame is None:
+                if self.ring.closed:
+                    break
+                continue
+            with self._lock:
+                subscribers = list(self._subscribers.values())
+                self.dispatched += 1
+            converted = {}
+            for subscriber in subscribers:
+                subscriber.deliver(frame, converted)
+
+
+class Subscriber(object):
+    """Subscriber of FrameDispatcher with delivery statistics."""
+
+    def __init__(self, callback, convert=None, max_rate=None):
+        self.callback = callback
+        self.convert = convert
+        self.interval = 1.0 / max_rate if max_rate else 0.0
+        self.last = float('-inf')  # timestamp of last delivered frame
+        self.count = 0
+        self.skipped = 0  # frames skipped due to max_rate
+        self.errors = 0
+        self.latency = 0.0  # total latency in s
+        self.latency_max = 0.0
+
+    def deliver(self, frame, converted):
+        """Call subscriber with frame, converting it at most once."""
+        if frame.timestamp - self.last < self.interval:
+            self.skipped += 1
+            return
+        self.last = frame.timestamp
+        try:
+            if self.convert is not None:
+                try:
+                    data = converted[self.convert]
+                except KeyError:
+                    data = converted[self.convert] = self.convert(frame.data)
+                frame = frame._replace(data=data)
+            self.callback(frame)
+        except Exception:
+            self.errors += 1
+            traceback.print_exc()
+        latency = time.perf_counter() - frame.timestamp
+        self.count += 1
+        self.latency += latency
+        if latency > self.latency_max:
+            self.latency_max = latency
+
+    def stats(self):
+        """Return dictionary of delivery statistics."""
+        return dict(
+            count=self.count,
+            skipped=self.skipped,
+            errors=self.errors,
+            latency_mean=self.latency / self.count if self.count else 0.0,
+            latency_max=self.latency_max)
+
+
+class LatestFrame(object):
+    """Latest raw frame of a stream, converted only when requested.
+
+    Use the update method as raw FrameDispatcher subscriber. Frames are
+    copied into one of three buffers, such that a frame being converted is
+    never overwritten. The converted frame is cached until a newer frame
+    arrives. Frames replaced before anyone asked for them are never
+    converted.
+
+    Examples
+    --------
+    >>> latest = LatestFrame(camera.conversion_plan())
+    >>> dispatcher.subscribe(latest.update)
+    >>> frame = latest.get()
+
+    """
+
+    def __init__(self, convert=None):
+        """Initialize empty frame.
+
+        Parameters
+        ----------
+        convert : callable or None
+            Called as convert(raw) to compute the frame data returned by
+            get, e.g. a ConversionPlan. If None, the raw frame is returned.
+
+        """
+        self.convert = convert
+        self.received = 0
+        self.converted = 0
+        self._lock = threading.Lock()
+        self._buffers = None
+        self._frames = [None, None, None]  # Frame of buffer
+        self._ready = None  # index of latest buffer
+        self._busy = None  # index of buffer being converted
+        self._result = None  # converted Frame
+
+    @property
+    def sequence(self):
+        """Return sequence number of latest frame or -1."""
+        ready = self._ready
+        return -1 if ready is None else self._frames[ready].sequence
+
+    def update(self, frame):
+        """Store copy of raw frame."""
+        with self._lock:
+            data = frame.data
+            if (self._buffers is None or self._buffers[0].shape != data.shape
+                    or self._buffers[0].dtype != data.dtype):
+                self._buffers = [empty_aligned(data.shape, data.dtype)
+                                 for _ in range(3)]
+                self._ready = self._busy = None
+            index = next(i for i in range(3)
+                         if i != self._ready and i != self._busy)
+            numpy.copyto(self._buffers[index], data)
+            self._frames[index] = frame._replace(data=self._buffers[index])
+            self._ready = index
+            self.received += 1
+
+    def get(self):
+        """Return latest frame with converted data, or None."""
+        with self._lock:
+            index = self._ready
+            if index is None:
+                return None
+            frame = self._frames[index]
+            result = self._result
+            if result is not None and result.sequence == frame.sequence:
+                return result
+            self._busy = index
+        try:
+            if self.convert is not None:
+                frame = frame._replace(data=self.convert(frame.data))
+        finally:
+            with self._lock:
+                self._busy = None
+        with self._lock:
+            self._result = frame
+            self.converted += 1
+        return frame
+
+    def stats(self):
+        """Return dictionary with number of received and converted frames."""
+        return dict(received=self.received, converted=self.converted)
+
+
+class PreTriggerCapture(object):
+    """Capture frames before and after a trigger from streaming video.
+
+    While armed, the last pre_frames raw frames are kept in a FrameRing.
+    On a trigger, these frames and the next post_frames frames are copied
+    into a capture buffer, which is passed to the save function in a
+    background thread. Acquisition continues while saving; triggers
+    occurring before the save function returns are ignored and counted.
+
+    All memory is allocated at initialization, see nbytes.
+
+    Triggers are a call of the trigger method ('software'), a change of
+    the GPIO input bits in gpio_mask polled with GpioRead ('gpio'), or the
+    statistic of a frame rising above threshold ('threshold').
+
+    Examples
+    --------
+    >>> def save(frames, sequences, timestamps, trigger):
+    ...     numpy.save('capture.npy', frames)
+    >>> capture = PreTriggerCapture(camera.GetFormat()[0], 100, 20, save)
+    >>> camera.StreamVideoControl('start_streaming')
+    >>> capture.arm(camera)
+    >>> capture.trigger()
+    >>> capture.disarm()
+    >>> camera.StreamVideoControl('stop_streaming')
+
+    """
+
+    TRIGGERS = ('software', 'gpio', 'threshold')
+
+    def __init__(self, frameformat, pre_frames, post_frames, save,
+                 byteorder='=', source='software', gpio_mask=0xff,
+                 gpio_interval=0.01, threshold=None, statistic=None,
+                 margin=8):
+        """Allocate ring and capture buffers.
+
+        Parameters
+        ----------
+        frameformat : API.LUCAM_FRAME_FORMAT
+            Frame format of streamed frames.
+        pre_frames : int
+            Number of frames up to and including the trigger frame.
+        post_frames : int
+            Number of frames after the trigger frame.
+        save : callable
+            Called as save(frames, sequences, timestamps, trigger) in a
+            background thread. The arrays are views of the capture buffer,
+            valid until save returns. Trigger is a dictionary describing
+            the trigger.
+        byteorder : char
+            Byte order of 16 bit camera data.
+        source : str
+            One of TRIGGERS. The trigger method works with any source.
+        gpio_mask : int
+            GPIO input bits monitored by the 'gpio' source.
+        gpio_interval : float
+            Minimum seconds between GpioRead calls.
+        threshold : float
+            Value of statistic triggering the 'threshold' source.
+        statistic : callable or None
+            Called as statistic(frame_data). By default the mean of every
+            8th pixel of every 8th row.
+        margin : int
+            Number of additional ring slots, which allow the monitor thread
+            to lag behind the stream.
+
+        """
+        if source not in PreTriggerCapture.TRIGGERS:
+            raise ValueError("unknown trigger source %r" % source)
+        if pre_frames < 1 or post_frames < 0:
+            raise ValueError("invalid number of pre or post trigger frames")
+        if source == 'threshold' and threshold is None:
+            raise ValueError("threshold trigger requires threshold")
+        shape, dtype = frame_shape(frameformat, byteorder)
+        self.pre_frames = int(pre_frames)
+        self.post_frames = int(post_frames)
+        self.save = save
+        self.source = source
+        self.gpio_mask = gpio_mask
+        self.gpio_interval = gpio_interval
+        self.threshold = threshold
+        if statistic is None:
+            statistic = PreTriggerCapture.subsampled_mean
+        self.statistic = statistic
+        self.ring = FrameRing(frameformat, self.pre_frames + max(margin, 1),
+                              'overwrite', byteorder)
+        numframes = self.pre_frames + self.post_frames
+        self.frames = empty_aligned((numframes, ) + shape, dtype)
+        self.sequences = numpy.zeros(numframes, numpy.int64)
+        self.timestamps = numpy.zeros(numframes, numpy.float64)
+        self.triggers = 0  # triggers starting a capture
+        self.ignored = 0  # triggers while capturing or saving
+        self.saved = 0  # captures passed to save function
+        self.lost = 0  # pre-trigger frames overwritten before copied
+        self.errors = 0
+        self._camera = None
+        self._reader = None
+        self._thread = None
+        self._saver = None
+        self._running = False
+        self._software = None  # frame index of pending software trigger
+        self._busy = False  # capture buffer in use
+
+    @property
+    def nbytes(self):
+        """Return number of bytes of frame buffers."""
+        return self.ring.data.nbytes + self.frames.nbytes
+
+    @staticmethod
+    def frames_for(frameformat, seconds=None, framerate=None, nbytes=None,
+                   byteorder='='):
+        """Return number of frames in seconds at framerate or in nbytes."""
+        if nbytes is not None:
+            shape, dtype = frame_shape(frameformat, byteorder)
+            framesize = int(numpy.prod(shape)) * numpy.dtype(dtype).itemsize
+            return max(int(nbytes // framesize), 1)
+        return max(int(round(seconds * framerate)), 1)
+
+    @staticmethod
+    def subsampled_mean(data):
+        """Return mean of every 8th pixel of every 8th row of frame."""
+        return float(data[::8, ::8].mean())
+
+    def arm(self, camera):
+        """Start keeping frames of camera's streaming video."""
+        if self._running:
+            return
+        self._camera = camera
+        self._running = True
+        self._reader = self.ring.reader()
+        self.ring.attach(camera)
+        self._thread = threading.Thread(target=self._monitor,
+                                        name='PreTriggerCapture', daemon=True)
+        self._thread.start()
+
+    def disarm(self, timeout=None):
+        """Stop monitoring and wait for saving to complete."""
+        self._running = False
+        self.ring.detach()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self._saver is not None:
+            self._saver.join(timeout)
+            self._saver = None
+        self._camera = None
+
+    def trigger(self):
+        """Capture around latest frame received."""
+        self._software = max(self.ring.written - 1, 0)
+
+    @property
+    def busy(self):
+        """Return True while capturing or saving."""
+        return self._busy
+
+    def stats(self):
+        """Return dictionary of capture statistics.
+
+        Missed frames, which the monitor thread fell behind on, are counted
+        from the last arm and remain available after disarm.
+
+        """
+        reader = self._reader
+        return dict(triggers=self.triggers, ignored=self.ignored,
+                    saved=self.saved, lost=self.lost, errors=self.errors,
+                    missed=reader.missed if reader is not None else 0,
+                    nbytes=self.nbytes)
+
+    def _monitor(self):
+        """Read frames from ring, check triggers, and fill capture buffer."""
+        reader = self._reader
+        gpio_time = 0.0
+        gpio_last = None
+        above = True  # do not trigger on first frame above threshold
+        count = 0  # frames in capture buffer
+        capturing = False
+        trigger = None
+        try:
+            while self._running:
+                frame = reader.read(timeout=0.1)
+                if frame is None:
+                    if self.ring.closed:
+                        break
+                    continue
+                index = reader.position - 1
+                if capturing:
+                    if self._copy(frame, index, count):
+                        count += 1
+                    if count == len(self.frames) or (
+                            index - trigger['index'] >= self.post_frames):
+                        self._start_save(count, trigger)
+                        capturing = False
+                    continue
+
+                reason = None
+                value = None
+                if self._software is not None and index >= self._software:
+                    self._software = None
+                    reason = 'software'
+                if self.source == 'gpio' and reason is None:
+                    now = time.perf_counter()
+                    if now - gpio_time >= self.gpio_interval:
+                        gpio_time = now
+                        gpi = self._camera.GpioRead()[1] & self.gpio_mask
+                        if gpio_last is not None and gpi != gpio_last:
+                            reason = 'gpio'
+                        gpio_last = gpi
+                        value = gpi
+                if self.source == 'threshold' and reason is None:
+                    value = self.statistic(frame.data)
+                    if value > self.threshold:
+                        if not above:
+                            reason = 'threshold'
+                        above = True
+                    else:
+                        above = False
+                if reason is None:
+                    continue
+                if self._busy:
+                    self.ignored += 1
+                    continue
+
+                self._busy = True
+                self.triggers += 1
+                trigger = dict(source=reason, index=index,
+                               sequence=frame.sequence,
+                               timestamp=frame.timestamp, value=value)
+                count = 0
+                for i in range(index - self.pre_frames + 1, index + 1):
+                    if i < 0:
+                        continue
+                    slot = i % self.ring.numslots
+                    previous = Frame(self.ring.data[slot], i,
+                                     float(self.ring.timestamps[slot]))
+                    if self._copy(previous, i, count):
+                        count += 1
+                trigger['pre_frames'] = count
+                if self.post_frames:
+                    capturing = True
+                else:
+                    self._start_save(count, trigger)
+        except Exception:
+            self.errors += 1
+            traceback.print_exc()
+        if capturing:
+            self._start_save(count, trigger)
+
+    def _copy(self, frame, index, count):
+        """Copy frame to capture buffer if it was not overwritten."""
+        if not self.ring.valid(frame._replace(sequence=index)):
+            self.lost += 1
+            return False
+        self.frames[count] = frame.data
+        self.sequences[count] = index
+        self.timestamps[count] = frame.timestamp
+        if not self.ring.valid(frame._replace(sequence=index)):
+            self.lost += 1
+            return False
+        return True
+
+    def _start_save(self, count, trigger):
+        """Call save function with captured frames in background thread."""
+        def run():
+            try:
+                self.save(self.frames[:count], self.sequences[:count],
+                          self.timestamps[:count], trigger)
+                self.saved += 1
+            except Exception:
+                self.errors += 1
+                traceback.print_exc()
+            finally:
+                self._busy = False
+
+        if self._saver is not None:
+            self._saver.join()
+        self._saver = threading.Thread(target=run, name='PreTriggerSave',
+                                       daemon=True)
+        self._saver.start()
+
+
+class CapabilityCache(object):
+    """Persistent table of camera capabilities by model and firmware.
+
+    The table is stored as JSON in filename, by default in the file given
+    by the LUCAM_CAPABILITIES environment variable or ~/.lucam/
+    capabilities.json. Entries are returned by Lucam.capabilities().
+
+    """
+
+    def __init__(self, filename=None):
+        """Initialize capability table stored in JSON file."""
+        if filename is None:
+            filename = os.environ.get('LUCAM_CAPABILITIES', os.path.join(
+                os.path.expanduser('~'), '.lucam', 'capabilities.json'))
+        self.filename = filename
+        self._table = None
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return capabilities stored for key or None."""
+        with self._lock:
+            if self._table is None:
+                self._table = self._load()
+            entry = self._table.get(key)
+        if entry is None:
+            return None
+        entry = dict(entry)
+        entry['ranges'] = dict((k, tuple(v))
+                               for k, v in entry['ranges'].items())
+        entry['properties'] = tuple(entry['properties'])
+        entry['frame_rates'] = tuple(entry['frame_rates'])
+        return entry
+
+    def set(self, key, capabilities):
+        """Store capabilities for key and write table to file."""
+        with self._lock:
+            if self._table is None:
+                self._table = self._load()
+            self._table[key] = capabilities
+            try:
+                dirname = os.path.dirname(self.filename)
+                if dirname and not os.path.isdir(dirname):
+                    os.makedirs(dirname)
+                temp = self.filename + '.tmp'
+                with open(temp, 'w') as fh:
+                    json.dump(self._table, fh, indent=1, sort_keys=True)
+                os.replace(temp, self.filename)
+            except (IOError, OSError):
+                pass  # the table is still valid for this session
+
+    def clear(self):
+        """Remove all entries and the file."""
+        with self._lock:
+            self._table = {}
+            if os.path.exists(self.filename):
+                os.remove(self.filename)
+
+    def _load(self):
+        """Return table read from file, or empty table."""
+        try:
+            with open(self.filename) as fh:
+                table = json.load(fh)
+            return table if isinstance(table, dict) else {}
+        except (IOError, OSError, ValueError):
+            return {}
+
+
+CAPABILITIES = CapabilityCache()
+
+
 def LucamGetLastError():
     """Return code of last error that occurred in a API function.
 
@@ -2434,6 +4360,43 @@ def LucamEnumCameras():
     return version_array[:num]
 
 
+def open_cameras(numbers=None, api=None):
+    """Return list of Lucam instances opened concurrently.
+
+    Parameters
+    ----------
+    numbers : sequence of int, or None
+        Camera numbers. If None (default), all connected cameras are opened.
+    api : object or None
+        LuCam API interface passed to Lucam.
+
+    Opening a camera takes tens to hundreds of milliseconds. The cameras
+    are opened in parallel threads. If any camera fails to open, the
+    others are closed and the error is raised.
+
+    """
+    if numbers is None:
+        numbers = range(1, LucamNumCameras() + 1)
+    numbers = list(numbers)
+    if not numbers:
+        return []
+    with concurrent.futures.ThreadPoolExecutor(len(numbers)) as executor:
+        futures = [executor.submit(Lucam, number, api) for number in numbers]
+    cameras = []
+    error = None
+    for future in futures:
+        try:
+            cameras.append(future.result())
+        except Exception as exc:
+            if error is None:
+                error = exc
+    if error is not None:
+        for camera in cameras:
+            camera.CameraClose()
+        raise error
+    return cameras
+
+
 def LucamConvertBmp24ToRgb24(data):
     """Convert Windows bitmap BGR24 data to RGB24.
 
@@ -2451,7 +4414,8 @@ def LucamConvertBmp24ToRgb24(data):
         raise LucamError()
 
 
-def ndarray(frameformat, byteorder='=', out=None, validate=True, numframes=1):
+def ndarray(frameformat, byteorder='=', out=None, validate=True, numframes=1,
+            pool=None):
     """Return numpy.ndarray and ctypes pointer.
 
     Parameters
@@ -2471,11 +4435,38 @@ def ndarray(frameformat, byteorder='=', out=None, validate=True, numframes=1):
         validated.
     numframes : int
         Number of frames the array must buffer.
+    pool : FramePool or None
+        If not None, a new array is taken from the pool.
 
     """
     if out is not None and not validate:
         return out, out.ctypes.data_as(API.pBYTE)
 
+    shape, dtype = frame_shape(frameformat, byteorder)
+
+    if out is None:
+        if int(numframes) > 1:  # numframes must be provided
+            shape = (numframes, ) + shape
+        if pool is None:
+            data = numpy.empty(shape, dtype=dtype)
+        else:
+            data = pool.acquire((bytes(frameformat), byteorder, numframes),
+                                shape, dtype)
+    else:
+        # validate size and type of output array
+        if numframes is None:
+            numframes = out.shape[0]
+        if numframes > 1:
+            shape = (numframes, ) + shape
+        if numpy.prod(shape) != out.size or dtype != out.dtype:
+            raise ValueError("numpy array does not match image size or type")
+        data = out
+
+    return data, data.ctypes.data_as(API.pBYTE)
+
+
+def frame_shape(frameformat, byteorder='='):
+    """Return shape and dtype of image of frame format."""
     if (frameformat.width % frameformat.binningX
             or frameformat.height % frameformat.binningY):
         raise ValueError('Invalid frame format')
@@ -2499,22 +4490,23 @@ def ndarray(frameformat, byteorder='=', out=None, validate=True, numframes=1):
         shape = (height, width, 4)
     else:
         raise ValueError("Invalid pixel format")
+    return shape, dtype
 
-    if out is None:
-        if int(numframes) > 1:  # numframes must be provided
-            shape = (numframes, ) + shape
-        data = numpy.empty(shape, dtype=dtype)
-    else:
-        # validate size and type of output array
-        if numframes is None:
-            numframes = out.shape[0]
-        if numframes > 1:
-            shape = (numframes, ) + shape
-        if numpy.prod(shape) != out.size or dtype != out.dtype:
-            raise ValueError("numpy array does not match image size or type")
-        data = out
 
-    return data, data.ctypes.data_as(API.pBYTE)
+def empty_aligned(shape, dtype, alignment=mmap.PAGESIZE):
+    """Return new uninitialized array aligned to memory page boundary."""
+    dtype = numpy.dtype(dtype)
+    nbytes = int(numpy.prod(shape)) * dtype.itemsize
+    buffer = numpy.empty(nbytes + alignment, numpy.uint8)
+    offset = -buffer.ctypes.data % alignment
+    return buffer[offset:offset + nbytes].view(dtype).reshape(shape)
+
+
+def base_array(data):
+    """Return numpy array owning the memory of array or view."""
+    while isinstance(data.base, numpy.ndarray):
+        data = data.base
+    return data
 
 
 def list_property_flags(flags):
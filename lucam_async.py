@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+# lucam_async.py
+
+"""Awaitable acquisition calls of Lumenera(r) cameras for asyncio.
+
+*AsyncLucam* wraps a Lucam instance. Its acquisition methods are
+coroutines running the blocking Lucam calls on a single thread per camera,
+such that one event loop can drive several cameras, stages, and I/O, and
+calls to one camera are serialized. Cancelling a coroutine, e.g. by
+asyncio.wait_for, cancels the blocking call in the camera with
+CancelTakeVideo, CancelTakeFastFrame, or LucamAutoFocusStop.
+
+*FrameStream* is an async iterator over streamed frames. The streaming
+callback copies frames into a few preallocated slots. A frame's slot is
+reused once the iterator advances; while the consumer holds all slots,
+new frames are dropped and counted, such that a slow consumer limits
+memory instead of the camera.
+
+Examples
+--------
+>>> async def main():
+...     async with await AsyncLucam.open(1) as camera:
+...         image = await camera.TakeSnapshot()
+...         async with camera.frames(numslots=4) as stream:
+...             async for frame in stream:
+...                 process(frame.data)
+>>> asyncio.run(main())
+
+"""
+import asyncio
+import concurrent.futures
+import ctypes
+import queue
+import time
+
+from .lucam import Lucam, LucamError, Frame, frame_shape, empty_aligned
+
+__all__ = ['AsyncLucam', 'FrameStream']
+
+
+class AsyncLucam(object):
+    """Lucam instance with awaitable acquisition calls.
+
+    Attributes
+    ----------
+    camera : Lucam
+        Wrapped camera. Non-blocking methods may be called directly,
+        other methods with AsyncLucam.call.
+
+    """
+
+    def __init__(self, camera, owner=False):
+        """Wrap open camera.
+
+        Parameters
+        ----------
+        camera : Lucam
+            Open camera.
+        owner : bool
+            If True, close() closes the camera.
+
+        """
+        self.camera = camera
+        self._owner = owner
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            1, thread_name_prefix='AsyncLucam')
+
+    @classmethod
+    async def open(cls, number=1, api=None):
+        """Return AsyncLucam of camera opened in a worker thread."""
+        loop = asyncio.get_running_loop()
+        camera = await loop.run_in_executor(None, Lucam, number, api)
+        return cls(camera, owner=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """Wait for pending calls, close camera if owned, and stop thread."""
+        if self._owner and self.camera._handle:
+            await self.call(self.camera.CameraClose)
+        self._executor.shutdown(wait=False)
+
+    async def call(self, func, *args, **kwargs):
+        """Return result of camera method or function run in camera thread.
+
+        func is a callable or the name of a Lucam method.
+
+        """
+        if isinstance(func, str):
+            func = getattr(self.camera, func)
+        return await self._run(None, func, *args, **kwargs)
+
+    async def TakeSnapshot(self, snapshot=None, out=None, validate=True):
+        """Return single image taken with still imaging, see Lucam."""
+        return await self._run(self.camera.CancelTakeFastFrame,
+                               self.camera.TakeSnapshot, snapshot, out,
+                               validate)
+
+    async def TakeFastFrame(self, out=None, validate=True):
+        """Return single image in fast frames mode, see Lucam."""
+        return await self._run(self.camera.CancelTakeFastFrame,
+                               self.camera.TakeFastFrame, out, validate)
+
+    async def ForceTakeFastFrame(self, out=None, validate=True):
+        """Return single image in fast frames mode, see Lucam."""
+        return await self._run(self.camera.CancelTakeFastFrame,
+                               self.camera.ForceTakeFastFrame, out, validate)
+
+    async def TakeFastFrameNoTrigger(self, out=None, validate=True):
+        """Return previous image in fast frames mode, see Lucam."""
+        return await self._run(self.camera.CancelTakeFastFrame,
+                               self.camera.TakeFastFrameNoTrigger, out,
+                               validate)
+
+    async def TakeVideo(self, numframes, out=None, validate=True):
+        """Return video frames of running stream, see Lucam."""
+        return await self._run(self.camera.CancelTakeVideo,
+                               self.camera.TakeVideo, numframes, out,
+                               validate)
+
+    async def LucamAutoFocusWait(self, timeout):
+        """Wait for completion of auto focus calibration, see Lucam."""
+        return await self._run(self.camera.LucamAutoFocusStop,
+                               self.camera.LucamAutoFocusWait, timeout)
+
+    def frames(self, numslots=4):
+        """Return FrameStream over frames streamed by camera."""
+        return FrameStream(self, numslots)
+
+    async def _run(self, cancel, func, *args, **kwargs):
+        """Return result of func run in camera thread.
+
+        If the coroutine is cancelled while func runs, cancel() is called
+        to abort func, and func is awaited before CancelledError is raised,
+        such that the camera thread is free for the next call.
+
+        """
+        future = self._executor.submit(func, *args, **kwargs)
+        result = asyncio.wrap_future(future)
+        try:
+            return await asyncio.shield(result)
+        except asyncio.CancelledError:
+            if future.cancel():
+                raise  # func was waiting for a previous call
+            if cancel is not None:
+                try:
+                    cancel()
+                except LucamError:
+                    pass  # call completed meanwhile
+            try:
+                await result
+            except LucamError:
+                pass  # Cancelled
+            raise
+
+
+class FrameStream(object):
+    """Async iterator over frames streamed by camera.
+
+    Frames are copied by the streaming callback into numslots preallocated
+    slots. Frame data of the last returned frame are valid until the
+    iterator advances. Frames arriving while no slot is free are dropped.
+
+    """
+
+    def __init__(self, camera, numslots=4):
+        """Initialize stream. Streaming starts on first use.
+
+        Parameters
+        ----------
+        camera : AsyncLucam
+            Camera to stream from.
+        numslots : int
+            Number of frames waiting to be consumed, plus the one being
+            consumed.
+
+        """
+        if numslots < 2:
+            raise ValueError("stream needs at least two slots")
+        self.camera = camera
+        self.numslots = int(numslots)
+        self.received = 0  # frames passed to callback
+        self.dropped = 0  # frames without free slot
+        self.delivered = 0  # frames returned by iterator
+        self._slots = None
+        self._addresses = None
+        self._slotsize = 0
+        self._free = queue.SimpleQueue()
+        self._queue = None
+        self._loop = None
+        self._held = None
+        self._callbackid = None
+        self._closed = False
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._held is not None:
+            self._free.put(self._held)
+            self._held = None
+        if self._slots is None and not self._closed:
+            await self.start()
+        if self._closed and (self._queue is None or self._queue.empty()):
+            raise StopAsyncIteration
+        item = await self._queue.get()
+        if item is None:
+            raise StopAsyncIteration
+        slot, sequence, timestamp = item
+        self._held = slot
+        self.delivered += 1
+        return Frame(self._slots[slot], sequence, timestamp)
+
+    async def start(self):
+        """Allocate slots, register callback, and start streaming."""
+        if self._slots is not None:
+            return
+        lucam = self.camera.camera
+        shape, dtype = frame_shape(lucam.GetFormat()[0], lucam._byteorder)
+        self._slots = empty_aligned((self.numslots, ) + shape, dtype)
+        self._addresses = [s.ctypes.data for s in self._slots]
+        self._slotsize = self._slots[0].nbytes
+        for slot in range(self.numslots):
+            self._free.put(slot)
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        await self.camera.call(self._start)
+
+    def _start(self):
+        """Register callback and start streaming. Run in camera thread."""
+        lucam = self.camera.camera
+        self._callbackid = lucam.AddStreamingCallback(self._callback)
+        try:
+            lucam.StreamVideoControl('start_streaming')
+        except LucamError:
+            lucam.RemoveStreamingCallback(self._callbackid)
+            self._callbackid = None
+            raise
+
+    async def close(self):
+        """Stop streaming and end iteration."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._callbackid is not None:
+            await self.camera.call(self._stop)
+        if self._queue is not None:
+            self._queue.put_nowait(None)
+
+    def _stop(self):
+        """Stop streaming and remove callback. Run in camera thread."""
+        lucam = self.camera.camera
+        lucam.StreamVideoControl('stop_streaming')
+        lucam.RemoveStreamingCallback(self._callbackid)
+        self._callbackid = None
+
+    def stats(self):
+        """Return dictionary of stream statistics."""
+        return dict(received=self.received, dropped=self.dropped,
+                    delivered=self.delivered,
+                    queued=self._queue.qsize() if self._queue else 0)
+
+    def _callback(self, context, pointer, size):
+        """Copy frame to free slot. API.VideoFilterCallback."""
+        timestamp = time.perf_counter()
+        sequence = self.received
+        self.received += 1
+        try:
+            slot = self._free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return
+        ctypes.memmove(self._addresses[slot], pointer,
+                       min(size, self._slotsize))
+        try:
+            self._loop.call_soon_threadsafe(
+                self._queue.put_nowait, (slot, sequence, timestamp))
+        except RuntimeError:
+            pass  # event loop closed
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+# lucam_benchmark.py
+
+"""Benchmarks of the Lucam frame processing paths.
+
+Run ``python -m ScopeFoundryHW.lumenera_lucam.lucam_benchmark`` to print
+the timings of all benchmarks. The LuCam API backend is selected by the
+LUCAM_API environment variable; with LUCAM_API=simulated the "DLL" columns
+measure the NumPy camera simulator instead of lucamapi.dll.
+
+"""
+import os
+import sys
+import time
+import tempfile
+
+import numpy
+
+from .lucam import API, Lucam, LucamError
+from .lucam_demosaic import demosaic, METHODS
+from .lucam_h5 import dataset_options, write_datasets
+
+__all__ = ['benchmark_demosaic', 'benchmark_h5', 'benchmark_snapshot',
+           'main']
+
+# sensor sizes of Lu165, Infinity 2, and Infinity 4-11 cameras
+SIZES = ((1392, 1040), (1616, 1216), (4008, 2672))
+
+# HDF5 (compression, level, shuffle)
+CODECS = (('none', 0, False), ('lzf', 0, False), ('lzf', 0, True),
+          ('gzip', 1, False), ('gzip', 1, True), ('gzip', 4, False),
+          ('gzip', 4, True), ('gzip', 9, True))
+
+
+def timeit(func, repeat=10):
+    """Return minimum run time of func in seconds."""
+    func()  # warm up caches and thread pools
+    result = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        result = min(result, time.perf_counter() - start)
+    return result
+
+
+def open_camera(api=None):
+    """Return Lucam instance, or None if no camera can be opened."""
+    try:
+        return Lucam(1, api=api)
+    except (LucamError, NotImplementedError, OSError):
+        return None
+
+
+def benchmark_demosaic(sizes=SIZES, repeat=10, threads=(1, None),
+                       camera=None, file=sys.stdout):
+    """Print run times of NumPy demosaicing and LucamConvertFrameToRgb24.
+
+    Parameters
+    ----------
+    sizes : sequence of (width, height)
+        Sizes of the raw Bayer frames.
+    repeat : int
+        Number of timed conversions. The minimum time is reported.
+    threads : sequence of int or None
+        Thread counts passed to demosaic().
+    camera : Lucam or None
+        Camera used for the DLL conversion. If None, the DLL path is not
+        benchmarked.
+
+    Return list of (width, height, bits, method, output, threads, seconds).
+
+    """
+    rng = numpy.random.default_rng(0)
+    results = []
+    print("%-10s %4s %-18s %-6s %7s %9s %8s" % (
+        'size', 'bits', 'method', 'output', 'threads', 'ms', 'Mpx/s'),
+        file=file)
+
+    def report(width, height, bits, method, output, nthreads, seconds):
+        results.append((width, height, bits, method, output, nthreads,
+                        seconds))
+        print("%-10s %4i %-18s %-6s %7s %9.2f %8.1f" % (
+            '%ix%i' % (width, height), bits, method, output,
+            'all' if nthreads is None else nthreads, seconds * 1e3,
+            width * height / seconds * 1e-6), file=file)
+
+    for width, height in sizes:
+        for bits, dtype, pformat in ((8, 'uint8', API.LUCAM_PF_8),
+                                     (16, 'uint16', API.LUCAM_PF_16)):
+            raw = rng.integers(0, 2**bits, (height, width), dtype=dtype)
+            rgb24 = numpy.empty((height, width, 3), numpy.uint8)
+            rgb48 = numpy.empty((height, width, 3), numpy.uint16)
+            for method in METHODS:
+                for nthreads in threads:
+                    for output, out in (('rgb24', rgb24), ('rgb48', rgb48)):
+                        if bits == 8 and output == 'rgb48':
+                            continue
+                        seconds = timeit(
+                            lambda: demosaic(raw, out, method, bgr=True,
+                                             threads=nthreads), repeat)
+                        report(width, height, bits, method, output,
+                               nthreads, seconds)
+            if camera is None:
+                continue
+            frameformat = API.LUCAM_FRAME_FORMAT(
+                width=width, height=height, pixelFormat=pformat,
+                binningX=1, binningY=1)
+            for name in ('fast', 'high_quality', 'higher_quality'):
+                conversion = API.LUCAM_CONVERSION(
+                    DemosaicMethod=Lucam.DEMOSAIC_METHOD[name],
+                    CorrectionMatrix=API.LUCAM_CM_NONE)
+                try:
+                    seconds = timeit(
+                        lambda: camera.ConvertFrameToRgb24(
+                            frameformat, raw, conversion, out=rgb24), repeat)
+                except LucamError as exc:
+                    print("DLL %s: %s" % (name, exc), file=file)
+                    continue
+                report(width, height, bits, 'dll_' + name, 'rgb24', 1,
+                       seconds)
+    return results
+
+
+def typical_frames(width=1616, height=1216, camera=None):
+    """Return dictionary of synthetic or camera frames saved by LucamMeasure.
+
+    Synthetic frames are smooth images with Poisson noise: a 12 bit raw
+    Bayer frame in 16 bit samples, an RGB24 image, and a float32 mean.
+
+    """
+    rng = numpy.random.default_rng(0)
+    y, x = numpy.ogrid[:height, :width]
+    signal = 1000 + 1500 * numpy.cos(x / width * 3) * numpy.sin(y / height * 2)
+    raw = rng.poisson(numpy.abs(signal)).astype(numpy.uint16) << 4
+    frames = {
+        'raw16': raw,
+        'rgb24': numpy.repeat((raw >> 8).astype(numpy.uint8)[..., None], 3,
+                              axis=2),
+        'mean_float32': (raw.astype(numpy.float32)[..., None] *
+                         numpy.float32([0.9, 1.0, 1.1]))}
+    if camera is not None:
+        data = camera.TakeSnapshot()
+        frames['camera_raw'] = data.copy()
+        frames['camera_rgb24'] = camera.conversion_plan()(data).copy()
+        camera.release_frame(data)
+    return frames
+
+
+def benchmark_h5(frames=None, codecs=CODECS, repeat=3, chunk_rows=None,
+                 camera=None, file=sys.stdout):
+    """Print HDF5 write throughput and file size of frames per codec.
+
+    Parameters
+    ----------
+    frames : dict of numpy arrays, or None
+        Frames written to one dataset each. By default typical_frames().
+    codecs : sequence of (compression, level, shuffle)
+        Arguments of lucam_h5.dataset_options.
+    repeat : int
+        Number of timed writes. The minimum time is reported.
+    chunk_rows : int or None
+        Rows per chunk. If None, h5py chooses the chunk shape.
+
+    Return list of (frame, compression, level, shuffle, MB/s, size ratio).
+
+    """
+    import h5py
+
+    if frames is None:
+        frames = typical_frames(camera=camera)
+    results = []
+    print("%-14s %-6s %5s %7s %9s %9s %7s" % (
+        'frame', 'codec', 'level', 'shuffle', 'MB', 'MB/s', 'ratio'),
+        file=file)
+    with tempfile.TemporaryDirectory() as tempdir:
+        filename = os.path.join(tempdir, 'benchmark.h5')
+        for name, data in frames.items():
+            for compression, level, shuffle in codecs:
+                options = dataset_options(compression, level, shuffle,
+                                          (chunk_rows, ) if chunk_rows
+                                          else None)
+
+                def write():
+                    with h5py.File(filename, 'w') as h5file:
+                        write_datasets(h5file, {name: data}, options)
+
+                seconds = timeit(write, repeat)
+                ratio = os.path.getsize(filename) / data.nbytes
+                results.append((name, compression, level, shuffle,
+                                data.nbytes / seconds * 1e-6, ratio))
+                print("%-14s %-6s %5s %7s %9.1f %9.1f %7.3f" % (
+                    name, compression, level if compression == 'gzip' else '',
+                    shuffle, data.nbytes * 1e-6,
+                    data.nbytes / seconds * 1e-6, ratio), file=file)
+    return results
+
+
+def benchmark_snapshot(camera, repeat=100, file=sys.stdout):
+    """Print overhead of snapshot settings and time of TakeSnapshot.
+
+    Compares building LUCAM_SNAPSHOT with default_snapshot(), which queries
+    the frame format, exposure and gain, to the cached snapshot_settings(),
+    and TakeSnapshot with either.
+
+    Return dictionary of seconds per call.
+
+    """
+    out = camera.TakeSnapshot()
+    results = {
+        'default_snapshot': timeit(camera.default_snapshot, repeat),
+        'snapshot_settings': timeit(camera.snapshot_settings, repeat),
+        'TakeSnapshot(default_snapshot())': timeit(
+            lambda: camera.TakeSnapshot(camera.default_snapshot(), out=out,
+                                        validate=False), repeat // 10 or 1),
+        'TakeSnapshot()': timeit(
+            lambda: camera.TakeSnapshot(out=out, validate=False),
+            repeat // 10 or 1)}
+    for name, seconds in results.items():
+        print("%-34s %10.1f us" % (name, seconds * 1e6), file=file)
+    return results
+
+
+def main():
+    """Run all benchmarks with camera 1 if available."""
+    camera = open_camera()
+    if camera is None:
+        print("no camera available, skipping DLL benchmarks")
+    print("\nDemosaicing raw Bayer frames\n")
+    benchmark_demosaic(camera=camera)
+    print("\nWriting frames to HDF5\n")
+    benchmark_h5(camera=camera)
+    if camera is not None:
+        print("\nSnapshot settings overhead\n")
+        benchmark_snapshot(camera)
+
+
+if __name__ == '__main__':
+    main()
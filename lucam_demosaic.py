@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+# lucam_demosaic.py
+
+"""Demosaic raw Bayer frames of Lumenera(r) cameras with NumPy.
+
+*demosaic* converts 8 or 16 bit raw Bayer data, as returned by the Lucam
+wrapper in LUCAM_PF_8 or LUCAM_PF_16 pixel format, to RGB or BGR images
+using one of these methods:
+
+nearest
+    Each color is copied from the nearest pixel of that color within the
+    2x2 Bayer cell. Fastest, with color fringes at edges.
+bilinear
+    Missing colors are averaged from the neighbouring pixels of that color.
+malvar
+    Edge-aware linear interpolation by Malvar, He and Cutler (1), which
+    corrects bilinear estimates by the gradient of the known color.
+
+Unlike the LucamConvertFrameToRgb24 function of lucamapi.dll, the output
+can have 16 bit samples (RGB48), is written to caller-supplied arrays, and
+does not require a camera. Large frames are split into tiles of rows that
+are demosaiced in a thread pool; NumPy releases the GIL in the arithmetic.
+
+References
+----------
+(1) H S Malvar, L He, and R Cutler. High-quality linear interpolation for
+    demosaicing of Bayer-patterned color images. ICASSP 2004.
+
+Examples
+--------
+>>> raw = numpy.random.randint(0, 4096, (1216, 1616)).astype('uint16') << 4
+>>> rgb = demosaic(raw, method='malvar', pattern='rggb')
+>>> rgb.shape, rgb.dtype
+((1216, 1616, 3), dtype('uint16'))
+
+"""
+import os
+import threading
+import concurrent.futures
+
+import numpy
+
+__all__ = ['demosaic', 'METHODS', 'PATTERNS']
+
+METHODS = ('nearest', 'bilinear', 'malvar')
+
+# LUCAM_PROP_COLOR_FORMAT values and colors of the 2x2 Bayer cell
+PATTERNS = {
+    'rggb': 'rggb',
+    'grbg': 'grbg',
+    'gbrg': 'gbrg',
+    'bggr': 'bggr',
+    8: 'rggb',
+    9: 'grbg',
+    10: 'gbrg',
+    11: 'bggr'}
+
+TILE_ROWS = 256  # rows per tile processed by a worker thread
+HALO = 2  # rows and columns of context needed by the 5x5 Malvar kernels
+
+# Malvar-He-Cutler kernels as {(dy, dx): weight}, to be divided by 8
+MALVAR_GREEN = {  # G at R or B pixels
+    (0, 0): 4, (-1, 0): 2, (1, 0): 2, (0, -1): 2, (0, 1): 2,
+    (-2, 0): -1, (2, 0): -1, (0, -2): -1, (0, 2): -1}
+MALVAR_ROW = {  # R or B at G pixels with R or B left and right
+    (0, 0): 5, (0, -1): 4, (0, 1): 4, (-1, -1): -1, (-1, 1): -1,
+    (1, -1): -1, (1, 1): -1, (0, -2): -1, (0, 2): -1,
+    (-2, 0): 0.5, (2, 0): 0.5}
+MALVAR_COLUMN = {  # R or B at G pixels with R or B above and below
+    (dx, dy): w for (dy, dx), w in MALVAR_ROW.items()}
+MALVAR_DIAGONAL = {  # R at B pixels or B at R pixels
+    (0, 0): 6, (-1, -1): 2, (-1, 1): 2, (1, -1): 2, (1, 1): 2,
+    (-2, 0): -1.5, (2, 0): -1.5, (0, -2): -1.5, (0, 2): -1.5}
+
+BILINEAR_CROSS = {(-1, 0): 2, (1, 0): 2, (0, -1): 2, (0, 1): 2}
+BILINEAR_ROW = {(0, -1): 4, (0, 1): 4}
+BILINEAR_COLUMN = {(-1, 0): 4, (1, 0): 4}
+BILINEAR_DIAGONAL = {(-1, -1): 2, (-1, 1): 2, (1, -1): 2, (1, 1): 2}
+IDENTITY = {(0, 0): 8}
+
+KERNELS = {
+    # method: (same, cross, row, column, diagonal)
+    'bilinear': (IDENTITY, BILINEAR_CROSS, BILINEAR_ROW, BILINEAR_COLUMN,
+                 BILINEAR_DIAGONAL),
+    'malvar': (IDENTITY, MALVAR_GREEN, MALVAR_ROW, MALVAR_COLUMN,
+               MALVAR_DIAGONAL)}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def demosaic(raw, out=None, method='bilinear', pattern='rggb', bgr=False,
+             dtype=None, shift=None, threads=None):
+    """Return RGB image interpolated from raw Bayer data.
+
+    Parameters
+    ----------
+    raw : numpy array
+        Raw Bayer frame of shape (height, width) and type uint8 or uint16
+        of any byte order. Height and width must be even.
+    out : numpy array, or None
+        Output array of shape (height, width, 3) or (height, width, 4).
+        Only the first three samples of each pixel are written.
+        If None, a new array of shape (height, width, 3) is returned.
+    method : str
+        Interpolation method. One of METHODS.
+    pattern : str or int
+        Colors of the top left 2x2 Bayer cell, or the LUCAM_CF_BAYER value
+        of the camera's 'color_format' property. One of PATTERNS.
+    bgr : bool
+        If True, samples are ordered blue, green, red like the output of
+        LucamConvertFrameToRgb24.
+    dtype : numpy.dtype or None
+        Type of new output array. If None, the type of raw is used.
+    shift : int or None
+        Number of bits raw values are shifted right for the output.
+        If None, the difference in bits of the input and output types.
+    threads : int or None
+        Maximum number of threads demosaicing tiles of rows concurrently.
+        If None, the number of CPUs. If 1, the frame is processed in the
+        calling thread.
+
+    """
+    if method not in METHODS:
+        raise ValueError("unknown demosaic method %r" % method)
+    try:
+        pattern = PATTERNS[pattern]
+    except (KeyError, TypeError):
+        raise ValueError("unsupported Bayer pattern %r" % (pattern, ))
+    if raw.ndim != 2 or raw.shape[0] % 2 or raw.shape[1] % 2:
+        raise ValueError("raw frame must be 2D with even height and width")
+    height, width = raw.shape
+    if out is None:
+        out = numpy.empty((height, width, 3),
+                          raw.dtype if dtype is None else dtype)
+    elif out.shape[:2] != raw.shape or out.shape[2] not in (3, 4):
+        raise ValueError("output array does not match raw frame shape")
+    if shift is None:
+        if numpy.issubdtype(out.dtype, numpy.integer):
+            shift = 8 * (raw.dtype.itemsize - out.dtype.itemsize)
+        else:
+            shift = 0
+    channels = 'bgr' if bgr else 'rgb'
+
+    if threads is None:
+        threads = os.cpu_count() or 1
+    tiles = [(y, min(y + TILE_ROWS, height))
+             for y in range(0, height, TILE_ROWS)]
+    if threads < 2 or len(tiles) < 2:
+        for y0, y1 in tiles:
+            _demosaic_tile(raw, out, y0, y1, method, pattern, channels, shift)
+        return out
+    futures = [executor().submit(_demosaic_tiles, raw, out, tiles[i::threads],
+                                 method, pattern, channels, shift)
+               for i in range(min(threads, len(tiles)))]
+    for future in futures:
+        future.result()
+    return out
+
+
+def executor():
+    """Return thread pool shared by demosaic calls."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                os.cpu_count() or 1, thread_name_prefix='demosaic')
+        return _executor
+
+
+def _demosaic_tiles(raw, out, tiles, method, pattern, channels, shift):
+    """Demosaic sequence of (first row, last row) tiles of raw frame."""
+    for y0, y1 in tiles:
+        _demosaic_tile(raw, out, y0, y1, method, pattern, channels, shift)
+
+
+def _demosaic_tile(raw, out, y0, y1, method, pattern, channels, shift):
+    """Demosaic rows y0 to y1 of raw frame into out."""
+    out = out[y0:y1]
+    if numpy.issubdtype(out.dtype, numpy.integer):
+        maxval = numpy.iinfo(out.dtype).max
+    else:
+        maxval = None
+
+    if method == 'nearest':
+        raw = raw[y0:y1]
+        for py in (0, 1):
+            for px in (0, 1):
+                for channel, color in enumerate(channels):
+                    cy, cx = _nearest(pattern, color, py)
+                    plane = raw[cy::2, cx::2]
+                    if shift > 0:
+                        plane = plane >> shift
+                    elif shift < 0:
+                        plane = plane.astype(out.dtype) << -shift
+                    out[py::2, px::2, channel] = plane
+        return
+
+    # copy rows with halo to float32, mirroring at frame borders
+    height = raw.shape[0]
+    top = max(y0 - HALO, 0)
+    bottom = min(y1 + HALO, height)
+    tile = numpy.pad(raw[top:bottom].astype(numpy.float32),
+                     ((HALO - (y0 - top), HALO - (bottom - y1)),
+                      (HALO, HALO)),
+                     mode='reflect')
+    scale = 2.0 ** -shift / 8.0
+    rows, cols = y1 - y0, raw.shape[1]
+    same, cross, row, column, diagonal = KERNELS[method]
+    for py in (0, 1):
+        for px in (0, 1):
+            here = pattern[py * 2 + px]
+            for channel, color in enumerate(channels):
+                if color == here:
+                    kernel = same
+                elif here != 'g':
+                    kernel = cross if color == 'g' else diagonal
+                elif pattern[py * 2 + 1 - px] == color:
+                    kernel = row
+                else:
+                    kernel = column
+                plane = _convolve(tile, kernel, py, px, rows, cols)
+                plane *= scale
+                if maxval is not None:
+                    numpy.clip(plane, 0, maxval, out=plane)
+                    numpy.rint(plane, out=plane)
+                out[py::2, px::2, channel] = plane
+
+
+def _convolve(tile, kernel, py, px, rows, cols):
+    """Return kernel applied to pixels of one Bayer phase of tile."""
+    result = None
+    for (dy, dx), weight in kernel.items():
+        y = HALO + py + dy
+        x = HALO + px + dx
+        plane = tile[y:y + rows:2, x:x + cols:2]
+        if result is None:
+            result = plane * weight
+        elif weight == 1:
+            result += plane
+        else:
+            result += plane * weight
+    return result
+
+
+def _nearest(pattern, color, py):
+    """Return position in Bayer cell of color, preferring row py."""
+    positions = [(i // 2, i % 2) for i, c in enumerate(pattern) if c == color]
+    for position in positions:
+        if position[0] == py:
+            return position
+    return positions[0]
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+# lucam_h5.py
+
+"""Write Lumenera(r) camera data to HDF5 files in a background thread.
+
+*H5Writer* runs write jobs, e.g. creating datasets and closing files, in
+one thread fed by a bounded queue, such that acquisition does not wait for
+compression and disk I/O unless the queue is full.
+
+*FrameRecorder* appends streamed frames to a chunked, resizable HDF5
+dataset from a writer thread fed by a preallocated frame queue. Frames
+arriving while the queue is full are dropped and counted.
+
+*dataset_options* returns the create_dataset keyword arguments for one of
+the COMPRESSION filters, and *storage_array* converts float64 results to
+float32, optionally only within an absolute tolerance, e.g. *mean_atol*,
+half the quantization step of averaged frames.
+
+Examples
+--------
+>>> writer = H5Writer()
+>>> h5file = h5py.File('frames.h5', 'w')
+>>> writer.submit(write_datasets, h5file, {'image': image},
+...               dataset_options('lzf', shuffle=True))
+>>> writer.submit(h5file.close)
+>>> writer.flush()
+
+"""
+import atexit
+import queue
+import threading
+import traceback
+
+import numpy
+
+__all__ = ['H5Writer', 'FrameRecorder', 'dataset_options', 'storage_array',
+           'mean_atol', 'write_datasets', 'COMPRESSION']
+
+COMPRESSION = ('none', 'lzf', 'gzip')
+
+
+def dataset_options(compression='gzip', level=4, shuffle=False, chunks=None):
+    """Return dictionary of h5py create_dataset compression arguments.
+
+    Parameters
+    ----------
+    compression : str
+        One of COMPRESSION.
+    level : int
+        Compression level of gzip filter, 1 (fast) to 9 (small).
+    shuffle : bool
+        If True, apply the byte shuffle filter before compression, which
+        helps multi-byte samples compress.
+    chunks : tuple of int, True, or None
+        Chunk shape. If None, h5py chooses chunks for compressed datasets.
+
+    """
+    if compression not in COMPRESSION:
+        raise ValueError("unknown compression %r" % compression)
+    options = {}
+    if compression == 'lzf':
+        options['compression'] = 'lzf'
+    elif compression == 'gzip':
+        options['compression'] = 'gzip'
+        options['compression_opts'] = int(level)
+    if shuffle and compression != 'none':
+        options['shuffle'] = True
+    if chunks is not None:
+        options['chunks'] = chunks
+    return options
+
+
+def storage_array(data, float32=True, atol=None):
+    """Return data, or float64 data converted to float32.
+
+    Float32 keeps 24 significant bits, which exceeds the precision of means
+    of 16 bit frames. If atol is not None, data are converted only if no
+    value changes by more than atol, e.g. half the quantization step of the
+    source frames. Data exceeding the float32 range are never converted.
+
+    """
+    data = numpy.asarray(data)
+    if not float32 or data.dtype != numpy.float64:
+        return data
+    finite = data[numpy.isfinite(data)]
+    if finite.size and numpy.abs(finite).max() > numpy.finfo('float32').max:
+        return data
+    result = data.astype(numpy.float32)
+    if atol is None or numpy.allclose(result, data, rtol=0, atol=atol,
+                                      equal_nan=True):
+        return result
+    return data
+
+
+def mean_atol(numframes, bits=8):
+    """Return half the quantization step of the mean of integer frames.
+
+    The step is given in the 8 bit intensity scale of images converted from
+    frames of bits depth. It does not exceed the step in units of the raw
+    frames, so it is a safe tolerance for both.
+
+    """
+    return 0.5 * 2.0**(8 - max(bits, 8)) / max(numframes, 1)
+
+
+def write_datasets(group, data, options=None, float32=True, atol=None):
+    """Create datasets in HDF5 group from dictionary of arrays.
+
+    Float64 arrays are stored as float32 if float32 is True, see
+    storage_array. Scalars are written without compression, which HDF5
+    does not support.
+
+    """
+    if options is None:
+        options = {}
+    for name, value in data.items():
+        value = storage_array(value, float32, atol)
+        if value.ndim == 0:
+            group.create_dataset(name, data=value)
+            continue
+        kwargs = dict(options)
+        chunks = kwargs.get('chunks')
+        if isinstance(chunks, tuple):
+            # clip chunk shape to dataset shape, append missing dimensions
+            chunks = chunks[:value.ndim] + value.shape[len(chunks):]
+            kwargs['chunks'] = tuple(max(min(c, s), 1) for c, s in
+                                     zip(chunks, value.shape))
+        group.create_dataset(name, data=value, **kwargs)
+
+
+class H5Writer(object):
+    """Thread running write jobs in order.
+
+    Jobs are queued by submit, which blocks while maxsize jobs are pending.
+    Exceptions raised by jobs are printed and counted.
+
+    """
+
+    def __init__(self, maxsize=4):
+        """Initialize writer. The thread is started by the first job."""
+        self.maxsize = maxsize
+        self.written = 0
+        self.errors = 0
+        self._queue = queue.Queue(maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """Queue call of func(*args, **kwargs) in writer thread."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='H5Writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+        self._queue.put((func, args, kwargs))
+
+    def pending(self):
+        """Return number of jobs not yet done."""
+        return self._queue.unfinished_tasks
+
+    def flush(self):
+        """Wait until all queued jobs are done."""
+        self._queue.join()
+
+    def close(self):
+        """Run pending jobs and stop thread."""
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        """Run jobs until None is queued."""
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                func, args, kwargs = job
+                func(*args, **kwargs)
+                self.written += 1
+            except Exception:
+                self.errors += 1
+                traceback.print_exc()
+            finally:
+                self._queue.task_done()
+
+
+class FrameRecorder(object):
+    """Append frames to resizable HDF5 datasets in a writer thread.
+
+    Frames are copied into one of queue_frames preallocated slots and
+    written in order to the dataset '<name>' of shape (n, *shape), chunked
+    by frames_per_chunk frames. Sequence numbers and timestamps are written
+    to the datasets '<name>_sequence' and '<name>_timestamp'. The put
+    method never blocks: if all slots are in use, the frame is dropped.
+
+    Examples
+    --------
+    >>> recorder = FrameRecorder(h5file, (1216, 1616), 'uint16')
+    >>> dispatcher.subscribe(recorder.put)
+    >>> recorder.close()
+    >>> recorder.stats()['dropped']
+    0
+
+    """
+
+    def __init__(self, group, shape, dtype, frames_per_chunk=1,
+                 queue_frames=64, options=None, name='frames', limit=None):
+        """Create datasets and start writer thread.
+
+        Parameters
+        ----------
+        group : h5py.Group
+            Group in which datasets are created.
+        shape : tuple of int
+            Shape of frames.
+        dtype : numpy.dtype
+            Type of frames.
+        frames_per_chunk : int
+            Number of frames per HDF5 chunk.
+        queue_frames : int
+            Number of preallocated frames waiting to be written.
+            Memory use is queue_frames times the frame size.
+        options : dict or None
+            Compression arguments of create_dataset, see dataset_options.
+            The chunks argument is ignored.
+        name : str
+            Name of frame dataset.
+        limit : int or None
+            Maximum number of frames accepted. Later frames are ignored.
+
+        """
+        self.shape = tuple(shape)
+        self.dtype = numpy.dtype(dtype)
+        self.frames_per_chunk = max(int(frames_per_chunk), 1)
+        options = dict(options or {})
+        options.pop('chunks', None)
+        self.dataset = group.create_dataset(
+            name, (0, ) + self.shape, self.dtype,
+            maxshape=(None, ) + self.shape,
+            chunks=(self.frames_per_chunk, ) + self.shape, **options)
+        self.sequences = group.create_dataset(
+            name + '_sequence', (0, ), numpy.int64, maxshape=(None, ),
+            chunks=(1024, ))
+        self.timestamps = group.create_dataset(
+            name + '_timestamp', (0, ), numpy.float64, maxshape=(None, ),
+            chunks=(1024, ))
+        self.limit = limit
+        self.accepted = 0
+        self.recorded = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_queued = 0
+        self._slots = numpy.empty((queue_frames, ) + self.shape, self.dtype)
+        self._free = queue.SimpleQueue()
+        for i in range(queue_frames):
+            self._free.put(i)
+        self._filled = queue.SimpleQueue()
+        self._lock = threading.Lock()  # serializes put of worker threads
+        self._closed = False
+        self._thread = threading.Thread(target=self._run,
+                                        name='FrameRecorder', daemon=True)
+        self._thread.start()
+
+    def put(self, frame):
+        """Queue copy of Frame for writing, or drop it if queue is full."""
+        if frame.data.shape != self.shape:
+            raise ValueError("frame shape %s does not match %s"
+                             % (frame.data.shape, self.shape))
+        with self._lock:
+            if self._closed or self.accepted == self.limit:
+                return
+            try:
+                index = self._free.get_nowait()
+            except queue.Empty:
+                self.dropped += 1
+                return
+            numpy.copyto(self._slots[index], frame.data, casting='unsafe')
+            self._filled.put((index, frame.sequence, frame.timestamp))
+            self.accepted += 1
+            queued = len(self._slots) - self._free.qsize()
+            if queued > self.max_queued:
+                self.max_queued = queued
+
+    def close(self):
+        """Write queued frames, trim datasets, and stop writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._filled.put(None)
+        self._thread.join()
+
+    def done(self):
+        """Return True if limit frames were accepted."""
+        return self.accepted == self.limit
+
+    def stats(self):
+        """Return dictionary of recording statistics."""
+        return dict(accepted=self.accepted, recorded=self.recorded,
+                    dropped=self.dropped,
+                    queued=len(self._slots) - self._free.qsize(),
+                    max_queued=self.max_queued, errors=self.errors)
+
+    def _run(self):
+        """Append queued frames to datasets until None is queued."""
+        # frames of one chunk are collected and written at once, such that
+        # compressed chunks are not read back for each frame
+        chunk = self.frames_per_chunk
+        block = numpy.empty((chunk, ) + self.shape, self.dtype)
+        sequences = numpy.empty(chunk, numpy.int64)
+        timestamps = numpy.empty(chunk, numpy.float64)
+        count = 0
+        while True:
+            item = self._filled.get()
+            if item is not None:
+                index, sequences[count], timestamps[count] = item
+                if chunk == 1:
+                    self._write(self._slots[index:index + 1], sequences,
+                                timestamps)
+                    self._free.put(index)
+                    continue
+                block[count] = self._slots[index]
+                self._free.put(index)
+                count += 1
+            if count and (count == chunk or item is None):
+                self._write(block[:count], sequences[:count],
+                            timestamps[:count])
+                count = 0
+            if item is None:
+                break
+
+    def _write(self, frames, sequences, timestamps):
+        """Append frames and their sequence numbers and timestamps."""
+        n = self.recorded
+        size = n + len(frames)
+        try:
+            for dataset in (self.dataset, self.sequences, self.timestamps):
+                dataset.resize(size, axis=0)
+            self.dataset[n:size] = frames
+            self.sequences[n:size] = sequences
+            self.timestamps[n:size] = timestamps
+            self.recorded = size
+        except Exception:
+            self.errors += 1
+            traceback.print_exc()
@@ -4,12 +4,15 @@ Created on Dec 9, 2022
 @author: Benedikt Ursprung
 '''
 from functools import partial
-import ctypes
+import threading
 
 from ScopeFoundry.hardware import HardwareComponent
 
 
-from .lucam import LucamEnumCameras, Lucam, CAMERA_MODEL
+from .lucam import (API, LucamEnumCameras, Lucam, CAMERA_MODEL, FrameRing,
+                    FrameDispatcher)
+from .lucam_multi import camera_number
+from .lucam_planner import plan_formats
 
 
 class LucamHW(HardwareComponent):
@@ -19,10 +22,17 @@ class LucamHW(HardwareComponent):
 
     name = 'lucam'
 
+    # frame bus formats: name of conversion method or None for raw frames
+    FRAME_FORMATS = {'raw': None, 'grey': 'convert_to_grey',
+                     'rgb': 'convert_to_rgb24'}
+
     def setup(self):
 
         S = self.settings
         S.New('camera_number', int, initial=1)
+        S.New('camera_serial', int, initial=0,
+              description='if not 0, open the camera with this serial number '
+                          'instead of camera_number')
         S.New('camera_model', str, ro=True)
         choices = [(k, v) for k, v in Lucam.PIXEL_FORMAT.items()]
         S.New('pixel_format',
@@ -38,13 +48,43 @@ class LucamHW(HardwareComponent):
         S.New('height', int, vmin=8, initial=8, unit='px')
         S.New('frame_rate', initial=100.0,
               choices=[], description='for streaming')
+        S.New('target_fps', float, initial=30.0, vmin=0.0, unit='Hz',
+              description='frame rate the planned format must reach')
+        S.New('min_bits', int, initial=8, vmin=8, vmax=16,
+              description='minimum bits per pixel of the planned format')
+        S.New('measure_formats', int, initial=0, vmin=0,
+              description='number of best planned formats whose frame rate '
+                          'is measured, results are cached per camera model')
+        S.New('ring_slots', int, initial=8, vmin=2,
+              description='number of frames buffered while streaming')
+        S.New('ring_policy', str, initial='overwrite',
+              choices=FrameRing.POLICY,
+              description='overwrite oldest frame or drop new frame '
+                          'if the streaming buffer is full')
+        S.New('streaming_workers', int, initial=1, vmin=1,
+              description='threads converting and distributing streamed '
+                          'frames')
+        S.New('refresh_capabilities', bool, initial=False,
+              description='query property ranges and frame rates from camera '
+                          'on connect instead of using the cached table')
+        S.New('property_cache', bool, initial=False,
+              description='serve property reads from memory, '
+                          'takes effect on connect')
+        S.New('property_cache_ttl', float, initial=1.0, unit='s',
+              description='time cached property values are valid')
 
         for name, value in Lucam.PROPERTY.items():
             S.New(name, type(value), initial=value)
 
+        self._ring = None
+        self._dispatcher = None
+        self._applied_format = None  # (settings, camera format) of last write
+        self._bus_lock = threading.RLock()
+
         self.add_operation('snapshot', self.read_snapshot)
         self.add_operation('write format', self.write_format)
         self.add_operation('read format', self.read_format)
+        self.add_operation('plan format', self.plan_format)
 
     def connect(self):
 
@@ -54,11 +94,17 @@ class LucamHW(HardwareComponent):
             print(self.name, 'found cameras\n',
                   *[f"{i+1} {cam.serialnumber}" for i, cam in enumerate(LucamEnumCameras())])
 
+        if S['camera_serial']:
+            S['camera_number'] = camera_number(S['camera_serial'])
         self.dev = lucam = Lucam(S['camera_number'])
+        self._applied_format = None
+        if S['property_cache']:
+            lucam.enable_property_cache(S['property_cache_ttl'])
 
-        S.frame_rate.change_choice_list(self.get_available_frame_rates())
+        caps = lucam.capabilities(refresh=S['refresh_capabilities'])
+        S.frame_rate.change_choice_list(caps['frame_rates'])
 
-        for name in Lucam.PROPERTY:
+        for name in caps['properties']:
             S.get_lq(name).connect_to_hardware(partial(lucam.GetProperty, name),
                                                partial(lucam.SetProperty, name))
 
@@ -66,8 +112,7 @@ class LucamHW(HardwareComponent):
         S.get_lq('camera_model').read_from_hardware()
 
         for d in ('width', 'height'):
-            value, _ = lucam.GetProperty(f'max_{d}')
-            S.get_lq(d).change_min_max(8, value)
+            S.get_lq(d).change_min_max(8, caps[f'max_{d}'])
 
         self.read_format()
 
@@ -75,7 +120,7 @@ class LucamHW(HardwareComponent):
         return self.dev.GetFormat()[0]
 
     def get_available_frame_rates(self):
-        return self.dev.EnumAvailableFrameRates()
+        return self.dev.capabilities()['frame_rates']
 
     def get_camera_model(self):
         return CAMERA_MODEL[self.dev.GetCameraId()]
@@ -93,19 +138,104 @@ class LucamHW(HardwareComponent):
         self.dev.StreamVideoControl('stop_streaming')
         self.dev.RemoveStreamingCallback(callback_id)
 
+    def start_ring(self):
+        '''
+        starts streaming into a FrameRing buffer and returns it.
+        Frames are read with ring.reader().read()
+        '''
+        S = self.settings
+        ring = FrameRing(self.get_format(), S['ring_slots'], S['ring_policy'],
+                         self.dev._byteorder)
+        self.dev.StreamVideoControl('start_streaming')
+        ring.attach(self.dev)
+        return ring
+
+    def subscribe(self, callback, fmt='rgb', max_rate=None):
+        '''
+        subscribes callback(frame) to the frame bus and returns an id.
+        The camera streams while any subscriber exists. frame.data is the
+        raw frame, or the grey or RGB image, according to fmt. Each
+        representation is computed once per frame and shared between
+        subscribers. At most max_rate frames per second are delivered.
+        '''
+        convert = self.FRAME_FORMATS[fmt]
+        if convert is not None:
+            convert = getattr(self, convert)
+        with self._bus_lock:
+            if self._dispatcher is None:
+                self._dispatcher = FrameDispatcher(
+                    None, self.settings['streaming_workers'])
+            subscriber_id = self._dispatcher.subscribe(callback, convert,
+                                                       max_rate)
+            if self._ring is None:
+                self._start_bus()
+        return subscriber_id
+
+    def unsubscribe(self, subscriber_id):
+        '''removes subscriber and stops streaming if it was the last one'''
+        with self._bus_lock:
+            if not self._dispatcher.unsubscribe(subscriber_id):
+                self._stop_bus()
+                self._dispatcher = None
+
+    def bus_stats(self):
+        '''returns statistics of the frame bus, see FrameDispatcher.stats'''
+        with self._bus_lock:
+            if self._dispatcher is None:
+                return {}
+            return self._dispatcher.stats()
+
+    def _start_bus(self):
+        self._ring = self.start_ring()
+        self._dispatcher.ring = self._ring
+        self._dispatcher.start()
+
+    def _stop_bus(self):
+        if self._ring is None:
+            return
+        self._dispatcher.stop()
+        self.stop_ring(self._ring)
+        self._ring = None
+
+    def stop_ring(self, ring):
+        self.dev.StreamVideoControl('stop_streaming')
+        ring.detach()
+        if self.settings['debug_mode']:
+            print(self.name, 'ring buffer', ring.stats())
+
     def disconnect(self):
         if not hasattr(self, 'dev'):
             return
+        with self._bus_lock:
+            self._stop_bus()
+            self._dispatcher = None
+        if self.settings['debug_mode'] and self.dev.property_cache:
+            print(self.name, 'property cache', self.dev.property_cache.stats())
         self.dev.CameraClose()
 
     def convert_to_rgb24(self, frame_pointer):
-        '''RGB images can only be obtained with conversion?'''
-        return self.dev.ConvertFrameToRgb24(self.get_format(), frame_pointer)[:, :, ::-1]
+        '''converts raw frame to RGB image using the cached conversion plan
+        of the current frame format. The image is owned by the caller, it
+        is new or recycled from arrays passed to dev.release_frame. Safe to
+        call from several frame bus workers.'''
+        frame_format = self.dev.conversion_plan().frameformat
+        return self.dev.ConvertFrameToRgb24(frame_format,
+                                            frame_pointer)[:, :, ::-1]
+
+    def convert_to_grey(self, frame_pointer):
+        '''converts raw frame to 8 or 16 bit greyscale image, depending on
+        the pixel format. The image is owned by the caller, see
+        convert_to_rgb24.'''
+        frame_format = self.dev.conversion_plan().frameformat
+        if frame_format.pixelFormat == API.LUCAM_PF_16:
+            return self.dev.ConvertFrameToGreyscale16(frame_format,
+                                                      frame_pointer)
+        return self.dev.ConvertFrameToGreyscale8(frame_format, frame_pointer)
 
     def read_snapshot(self):
-        frame_pointer = self.dev.TakeSnapshot().ctypes.data_as(
-            ctypes.POINTER(ctypes.c_byte))
-        image = self.convert_to_rgb24(frame_pointer)
+        data = self.dev.TakeSnapshot()
+        image = self.convert_to_rgb24(data)
+        self.dev.release_frame(data)
         return image
 
     def read_format(self):
@@ -120,8 +250,90 @@ class LucamHW(HardwareComponent):
         self.settings['frame_rate'] = rate
         return frame_format
 
-    def write_format(self):
-        self.dev.StreamVideoControl('stop_streaming')
+    def write_format(self, force=False):
+        '''
+        applies the format settings to the camera unless they equal those of
+        the last call and the camera format was not changed since, e.g. by
+        dev.SetFormat or CameraReset. Streaming, and the frame bus, are
+        stopped for the change and restarted only if they were running.
+        If only the frame rate changed, the frame bus keeps running and
+        streaming is paused while the rate is set.
+        Returns True if the camera format was set.
+        '''
+        with self._bus_lock:
+            requested = self._format_settings()
+            device = self._device_format()
+            applied = self._applied_format
+            if not force and applied == (requested, device):
+                return False
+            # the frame size is unchanged, so the ring fits the frames
+            rate_only = (not force and applied is not None
+                         and applied[0][:-1] == requested[:-1]
+                         and applied[1][:-1] == device[:-1])
+            restart_bus = self._ring is not None and not rate_only
+            if restart_bus:
+                self._stop_bus()
+            # LucamSetFormat fails while streaming
+            streaming = self.dev._streaming is not None
+            if streaming:
+                self.dev.StreamVideoControl('stop_streaming')
+            self._applied_format = None
+            self._set_format()
+            self._applied_format = (requested, self._device_format())
+            if streaming and not restart_bus:
+                self.dev.StreamVideoControl('start_streaming')
+            if restart_bus:
+                self._start_bus()
+            if self.settings['debug_mode']:
+                print(self.name, 'format set', requested)
+            return True
+
+    def plan_format(self):
+        '''
+        applies the best frame format covering the region of interest given
+        by the offset and size settings, at target_fps and min_bits, see
+        lucam_planner.plan_formats. Formats are measured only while the
+        camera is not streaming. Returns the list of candidates.
+        '''
+        S = self.settings
+        roi = (S['x_offset'], S['y_offset'], S['width'], S['height'])
+        with self._bus_lock:
+            measure = S['measure_formats']
+            if self._ring is not None or self.dev._streaming is not None:
+                measure = 0
+            candidates = plan_formats(self.dev, roi, S['min_bits'],
+                                      S['target_fps'] or None,
+                                      measure=measure)
+            best = candidates[0]
+            f = best.frameformat
+            S['x_offset'] = f.xOffset
+            S['y_offset'] = f.yOffset
+            S['width'] = f.width
+            S['height'] = f.height
+            S['pixel_format'] = f.pixelFormat
+            S['x_binning'] = f.binningX
+            S['y_binning'] = f.binningY
+            S['frame_rate'] = best.framerate
+            self.write_format()
+        if S['debug_mode']:
+            for c in candidates:
+                print(self.name, 'planned format', c)
+        return candidates
+
+    def _device_format(self):
+        frame_format, rate = self.dev.GetFormat(cached=True)
+        return (frame_format.xOffset, frame_format.yOffset,
+                frame_format.width, frame_format.height,
+                frame_format.pixelFormat, frame_format.binningX,
+                frame_format.binningY, rate)
+
+    def _format_settings(self):
+        S = self.settings
+        return (S['x_offset'], S['y_offset'], S['width'], S['height'],
+                S['pixel_format'], S['x_binning'], S['y_binning'],
+                S['frame_rate'])
+
+    def _set_format(self):
         S = self.settings
         self.dev.SetFormat(
             Lucam.FrameFormat(S['x_offset'],
@@ -4,21 +4,30 @@ Created on Dec 9, 2022
 @author: Benedikt Ursprung
 '''
 from datetime import datetime
+import threading
 import time
 import os
 
 import pyqtgraph as pg
-from qtpy import QtWidgets
+from qtpy import QtCore, QtWidgets
 import numpy as np
 
 from ScopeFoundry import Measurement, h5_io
 from ScopeFoundry.helper_funcs import sibling_path, load_qt_ui_file
 
+from .lucam import (API, LucamError, frame_shape, LatestFrame,
+                    PreTriggerCapture)
+from .lucam_stats import FrameAccumulator, RunningStats, to_rgb, convert_mean
+from .lucam_h5 import (H5Writer, FrameRecorder, COMPRESSION, dataset_options,
+                       write_datasets, mean_atol)
+
 
 class LucamMeasure(Measurement):
 
     name = "lucam"
 
+    histogram_period = 0.5  # s between histogram updates of the display
+
     def setup(self):
 
         self.hw = self.app.hardware['lucam']
@@ -27,16 +36,99 @@ class LucamMeasure(Measurement):
         S.New('save_tif', bool, initial=False, ro=False)
         S.New('save_ini', bool, initial=False, ro=False)
         S.New('save_h5', bool, initial=True, ro=False)
+        S.New('compression', str, initial='gzip', choices=COMPRESSION,
+              description='HDF5 compression filter')
+        S.New('compression_level', int, initial=4, vmin=1, vmax=9,
+              description='gzip compression level')
+        S.New('shuffle', bool, initial=False,
+              description='byte shuffle before compression, '
+                          'helps 16 bit data')
+        S.New('chunk_rows', int, initial=0, vmin=0,
+              description='rows per HDF5 chunk, 0 lets h5py choose')
+        S.New('store_float32', bool, initial=True,
+              description='store float64 results as float32 if no value '
+                          'changes by more than half the quantization step '
+                          'of the mean of N_avg frames')
+        S.New('save_queue', int, ro=True,
+              description='HDF5 files waiting to be written')
         S.New('mode',
               str,
               choices=('streaming',
+                       'streaming_lazy',
                        'averaging',
                        'averaging_bg',
+                       'statistics',
+                       'recording',
+                       'pretrigger',
+                       'burst',
                        'snapshot'),
               initial='streaming')
         S.New('bg_subtract', bool, initial=False)
         S.New('N_avg', int, initial=100)
+        S.New('avg_source', str, initial='fast_frames',
+              choices=('fast_frames', 'video'),
+              description='acquisition used by averaging modes')
+        S.New('accumulator', str, initial='uint32',
+              choices=('uint32', 'float32'),
+              description='type of the raw frame sum in averaging modes')
+        S.New('stats_format', str, initial='raw',
+              choices=('raw', 'grey', 'rgb'),
+              description='frames of which statistics mode computes '
+                          'per-pixel mean, variance, min and max')
+        S.New('record_frames', int, initial=0, vmin=0,
+              description='frames recorded in recording mode, '
+                          '0 records until stopped')
+        S.New('frames_per_chunk', int, initial=1, vmin=1,
+              description='frames per HDF5 chunk in recording mode')
+        S.New('record_queue', int, initial=64, vmin=1,
+              description='frames buffered in memory for the HDF5 writer '
+                          'in recording mode')
+        S.New('frames_recorded', int, ro=True)
+        S.New('frames_dropped', int, ro=True,
+              description='frames lost because the writer or the frame bus '
+                          'fell behind')
+        S.New('pre_seconds', float, initial=1.0, unit='s',
+              description='time kept before a trigger in pretrigger mode')
+        S.New('pre_megabytes', float, initial=0.0, unit='MB',
+              description='memory kept before a trigger, '
+                          'overrides pre_seconds if not 0')
+        S.New('post_frames', int, initial=10, vmin=0,
+              description='frames captured after a trigger')
+        S.New('trigger_source', str, initial='software',
+              choices=PreTriggerCapture.TRIGGERS)
+        S.New('gpio_mask', int, initial=1,
+              description='GPIO input bits triggering on change')
+        S.New('trigger_threshold', float, initial=128.0,
+              description='mean frame value triggering on rising above')
+        S.New('capture_memory', float, ro=True, unit='MB',
+              description='memory allocated by pretrigger mode')
+        S.New('captures', int, ro=True,
+              description='pretrigger captures saved')
+        S.New('burst_frames', int, initial=100, vmin=1,
+              description='frames grabbed in burst mode')
+        S.New('burst_chunk', int, initial=32, vmin=1,
+              description='frames grabbed per TakeVideo call in burst mode')
+        S.New('burst_storage', str, initial='memory',
+              choices=('memory', 'memmap'),
+              description='memmap grabs into a file in save_dir, '
+                          'for bursts larger than RAM')
+        S.New('burst_max_rate', bool, initial=True,
+              description='set the highest available frame rate '
+                          'before a burst')
+        S.New('burst_fps', float, ro=True, spinbox_decimals=1,
+              description='frame rate achieved by the last burst')
         S.New('scale', float, initial=1.0, unit='um/px')
+        S.New('queue_depth', int, ro=True,
+              description='streamed frames waiting for conversion')
+        S.New('callback_time', float, ro=True, unit='us', spinbox_decimals=1,
+              description='mean duration of driver streaming callback')
+        S.New('latency', float, ro=True, unit='ms', spinbox_decimals=1,
+              description='mean time from frame arrival to conversion')
+        S.New('frames_received', int, ro=True,
+              description='frames received in streaming_lazy mode')
+        S.New('frames_converted', int, ro=True,
+              description='frames converted for display in streaming_lazy '
+                          'mode')
         S.get_lq('scale').add_listener(self.update_display)
 
         self.data = {'image': np.arange(4 * 4 * 3).reshape(4, 4, 3),
@@ -44,17 +136,347 @@ class LucamMeasure(Measurement):
 
         self.display_ready = False
         self._aquireing_bg = False
-
-    def take_avg_snapshots(self, N, data_dest='image'):
-        img = 0
-        for i in range(N):
-            if self.interrupt_measurement_called:
-                break
-            print('aquiring avg', i + 1)
-            img += self.hw.read_snapshot()
-            self.data[data_dest] = img / (i + 1)
-            self.display_ready = True
-            self.set_progress(100 * (i + 1) / N)
+        self.writer = H5Writer(maxsize=4)
+        self.capture = None  # PreTriggerCapture in pretrigger mode
+        self.add_operation('trigger', self.trigger)
+        self.image_seq = 0  # incremented by publish_image
+        self.latest_frame = None  # LatestFrame in streaming_lazy mode
+        self._latest_sequence = None
+        self._display_key = None
+        self._display_buffer = None
+        self._display_bg = (None, None)
+        self._saturation_title = None
+
+    def take_avg_frames(self, N, data_dest='image', batch=16):
+        '''
+        averages N raw frames and stores the mean as RGB image in
+        self.data[data_dest], converted like streamed frames. The preview
+        is updated at the display rate.
+        '''
+        S = self.settings
+        dev = self.hw.dev
+        frame_format = self.hw.get_format()
+        shape, dtype = frame_shape(frame_format, dev._byteorder)
+        accumulator = FrameAccumulator(shape, dtype, S['accumulator'])
+
+        def publish():
+            self.publish_image(convert_mean(dev, accumulator.mean(),
+                                            frame_format), data_dest)
+            self.set_progress(100 * accumulator.count / N)
+
+        def video_batches():
+            frames = np.empty((batch,) + shape, dtype)
+            dev.StreamVideoControl('start_streaming')
+            try:
+                taken = 0
+                while taken < N:
+                    n = min(batch, N - taken)
+                    dev.TakeVideo(n, out=frames[:n], validate=False)
+                    taken += n
+                    yield frames[:n]
+            finally:
+                dev.StreamVideoControl('stop_streaming')
+
+        def fast_frame_batches():
+            # the next frame is taken while the current one is accumulated
+            with dev.fast_frames(numframes=N) as frames:
+                for frame in frames:
+                    yield frame[np.newaxis]
+
+        if S['avg_source'] == 'video':
+            batches = video_batches()
+        else:
+            batches = fast_frame_batches()
+        try:
+            next_publish = time.perf_counter() + self.display_update_period
+            for frames in batches:
+                accumulator.add_frames(frames)
+                if self.interrupt_measurement_called:
+                    break
+                if time.perf_counter() > next_publish:
+                    publish()
+                    next_publish = (time.perf_counter() +
+                                    self.display_update_period)
+        finally:
+            batches.close()
+        publish()
+
+    def take_statistics(self, N, fmt='raw'):
+        '''
+        computes per-pixel mean, variance, min and max of N streamed frames
+        and stores the maps in self.data. The mean is displayed as RGB image.
+        '''
+        hw = self.hw
+        frame_format = hw.get_format()
+        lock = threading.Lock()
+        stats = None
+
+        def on_frame(frame):
+            nonlocal stats
+            with lock:
+                if stats is None:
+                    stats = RunningStats(frame.data.shape, frame.data.dtype,
+                                         limit=N)
+            stats.update(frame.data)
+
+        def publish(mean):
+            if fmt == 'raw':
+                mean = convert_mean(hw.dev, mean, frame_format)
+            elif fmt == 'grey':
+                mean = to_rgb(mean, frame_format.pixelFormat,
+                              API.LUCAM_CF_MONO)
+            self.publish_image(mean)
+            self.set_progress(100 * stats.count / N)
+
+        subscriber = hw.subscribe(on_frame, fmt)
+        try:
+            while not self.interrupt_measurement_called:
+                time.sleep(self.display_update_period)
+                self.update_metrics(hw.bus_stats(), subscriber)
+                if stats is None:
+                    continue
+                if stats.count >= N:
+                    break
+                publish(stats.mean.copy())
+        finally:
+            hw.unsubscribe(subscriber)
+        if stats is None:
+            return
+        maps = stats.maps()
+        self.data['frame_count'] = np.array([maps.pop('count')])
+        self.data.update(maps)
+        publish(maps['mean'])
+
+    def record(self):
+        '''
+        appends streamed raw frames with sequence numbers and timestamps to
+        the HDF5 measurement group until record_frames are recorded or the
+        measurement is stopped. Frames are shown at a reduced rate.
+        '''
+        S = self.settings
+        hw = self.hw
+        shape, dtype = frame_shape(hw.get_format(), hw.dev._byteorder)
+        options = dataset_options(S['compression'], S['compression_level'],
+                                  S['shuffle'])
+        H = h5_io.h5_base_file(app=self.app, measurement=self)
+        try:
+            M = h5_io.h5_create_measurement_group(measurement=self, h5group=H)
+            recorder = FrameRecorder(M, shape, dtype, S['frames_per_chunk'],
+                                     S['record_queue'], options,
+                                     limit=S['record_frames'] or None)
+            self.latest_frame = latest = LatestFrame(hw.convert_to_rgb24)
+            subscriber = hw.subscribe(recorder.put, 'raw')
+            viewer = hw.subscribe(latest.update, 'raw', max_rate=30)
+            try:
+                while not (self.interrupt_measurement_called or
+                           recorder.done()):
+                    time.sleep(0.050)
+                    self.update_recording(recorder, subscriber)
+            finally:
+                missed = self.update_recording(recorder, subscriber)
+                hw.unsubscribe(viewer)
+                hw.unsubscribe(subscriber)
+                self.latest_frame = None
+                recorder.close()
+            S['frames_recorded'] = recorder.recorded
+            recorder.dataset.attrs['dropped'] = recorder.dropped
+            recorder.dataset.attrs['bus_missed'] = missed
+            if S['record_frames']:
+                self.set_progress(100)
+        finally:
+            H.close()
+        self.log.info(f"recorded {recorder.stats()}, bus missed {missed}")
+
+    def update_recording(self, recorder, subscriber):
+        '''updates metrics and returns number of frames missed by the bus'''
+        S = self.settings
+        stats = self.hw.bus_stats()
+        self.update_metrics(stats, subscriber)
+        missed = stats.get('missed', 0)
+        S['frames_recorded'] = recorder.recorded
+        S['frames_dropped'] = recorder.dropped + missed
+        if S['record_frames']:
+            self.set_progress(100 * recorder.accepted / S['record_frames'])
+        return missed
+
+    def capture_pretrigger(self):
+        '''
+        keeps the last pre_seconds or pre_megabytes of raw frames in memory
+        and saves them with post_frames following frames to a new HDF5 file
+        on each trigger, until the measurement is stopped.
+        '''
+        S = self.settings
+        hw = self.hw
+        frame_format, frame_rate = hw.dev.GetFormat()
+        pre_frames = PreTriggerCapture.frames_for(
+            frame_format, S['pre_seconds'], frame_rate,
+            S['pre_megabytes'] * 1e6 if S['pre_megabytes'] else None,
+            hw.dev._byteorder)
+        capture = PreTriggerCapture(
+            frame_format, pre_frames, S['post_frames'], self.save_capture,
+            hw.dev._byteorder, S['trigger_source'], S['gpio_mask'],
+            threshold=S['trigger_threshold'])
+        S['capture_memory'] = capture.nbytes * 1e-6
+        S['captures'] = 0
+        self.latest_frame = latest = LatestFrame(hw.convert_to_rgb24)
+        viewer = hw.subscribe(latest.update, 'raw', max_rate=30)
+        capture.arm(hw.dev)
+        self.capture = capture
+        try:
+            while not self.interrupt_measurement_called:
+                time.sleep(0.050)
+                S['captures'] = capture.saved
+        finally:
+            self.capture = None
+            capture.disarm()
+            hw.unsubscribe(viewer)
+            self.latest_frame = None
+        S['captures'] = capture.saved
+        self.log.info(f"pretrigger {capture.stats()}")
+
+    def trigger(self):
+        '''software trigger of pretrigger mode'''
+        if self.capture is not None:
+            self.capture.trigger()
+
+    def save_capture(self, frames, sequences, timestamps, trigger):
+        '''writes pretrigger capture to a new HDF5 file, called in the
+        background by PreTriggerCapture'''
+        S = self.settings
+        options = dataset_options(S['compression'], S['compression_level'],
+                                  S['shuffle'], (1, ))
+        fname = self.new_filename('_trigger%i' % trigger['sequence'])
+        with h5_io.h5_base_file(app=self.app, fname=fname,
+                                measurement=self) as H:
+            M = h5_io.h5_create_measurement_group(measurement=self, h5group=H)
+            write_datasets(M, {'frames': frames, 'frames_sequence': sequences,
+                               'frames_timestamp': timestamps}, options)
+            for key, value in trigger.items():
+                M['frames'].attrs['trigger_' + key] = (
+                    'none' if value is None else value)
+
+    def new_filename(self, suffix='', ext='h5'):
+        '''returns a file name in save_dir following data_fname_format'''
+        f = self.app.settings['data_fname_format'].format(
+            app=self.app,
+            measurement=self,
+            timestamp=datetime.now(),
+            ext=ext)
+        fname = os.path.join(self.app.settings['save_dir'], f)
+        return fname[:-len(ext) - 1] + suffix + '.' + ext
+
+    def burst(self):
+        '''
+        grabs burst_frames raw frames into one preallocated array or memory
+        mapped file, then saves them to HDF5. With burst_max_rate, the
+        camera streams at the maximum frame rate during the burst only.
+        '''
+        S = self.settings
+        hw = self.hw
+        S['burst_fps'] = 0.0
+        if not S['burst_max_rate']:
+            self._burst()
+            return
+        frame_rate = hw.settings['frame_rate']
+        hw.settings['frame_rate'] = max(hw.get_available_frame_rates())
+        try:
+            hw.write_format()
+            self._burst()
+        finally:
+            hw.settings['frame_rate'] = frame_rate
+            hw.write_format()
+
+    def _burst(self):
+        S = self.settings
+        hw = self.hw
+        shape, dtype = frame_shape(hw.get_format(), hw.dev._byteorder)
+        N = S['burst_frames']
+        mapname = None
+        if S['burst_storage'] == 'memmap':
+            mapname = self.new_filename('_burst', 'npy')
+            frames = np.lib.format.open_memmap(mapname, 'w+', dtype,
+                                               (N,) + shape)
+        else:
+            frames = np.empty((N,) + shape, dtype)
+            frames.fill(0)  # fault in pages before the burst
+
+        t0 = time.perf_counter()
+        count, times = self.take_burst(frames, S['burst_chunk'])
+        if count:
+            S['burst_fps'] = count / (times[-1] - t0)
+            self.publish_image(hw.convert_to_rgb24(frames[count - 1]).copy())
+            self.log.info(f"burst {count} frames {S['burst_fps']:.1f} fps")
+        else:
+            self.log.info("burst no frames")
+
+        if count and S['save_h5']:
+            self.save_burst(frames[:count], np.array(times) - t0)
+        if mapname is not None:
+            del frames
+            if count and S['save_h5']:
+                os.remove(mapname)
+
+    def take_burst(self, frames, chunk=32):
+        '''
+        grabs len(frames) frames into frames with TakeVideo, chunk frames
+        per call. Stopping the measurement cancels TakeVideo. Returns the
+        number of frames grabbed and the time after each call.
+        '''
+        dev = self.hw.dev
+        done = threading.Event()
+
+        def watch():
+            while not done.wait(0.02):
+                if self.interrupt_measurement_called:
+                    try:
+                        dev.CancelTakeVideo()
+                    except LucamError:
+                        pass
+                    return
+
+        watcher = threading.Thread(target=watch, daemon=True)
+        count = 0
+        times = []
+        dev.StreamVideoControl('start_streaming')
+        watcher.start()
+        try:
+            while count < len(frames):
+                if self.interrupt_measurement_called:
+                    break
+                n = min(chunk, len(frames) - count)
+                try:
+                    dev.TakeVideo(n, out=frames[count:count + n],
+                                  validate=False)
+                except LucamError:
+                    if self.interrupt_measurement_called:
+                        break  # cancelled
+                    raise
+                count += n
+                times.append(time.perf_counter())
+                self.set_progress(100 * count / len(frames))
+        finally:
+            done.set()
+            watcher.join()
+            dev.StreamVideoControl('stop_streaming')
+        return count, times
+
+    def save_burst(self, frames, times, chunk=32):
+        '''writes burst frames to HDF5, chunk frames at a time, such that
+        memory mapped bursts are not read into memory at once'''
+        S = self.settings
+        options = dataset_options(S['compression'], S['compression_level'],
+                                  S['shuffle'])
+        with h5_io.h5_base_file(app=self.app, fname=self.new_filename(),
+                                measurement=self) as H:
+            M = h5_io.h5_create_measurement_group(measurement=self, h5group=H)
+            dataset = M.create_dataset('frames', frames.shape, frames.dtype,
+                                       chunks=(1,) + frames.shape[1:],
+                                       **options)
+            for i in range(0, len(frames), chunk):
+                dataset[i:i + chunk] = frames[i:i + chunk]
+                self.set_progress(100 * (i + chunk) / len(frames))
+            dataset.attrs['fps'] = S['burst_fps']
+            M.create_dataset('frames_chunk_time', data=times)
 
     def setup_figure(self):
         hw = self.hw
@@ -78,12 +500,18 @@ class LucamMeasure(Measurement):
         channel_layout = QtWidgets.QGridLayout()
         controls_layout.addLayout(channel_layout)
         channel_layout.addWidget(
-            S.New_UI(include=('mode', 'bg_subtract', 'N_avg')))
+            S.New_UI(include=('mode', 'bg_subtract', 'N_avg', 'avg_source',
+                              'stats_format')))
         channel_layout.addWidget(S.activation.new_pushButton())
 
         # imview
         self.imview = pg.ImageView(view=pg.PlotItem())
         self.ui.centralwidget.layout().addWidget(self.imview)
+        # the histogram is recomputed in update_display at a lower rate
+        self.histogram = self.imview.getHistogramWidget().item
+        self.imview.getImageItem().sigImageChanged.disconnect(
+            self.histogram.imageChanged)
+        self._histogram_time = 0.0
         # self.circle = pg.CircleROI((10, 10), size=30)
         # self.imview.view.addItem(self.circle)
 
@@ -95,55 +523,152 @@ class LucamMeasure(Measurement):
 
         if S['mode'] == 'streaming':
             self.display_update_period = 0.01
-            callback_id = self.hw.start_streaming(self.streaming_callback)
-            time.sleep(0.050)
-            self.display_ready = True
-            while not self.interrupt_measurement_called:
-                time.sleep(0.050)
-            self.hw.stop_streaming(callback_id)
+            subscriber = self.hw.subscribe(self.on_frame, 'rgb')
+            try:
+                while not self.interrupt_measurement_called:
+                    time.sleep(0.050)
+                    self.update_metrics(self.hw.bus_stats(), subscriber)
+            finally:
+                self.hw.unsubscribe(subscriber)
+
+        if S['mode'] == 'streaming_lazy':
+            self.display_update_period = 0.01
+            self.latest_frame = latest = LatestFrame(self.hw.convert_to_rgb24)
+            subscriber = self.hw.subscribe(latest.update, 'raw')
+            try:
+                while not self.interrupt_measurement_called:
+                    time.sleep(0.050)
+                    self.update_metrics(self.hw.bus_stats(), subscriber)
+            finally:
+                self.hw.unsubscribe(subscriber)
+                self.latest_frame = None
+            frame = latest.get()
+            if frame is not None:
+                self.publish_image(frame.data.copy())
+            self.update_metrics(self.hw.bus_stats(), subscriber, latest)
 
         if S['mode'] == 'snapshot':
-            self.data['image'] = self.hw.read_snapshot()
+            self.publish_image(self.hw.read_snapshot())
             self.save_image()
 
         if S['mode'] == 'averaging':
+            self.display_update_period = 0.1
             N = self.settings['N_avg']
-            self.take_avg_snapshots(N, 'image')
+            self.take_avg_frames(N, 'image')
             self.save_image()
 
+        if S['mode'] == 'statistics':
+            self.display_update_period = 0.1
+            self.take_statistics(S['N_avg'], S['stats_format'])
+            self.save_image()
+
+        if S['mode'] == 'recording':
+            self.display_update_period = 0.05
+            self.record()
+
+        if S['mode'] == 'pretrigger':
+            self.display_update_period = 0.05
+            self.capture_pretrigger()
+
+        if S['mode'] == 'burst':
+            self.display_update_period = 0.1
+            self.burst()
+
         if S['mode'] == 'averaging_bg':
             self.settings['bg_subtract'] = False
             self._aquireing_bg = True
+            self.display_update_period = 0.1
             N = self.settings['N_avg']
-            self.take_avg_snapshots(N, 'bg_image')
+            self.take_avg_frames(N, 'bg_image')
             self.display_ready = False
             self._aquireing_bg = False
             self.settings['bg_subtract'] = True
 
-    def streaming_callback(self, context, frame_pointer, frame_size):
-        self.data['image'] = self.hw.convert_to_rgb24(frame_pointer)
+    def publish_image(self, image, data_dest='image'):
+        '''stores image in self.data and marks it for display'''
+        self.data[data_dest] = image
+        self.image_seq += 1
+        self.display_ready = True
+
+    def on_frame(self, frame):
+        self.publish_image(frame.data)
+
+    def update_metrics(self, stats, subscriber, latest=None):
+        S = self.settings
+        if latest is None:
+            latest = self.latest_frame
+        if latest is not None:
+            S['frames_received'] = latest.received
+            S['frames_converted'] = latest.converted
+        if subscriber not in stats.get('subscribers', ()):
+            return
+        S['queue_depth'] = stats['queue_depth']
+        S['callback_time'] = stats['callback_mean'] * 1e6
+        S['latency'] = stats['subscribers'][subscriber]['latency_mean'] * 1e3
+
+    def poll_latest_frame(self):
+        '''converts the latest streamed frame if it is new'''
+        latest = self.latest_frame
+        if latest is None or latest.sequence == self._latest_sequence:
+            return
+        frame = latest.get()
+        if frame is None:
+            return
+        self._latest_sequence = frame.sequence
+        self.publish_image(frame.data)
 
     def update_display(self):
+        '''
+        draws the latest image, downsampled to the on-screen pixel size.
+        Nothing is done if neither image nor view changed since the last
+        call. Levels and saturation are estimated from a subsample.
+        '''
+        self.poll_latest_frame()
         if not self.display_ready:
             return
 
         S = self.settings
-
-        if self._aquireing_bg:
-            img = 1.0 * self.data['bg_image']
-        else:
-            img = 1.0 * self.data['image']
-
-        if S['bg_subtract']:
-            img -= self.data['bg_image']
-
-        self.imview.setImage(img,
-                             # autoLevels=True
-                             )
-
-        saturation = img[:, :, :3].max() / \
+        name = 'bg_image' if self._aquireing_bg else 'image'
+        image = self.data[name]
+        bg_image = self.data['bg_image']
+        bg_subtract = S['bg_subtract'] and bg_image.shape == image.shape
+
+        step = self.display_step(image)
+        key = (self.image_seq, name, bg_subtract, step)
+        if key == self._display_key:
+            return
+        self._display_key = key
+
+        img = image[::step, ::step]
+        if bg_subtract:
+            buffer = self._display_buffer
+            if buffer is None or buffer.shape != img.shape:
+                buffer = self._display_buffer = np.empty(img.shape,
+                                                         np.float32)
+            np.subtract(img, self.display_background(bg_image, step),
+                        out=buffer, dtype=np.float32)
+            img = buffer
+
+        sample = img[::4, ::4]
+        low, high = float(sample.min()), float(sample.max())
+        item = self.imview.getImageItem()
+        first = item.image is None
+        item.setImage(img, autoLevels=False,
+                      levels=(low, max(high, low + 1)))
+        item.setRect(QtCore.QRectF(0, 0, image.shape[0], image.shape[1]))
+        if first:
+            self.imview.getView().getViewBox().autoRange()
+        now = time.perf_counter()
+        if now - self._histogram_time > self.histogram_period:
+            self._histogram_time = now
+            self.histogram.imageChanged()
+
+        saturation = float(sample[..., :3].max()) / \
             2**(8 * (self.hw.settings['pixel_format'] + 1))
-        self.imview.view.setTitle(f'max saturation value: {saturation:.0%}')
+        title = f'max saturation value: {saturation:.0%}'
+        if title != self._saturation_title:
+            self._saturation_title = title
+            self.imview.view.setTitle(title)
 
         # Nx, Ny = self.data['image'].shape[:2]
         # #i = self.imview.size()
@@ -151,6 +676,29 @@ class LucamMeasure(Measurement):
         # c = self.circle.size()
         # self.circle.setPos(((Nx - c[0]) / 2, (Ny - c[1]) / 2))
 
+    def display_background(self, bg_image, step):
+        '''returns contiguous float32 copy of bg_image downsampled by step,
+        cached until bg_image or step change'''
+        key, bg = self._display_bg
+        if key != (id(bg_image), step):
+            bg = np.ascontiguousarray(bg_image[::step, ::step], np.float32)
+            self._display_bg = ((id(bg_image), step), bg)
+        return bg
+
+    def display_step(self, image):
+        '''returns the stride at which image pixels are at least one
+        screen pixel apart'''
+        item = self.imview.getImageItem()
+        if item.image is None:
+            view = self.imview.getView().getViewBox()
+            width, height = view.width(), view.height()
+            if width < 1 or height < 1:
+                return 1
+            size = min(image.shape[0] / width, image.shape[1] / height)
+        else:
+            size = min(self.imview.getView().getViewBox().viewPixelSize())
+        return max(int(size), 1)
+
     def save_image(self):
         self.update_imshow_extent()
 
@@ -176,10 +724,41 @@ class LucamMeasure(Measurement):
             self.save_h5(fname)
 
     def save_h5(self, fname=None):
-        with h5_io.h5_base_file(app=self.app, fname=fname, measurement=self) as H:
+        '''
+        creates the file and writes settings, then queues the datasets to
+        the background writer. Blocks only if the writer queue is full.
+        '''
+        S = self.settings
+        H = h5_io.h5_base_file(app=self.app, fname=fname, measurement=self)
+        try:
             M = h5_io.h5_create_measurement_group(measurement=self, h5group=H)
-            for name, data in self.data.items():
-                M.create_dataset(name, data=data, compression='gzip')
+        except Exception:
+            H.close()
+            raise
+        # views, e.g. of conversion buffers, may change before written
+        data = {name: value.copy() if getattr(value, 'base', None) is not None
+                else value for name, value in self.data.items()}
+        chunks = (S['chunk_rows'], ) if S['chunk_rows'] else None
+        options = dataset_options(S['compression'], S['compression_level'],
+                                  S['shuffle'], chunks)
+        self.writer.submit(self._write_h5, H, M, data, options,
+                           S['store_float32'], self.float32_atol())
+        S['save_queue'] = self.writer.pending()
+
+    def float32_atol(self):
+        '''returns the error tolerated when storing float64 results as
+        float32, half the quantization step of the mean of N_avg frames of
+        the current pixel format'''
+        pixel_format = self.hw.settings['pixel_format']
+        bits = 8 if pixel_format == API.LUCAM_PF_8 else 16
+        return mean_atol(self.settings['N_avg'], bits)
+
+    def _write_h5(self, H, M, data, options, float32, atol):
+        try:
+            write_datasets(M, data, options, float32, atol)
+        finally:
+            H.close()
+            self.settings['save_queue'] = self.writer.pending() - 1
 
     def update_imshow_extent(self):
         Nx, Ny = self.data['image'].shape[:2]
@@ -0,0 +1,365 @@
+# -*- coding: utf-8 -*-
+# lucam_multi.py
+
+"""Acquire frames from several Lumenera(r) cameras in parallel.
+
+*CameraManager* enumerates the connected cameras with LucamEnumCameras,
+opens them concurrently, and addresses them by serial number. Acquisition
+runs in background threads, which copy frames into preallocated output
+sets, one per camera, and match frames of all cameras by timestamp:
+
+- 'synchronized' mode takes hardware synchronized snapshots of all cameras
+  with LucamTakeSynchronousSnapshots. Frames of one call share a timestamp.
+- 'free_running' mode streams each camera into a FrameRing, read by one
+  thread per camera. Frames whose timestamps differ by no more than a
+  tolerance are matched, other frames are discarded and counted.
+
+Matched frame tuples are returned by *CameraManager.read* in the order of
+the serial numbers. Their arrays are reused once the next tuple is read.
+If the reader falls behind, synchronized acquisition waits for free output
+sets, while free-running cameras drop frames.
+
+Examples
+--------
+>>> with CameraManager() as cameras:
+...     cameras[100001].SetFormat(frameformat, 30.0)
+...     cameras.start('free_running')
+...     for frames in cameras.frames(100):
+...         left, right = (frame.data for frame in frames)
+...     cameras.stop()
+
+"""
+import collections
+import copy
+import queue
+import threading
+import time
+
+from .lucam import (LucamEnumCameras, LucamSynchronousSnapshots, Frame,
+                    FrameRing, frame_shape, empty_aligned, open_cameras)
+
+__all__ = ['CameraManager', 'camera_number']
+
+
+def camera_number(serialnumber):
+    """Return number of connected camera with serial number for Lucam()."""
+    for i, version in enumerate(LucamEnumCameras()):
+        if version.serialnumber == serialnumber:
+            return i + 1
+    raise ValueError("no camera with serial number %i" % serialnumber)
+
+
+class CameraManager(object):
+    """Cameras addressed by serial number, acquiring matched frame tuples.
+
+    Attributes
+    ----------
+    serials : tuple of int
+        Serial numbers of the managed cameras, in the order of frame
+        tuples.
+    cameras : dict
+        Open Lucam instances by serial number.
+
+    """
+
+    MODES = ('synchronized', 'free_running')
+
+    def __init__(self, serials=None):
+        """Open cameras concurrently.
+
+        Parameters
+        ----------
+        serials : sequence of int, or None
+            Serial numbers of cameras to open. If None (default), all
+            connected cameras are opened.
+
+        """
+        numbers = collections.OrderedDict(
+            (version.serialnumber, i + 1)
+            for i, version in enumerate(LucamEnumCameras()))
+        if serials is None:
+            serials = list(numbers)
+        serials = [int(serial) for serial in serials]
+        for serial in serials:
+            if serial not in numbers:
+                raise ValueError("no camera with serial number %i" % serial)
+        self.serials = tuple(serials)
+        self.cameras = collections.OrderedDict(zip(
+            self.serials, open_cameras([numbers[s] for s in serials])))
+        self.mode = None
+        self.tolerance = 0.0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self._rings = []
+        self._sync = None
+        self._reset(0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getitem__(self, serial):
+        """Return Lucam instance of camera with serial number."""
+        return self.cameras[serial]
+
+    def __len__(self):
+        return len(self.cameras)
+
+    def start(self, mode='free_running', numsets=8, tolerance=None,
+              settings=None, numslots=8):
+        """Start acquisition of matched frame tuples.
+
+        Parameters
+        ----------
+        mode : str
+            'synchronized' or 'free_running'.
+        numsets : int
+            Number of preallocated output frames per camera, holding the
+            frames waiting to be matched or read.
+        tolerance : float or None
+            Maximum difference of timestamps in s of matched frames in
+            free-running mode. If None, half the shortest nominal frame
+            interval of the cameras.
+        settings : sequence of API.LUCAM_SNAPSHOT, or None
+            Snapshot settings of cameras in synchronized mode. If None
+            (default), the cameras' snapshot_settings() are used.
+        numslots : int
+            Number of frames buffered per camera while streaming in
+            free-running mode.
+
+        """
+        if mode not in CameraManager.MODES:
+            raise ValueError("unknown acquisition mode %r" % mode)
+        if self.mode is not None:
+            raise RuntimeError("acquisition is running")
+        if numsets < 2:
+            raise ValueError("at least two output sets are required")
+        cameras = list(self.cameras.values())
+        if mode == 'synchronized':
+            if settings is None:
+                settings = [copy.copy(camera.snapshot_settings())
+                            for camera in cameras]
+            formats = [s.format for s in settings]
+            self.tolerance = 0.0
+        else:
+            formats = [camera.GetFormat()[0] for camera in cameras]
+            if tolerance is None:
+                rates = [camera.GetFormat()[1] for camera in cameras]
+                tolerance = 0.5 / max(rates) if rates else 0.0
+            self.tolerance = tolerance
+        self._reset(len(cameras))
+        for camera, frameformat in zip(cameras, formats):
+            shape, dtype = frame_shape(frameformat, camera._byteorder)
+            self._sets.append(empty_aligned((numsets, ) + shape, dtype))
+            free = queue.SimpleQueue()
+            for slot in range(numsets):
+                free.put(slot)
+            self._free.append(free)
+        # frames waiting for a match may not block all output sets
+        self._maxpending = max(numsets // 2, 1)
+        self._stop.clear()
+        self.mode = mode
+        try:
+            if mode == 'synchronized':
+                self._sync = LucamSynchronousSnapshots(cameras, settings)
+                self._threads.append(threading.Thread(
+                    target=self._synchronized, name='CameraManager',
+                    daemon=True))
+            else:
+                for index, (camera, frameformat) in enumerate(
+                        zip(cameras, formats)):
+                    ring = FrameRing(frameformat, numslots, 'overwrite',
+                                     camera._byteorder)
+                    ring.attach(camera)
+                    self._rings.append(ring)
+                    camera.StreamVideoControl('start_streaming')
+                    self._threads.append(threading.Thread(
+                        target=self._free_running,
+                        args=(index, ring, ring.reader()),
+                        name='CameraManager-%i' % self.serials[index],
+                        daemon=True))
+        except Exception:
+            self._threads = []
+            self.stop()
+            raise
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """Stop acquisition. Matched frames not yet read remain readable."""
+        self._stop.set()
+        for camera, ring in zip(self.cameras.values(), self._rings):
+            camera.StreamVideoControl('stop_streaming')
+            ring.detach()
+        for thread in self._threads:
+            thread.join()
+        if self._sync is not None:
+            self._sync.Disable()
+        self._threads = []
+        self._rings = []
+        self._sync = None
+        with self._cond:
+            self.mode = None
+            self._cond.notify_all()
+
+    def close(self):
+        """Stop acquisition and close cameras."""
+        if self.mode is not None:
+            self.stop()
+        for camera in self.cameras.values():
+            if camera._handle:
+                camera.CameraClose()
+
+    def read(self, timeout=None):
+        """Return next tuple of matched Frames, or None on timeout or stop.
+
+        The frame arrays of the previously returned tuple are reused.
+
+        """
+        with self._cond:
+            self._release()
+            if not self._cond.wait_for(
+                    lambda: (self._matched or self.mode is None
+                             or self._error is not None), timeout):
+                return None
+            if self._error is not None:
+                error = self._error
+                self._error = None
+                raise error
+            if not self._matched:
+                return None
+            self._current = self._matched.popleft()
+            return tuple(frame for frame, slot in self._current)
+
+    def frames(self, count=None, timeout=None):
+        """Yield tuples of matched Frames until count, timeout, or stop."""
+        while count is None or count > 0:
+            frames = self.read(timeout)
+            if frames is None:
+                return
+            yield frames
+            if count is not None:
+                count -= 1
+
+    def stats(self):
+        """Return dictionary of acquisition statistics.
+
+        Per camera: 'received' frames copied into output sets, 'dropped'
+        frames without free output set, and 'unmatched' frames discarded.
+
+        """
+        with self._cond:
+            cameras = collections.OrderedDict(
+                (serial, dict(received=self._received[i],
+                              dropped=self._dropped[i],
+                              unmatched=self._unmatched[i],
+                              pending=len(self._pending[i])))
+                for i, serial in enumerate(self.serials))
+            return dict(mode=self.mode, matched=self.matched,
+                        queued=len(self._matched), cameras=cameras)
+
+    def _reset(self, numcams):
+        """Clear output sets, queues, and counters."""
+        self._sets = []
+        self._free = []
+        self._pending = [collections.deque() for _ in range(numcams)]
+        self._matched = collections.deque()
+        self._current = None
+        self._error = None
+        self._received = [0] * numcams
+        self._dropped = [0] * numcams
+        self._unmatched = [0] * numcams
+        self._maxpending = 1
+        self.matched = 0
+
+    def _release(self):
+        """Return output sets of last read tuple. Hold condition lock."""
+        if self._current is not None:
+            for free, (frame, slot) in zip(self._free, self._current):
+                free.put(slot)
+            self._current = None
+
+    def _put(self, index, frame, slot):
+        """Add frame of camera to match queue."""
+        with self._cond:
+            self._received[index] += 1
+            pending = self._pending[index]
+            pending.append((frame, slot))
+            if len(pending) > self._maxpending:
+                self._unmatched[index] += 1
+                self._free[index].put(pending.popleft()[1])
+            self._match()
+
+    def _match(self):
+        """Move matched frames to output queue. Hold condition lock."""
+        pending = self._pending
+        while all(pending):
+            timestamps = [p[0][0].timestamp for p in pending]
+            oldest = min(range(len(pending)), key=timestamps.__getitem__)
+            if max(timestamps) - timestamps[oldest] <= self.tolerance:
+                self._matched.append([p.popleft() for p in pending])
+                self.matched += 1
+                self._cond.notify_all()
+            else:
+                # oldest frame has no partner in other cameras
+                self._unmatched[oldest] += 1
+                self._free[oldest].put(pending[oldest].popleft()[1])
+
+    def _free_running(self, index, ring, reader):
+        """Copy streamed frames of camera into output sets."""
+        sets = self._sets[index]
+        free = self._free[index]
+        while not self._stop.is_set():
+            frame = reader.read(timeout=0.1)
+            if frame is None:
+                continue
+            try:
+                slot = free.get_nowait()
+            except queue.Empty:
+                with self._cond:
+                    self._dropped[index] += 1
+                continue
+            data = sets[slot]
+            data[...] = frame.data
+            if not ring.valid(frame):
+                # overwritten by camera while copying
+                free.put(slot)
+                with self._cond:
+                    self._dropped[index] += 1
+                continue
+            self._put(index, Frame(data, frame.sequence, frame.timestamp),
+                      slot)
+
+    def _synchronized(self):
+        """Take synchronized snapshots into output sets."""
+        sequence = 0
+        while not self._stop.is_set():
+            slots = []
+            for free in self._free:
+                while not self._stop.is_set():
+                    try:
+                        slots.append(free.get(timeout=0.1))
+                        break
+                    except queue.Empty:
+                        pass
+            if len(slots) < len(self._free):
+                for free, slot in zip(self._free, slots):
+                    free.put(slot)
+                return
+            out = [sets[slot] for sets, slot in zip(self._sets, slots)]
+            try:
+                self._sync.Take(out, validate=False)
+            except Exception as exc:
+                for free, slot in zip(self._free, slots):
+                    free.put(slot)
+                with self._cond:
+                    self._error = exc
+                    self._cond.notify_all()
+                return
+            timestamp = time.perf_counter()
+            for index, (data, slot) in enumerate(zip(out, slots)):
+                self._put(index, Frame(data, sequence, timestamp), slot)
+            sequence += 1
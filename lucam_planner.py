@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+# lucam_planner.py
+
+"""Plan Lumenera(r) camera frame formats for a target frame rate.
+
+*plan_formats* enumerates the LUCAM_FRAME_FORMATs covering a region of
+interest, at all binnings and raw pixel formats of sufficient bit depth,
+that the camera accepts: offsets and sizes are multiples of 8 and of the
+binning, and the frame lies within the max_width and max_height of the
+sensor. Candidates are ranked by a readout model, which scales the nominal
+frame rate by the number of sensor rows read and limits it by the
+bandwidth of the camera interface and by the exposure time.
+
+The model is approximate. *measure_fps* streams a candidate format and
+returns the real frame rate, which is stored in a persistent
+*MeasurementCache* per camera model and reused by subsequent plans.
+
+Examples
+--------
+>>> camera = Lucam(1)
+>>> plan = plan_formats(camera, (100, 200, 640, 480), min_bits=10,
+...                     target_fps=60.0, measure=2)
+>>> camera.SetFormat(plan[0].frameformat, plan[0].framerate)
+
+"""
+import collections
+import math
+import os
+import time
+
+import numpy
+
+from .lucam import API, CapabilityCache, FrameRing, frame_shape
+
+__all__ = ['plan_formats', 'measure_fps', 'predict_fps', 'frame_formats',
+           'FormatCandidate', 'MeasurementCache', 'MEASUREMENTS',
+           'INTERFACE_BANDWIDTH']
+
+# sustained bytes per second of Lucam.EXTERN_INTERFACE
+INTERFACE_BANDWIDTH = {1: 1.0e6, 2: 40e6}
+
+FormatCandidate = collections.namedtuple(
+    'FormatCandidate',
+    'frameformat framerate bits predicted_fps measured_fps bandwidth')
+FormatCandidate.__doc__ = """Frame format proposed by plan_formats.
+
+frameformat : API.LUCAM_FRAME_FORMAT
+framerate : float
+    Nominal frame rate to set with the format.
+bits : int
+    Bits per pixel delivered by the pixel format.
+predicted_fps : float
+    Frame rate predicted by the readout model.
+measured_fps : float or None
+    Frame rate measured by measure_fps, if available.
+bandwidth : float
+    Bytes per second transferred at the expected frame rate.
+
+"""
+
+
+class MeasurementCache(CapabilityCache):
+    """Persistent table of measured frame rates by camera model and format.
+
+    The table is stored as JSON in filename, by default in the file given
+    by the LUCAM_FORMATS environment variable or ~/.lucam/formats.json.
+
+    """
+
+    def __init__(self, filename=None):
+        """Initialize measurement table stored in JSON file."""
+        if filename is None:
+            filename = os.environ.get('LUCAM_FORMATS', os.path.join(
+                os.path.expanduser('~'), '.lucam', 'formats.json'))
+        CapabilityCache.__init__(self, filename)
+
+    def get(self, key):
+        """Return measurement stored for key or None."""
+        with self._lock:
+            if self._table is None:
+                self._table = self._load()
+            entry = self._table.get(key)
+        return None if entry is None else dict(entry)
+
+    @staticmethod
+    def key(cameraid, frameformat, framerate):
+        """Return table key of frame format on camera model."""
+        f = frameformat
+        return "%03X/%i,%i,%ix%i,%ix%i,%i@%g" % (
+            cameraid, f.xOffset, f.yOffset, f.width, f.height, f.binningX,
+            f.binningY, f.pixelFormat, framerate)
+
+
+MEASUREMENTS = MeasurementCache()
+
+
+def frame_formats(roi, max_width, max_height, binnings=(1, 2, 4, 8),
+                  pixelformats=(API.LUCAM_PF_8, API.LUCAM_PF_16)):
+    """Return list of valid frame formats covering region of interest.
+
+    Parameters
+    ----------
+    roi : tuple of int
+        (x, y, width, height) of region of interest in sensor pixels.
+        The region is enlarged to the nearest valid offsets and sizes and
+        shifted or cropped to fit the sensor.
+    max_width, max_height : int
+        Sensor size.
+    binnings : sequence of int
+        Binning factors, applied to both axes.
+    pixelformats : sequence of int
+        LUCAM_PF pixel formats.
+
+    """
+    x, y, width, height = (int(i) for i in roi)
+    if width < 1 or height < 1:
+        raise ValueError("invalid region of interest %r" % (roi, ))
+    result = []
+    for binning in binnings:
+        step = 8 * binning // math.gcd(8, binning)
+        xoffset, width_ = _span(x, width, step, max_width)
+        yoffset, height_ = _span(y, height, step, max_height)
+        if not width_ or not height_:
+            continue
+        for pixelformat in pixelformats:
+            result.append(API.LUCAM_FRAME_FORMAT(
+                xOffset=xoffset, yOffset=yoffset, width=width_,
+                height=height_, pixelFormat=pixelformat,
+                subSampleX=1, flagsX=0, subSampleY=1, flagsY=0,
+                binningX=binning, binningY=binning))
+    return result
+
+
+def _span(start, size, step, maximum):
+    """Return offset and size in multiples of step covering start+size."""
+    offset = max(start, 0) // 8 * 8
+    end = min(start + size, maximum)
+    size = min(-(-(end - offset) // step) * step, maximum // step * step)
+    offset = min(offset, (maximum - size) // 8 * 8)
+    return offset, max(size, 0)
+
+
+def predict_fps(frameformat, framerate, max_height, bandwidth=None,
+                exposure=None):
+    """Return frame rate predicted for frame format and nominal rate.
+
+    The nominal frame rate applies to full sensor frames. Readout time is
+    assumed proportional to the number of binned rows, and the frame rate
+    limited by the interface bandwidth in bytes per second and the
+    exposure time in ms.
+
+    """
+    f = frameformat
+    rows = f.height // f.binningY
+    fps = framerate * max_height / max(rows, 1)
+    if bandwidth:
+        fps = min(fps, bandwidth / _frame_bytes(f))
+    if exposure:
+        fps = min(fps, 1000.0 / exposure)
+    return fps
+
+
+def _frame_bytes(frameformat):
+    """Return number of bytes of frame."""
+    shape, dtype = frame_shape(frameformat)
+    return int(numpy.prod(shape)) * dtype.itemsize
+
+
+def plan_formats(camera, roi, min_bits=8, target_fps=None,
+                 binnings=(1, 2, 4, 8), measure=0, refresh=False,
+                 duration=1.0, cache=None):
+    """Return frame format candidates for region of interest, best first.
+
+    Parameters
+    ----------
+    camera : Lucam
+        Open camera. Its format is restored after measurements.
+    roi : tuple of int
+        (x, y, width, height) of region of interest in sensor pixels.
+    min_bits : int
+        Minimum bits per pixel. 16 bit formats deliver the true pixel depth
+        of the camera, which is known once the camera was planned for in a
+        16 bit format, else 16 is assumed.
+    target_fps : float or None
+        Required frame rate. If None, the fastest candidates rank first.
+    binnings : sequence of int
+        Binning factors to consider.
+    measure : int
+        Number of top ranked candidates to measure with measure_fps if no
+        measurement is cached.
+    refresh : bool
+        If True, measure candidates even if measurements are cached.
+    duration : float
+        Seconds to stream each measured candidate.
+    cache : MeasurementCache or None
+        Persistent table of measured frame rates. If None, MEASUREMENTS.
+
+    Candidates meeting the target frame rate rank first, by least binning,
+    least bandwidth, and least area, followed by the other candidates by
+    decreasing frame rate. Measured frame rates take precedence over
+    predicted ones.
+
+    """
+    if cache is None:
+        cache = MEASUREMENTS
+    caps = camera.capabilities()
+    rates = sorted(caps['frame_rates'])
+    if not rates:
+        rates = [camera.GetFormat()[1]]
+    max_height = caps['max_height']
+    bandwidth = INTERFACE_BANDWIDTH.get(camera.QueryExternInterface())
+    exposure = camera.GetProperty('exposure')[0]
+    cameraid = camera.GetCameraId()
+    bits = {API.LUCAM_PF_8: 8,
+            API.LUCAM_PF_16: _true_depth(camera, cameraid, cache)}
+    pixelformats = [pf for pf, b in bits.items() if b >= min_bits]
+    if not pixelformats:
+        raise ValueError("no pixel format provides %i bits" % min_bits)
+
+    candidates = []
+    for frameformat in frame_formats(roi, caps['max_width'], max_height,
+                                     binnings, pixelformats):
+        # lowest nominal rate not below the target, else the fastest
+        framerate = rates[-1]
+        if target_fps is not None:
+            framerate = min((r for r in rates if r >= target_fps),
+                            default=framerate)
+        fps = predict_fps(frameformat, framerate, max_height, bandwidth,
+                          exposure)
+        measured = cache.get(
+            cache.key(cameraid, frameformat, framerate))
+        if measured is not None:
+            measured = measured['fps']
+        candidates.append(FormatCandidate(
+            frameformat, framerate, bits[frameformat.pixelFormat], fps,
+            measured, 0.0))
+    candidates = _rank(candidates, target_fps)
+
+    # measuring may move other candidates up, so repeat until the top
+    # candidates are measured
+    measured = set()
+    while True:
+        for candidate in candidates[:measure]:
+            key = cache.key(cameraid, candidate.frameformat,
+                            candidate.framerate)
+            if key not in measured and (candidate.measured_fps is None
+                                        or refresh):
+                break
+        else:
+            return candidates
+        fps = measure_fps(camera, candidate.frameformat, candidate.framerate,
+                          duration, cache)
+        measured.add(key)
+        candidates = _rank([c._replace(measured_fps=fps) if c is candidate
+                            else c for c in candidates], target_fps)
+
+
+def _true_depth(camera, cameraid, cache):
+    """Return bits per pixel of 16 bit formats, or 16 if unknown."""
+    # the camera reports the true depth only while in a 16 bit format
+    key = "%03X/depth" % cameraid
+    if camera.GetFormat()[0].pixelFormat in (API.LUCAM_PF_16,
+                                             API.LUCAM_PF_48):
+        depth = camera.GetTruePixelDepth()
+        if cache.get(key) != {'bits': depth}:
+            cache.set(key, {'bits': depth})
+        return depth
+    entry = cache.get(key)
+    return 16 if entry is None else entry['bits']
+
+
+def _rank(candidates, target_fps):
+    """Return candidates with bandwidth updated, sorted best first."""
+    result = []
+    for candidate in candidates:
+        fps = candidate.measured_fps
+        if fps is None:
+            fps = candidate.predicted_fps
+        rate = fps if target_fps is None else min(fps, target_fps)
+        result.append(candidate._replace(
+            bandwidth=rate * _frame_bytes(candidate.frameformat)))
+
+    def key(candidate):
+        f = candidate.frameformat
+        fps = candidate.measured_fps
+        if fps is None:
+            fps = candidate.predicted_fps
+        if target_fps is not None and fps >= target_fps:
+            return (0, f.binningX * f.binningY, candidate.bandwidth,
+                    f.width * f.height)
+        return (1, -fps, candidate.bandwidth, f.width * f.height)
+
+    result.sort(key=key)
+    return result
+
+
+def measure_fps(camera, frameformat, framerate, duration=1.0, cache=None,
+                numslots=4):
+    """Return frame rate measured while streaming frame format.
+
+    The camera must not be streaming. Its previous format is restored.
+    If cache is not None, the result is stored per camera model.
+
+    """
+    if camera._streaming is not None:
+        raise RuntimeError("camera is streaming")
+    previous = camera.GetFormat()
+    camera.SetFormat(frameformat, framerate)
+    ring = FrameRing(frameformat, numslots, 'overwrite', camera._byteorder)
+    try:
+        ring.attach(camera)
+        camera.StreamVideoControl('start_streaming')
+        reader = ring.reader()
+        first = reader.read(timeout=max(2.0, duration))
+        last = first
+        count = 0
+        if first is not None:
+            deadline = time.perf_counter() + duration
+            while time.perf_counter() < deadline:
+                frame = reader.read(timeout=max(2.0, duration))
+                if frame is None:
+                    break
+                last = frame
+            count = last.sequence - first.sequence
+    finally:
+        camera.StreamVideoControl('stop_streaming')
+        ring.detach()
+        camera.SetFormat(*previous)
+    if not count:
+        fps = 0.0
+    else:
+        fps = count / (last.timestamp - first.timestamp)
+    if cache is not None:
+        cache.set(cache.key(camera.GetCameraId(), frameformat, framerate),
+                  dict(fps=fps, time=time.time()))
+    return fps
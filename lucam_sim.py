@@ -0,0 +1,880 @@
+# -*- coding: utf-8 -*-
+# lucam_sim.py
+
+"""Simulated Lumenera(r) USB camera.
+
+*LucamSimulator* implements, in pure Python and NumPy, the subset of the
+lucamapi.dll functions used by the Lucam wrapper, LucamHW and LucamMeasure.
+It allows acquisition code to be run, profiled and load tested on hosts
+without Lumenera cameras or drivers, e.g. Linux CI machines.
+
+Frames are raw Bayer or monochrome test patterns with shot and read noise
+at the sensor size of the simulated camera model. Streaming callbacks are
+called from a timer thread at the configured frame rate, limited by the
+exposure time and the readout rate of the sensor.
+
+API functions that are not simulated fail with error code 98,
+FunctionNotSupported.
+
+Examples
+--------
+Set the LUCAM_API environment variable to 'simulated' before importing lucam,
+or pass a simulated API interface to Lucam:
+
+>>> from lucam import Lucam, load_api
+>>> camera = Lucam(1, api=load_api('simulated'))
+>>> image = camera.TakeSnapshot()
+
+"""
+import time
+import ctypes
+import functools
+import threading
+
+import numpy
+
+__all__ = ['LucamSimulator', 'SENSOR']
+
+# camera id: (max width, max height, pixel clock in MHz, true pixel depth)
+SENSOR = {
+    0x08A: (1392, 1040, 40.0, 12),  # Lu165
+    0x0A2: (1616, 1216, 48.0, 12),  # Infinity 2
+    0x1A5: (1392, 1040, 40.0, 12),  # Infinity 3-1
+    0x1A8: (4008, 2672, 96.0, 14),  # Infinity 4-11
+}
+
+FRAME_RATES = (3.75, 7.5, 15.0, 30.0, 60.0, 120.0)
+
+# property name: (minimum, maximum, default, flags)
+PROPERTY_RANGE = {
+    'brightness': (0.0, 10.0, 1.0, 0),
+    'contrast': (0.0, 10.0, 1.0, 0),
+    'hue': (-180.0, 180.0, 0.0, 0),
+    'saturation': (0.0, 2.0, 1.0, 0),
+    'gamma': (0.25, 4.0, 1.0, 0),
+    'exposure': (0.1, 15000.0, 10.0, 0),
+    'gain': (0.125, 16.0, 1.0, 0),
+    'gain_red': (0.125, 8.0, 1.0, 0),
+    'gain_blue': (0.125, 8.0, 1.0, 0),
+    'gain_green1': (0.125, 8.0, 1.0, 0),
+    'gain_green2': (0.125, 8.0, 1.0, 0),
+    'demosaicing_method': (0.0, 8.0, 1.0, 0),
+    'correction_matrix': (0.0, 15.0, 0.0, 0),
+    'flipping': (0.0, 3.0, 0.0, 0),
+    'digital_gain': (0.0, 2.0, 1.0, 0),
+    'digital_gain_red': (0.0, 4.0, 1.0, 0),
+    'digital_gain_green': (0.0, 4.0, 1.0, 0),
+    'digital_gain_blue': (0.0, 4.0, 1.0, 0),
+    'black_level': (0.0, 255.0, 0.0, 0),
+    'timestamps': (0.0, 1.0, 0.0, 0),
+    'snapshot_clock_speed': (0.0, 3.0, 0.0, 0),
+    'auto_exp_target': (0.0, 255.0, 128.0, 0),
+    'auto_exp_maximum': (0.1, 15000.0, 500.0, 0),
+    'auto_gain_maximum': (1.0, 16.0, 4.0, 0),
+    'light_frequency': (0.0, 2.0, 0.0, 0),
+    'trigger': (0.0, 1.0, 0.0, 0),
+    'frame_gate': (0.0, 255.0, 0.0, 0),
+    'exposure_interval': (0.0, 15000.0, 0.0, 0),
+    'snapshot_count': (1.0, 255.0, 1.0, 0),
+}
+
+FULL_WELL = 10000.0  # electrons
+READ_NOISE = 10.0  # electrons
+BANDWIDTH = 40e6  # bytes per second over USB 2
+NOISE_FRAMES = 4  # number of noise realizations cycled through
+
+
+class SimulatedError(Exception):
+    """Error code raised inside simulated API functions."""
+
+    def __init__(self, code):
+        self.code = code
+
+
+def camera_function(failure=0):
+    """Return decorator passing simulated camera of handle to API function.
+
+    SimulatedError raised by the API function are recorded as last error
+    and the failure value is returned instead.
+
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, handle, *args):
+            camera = self._handles.get(handle)
+            try:
+                if camera is None:
+                    raise SimulatedError(18)  # CameraNotFound
+                return func(self, camera, *args)
+            except SimulatedError as error:
+                self._lasterror = error.code
+                if camera is not None:
+                    camera.lasterror = error.code
+                return failure
+        return wrapper
+    return decorator
+
+
+class LucamSimulator(object):
+    """Simulated lucamapi.dll.
+
+    Struct types and constants are attached to instances by lucam.load_api(),
+    which must be used to create the interface.
+
+    """
+
+    def __init__(self, numcameras=1, cameraid=0x0A2, monochrome=False,
+                 realtime=True, seed=None):
+        """Initialize simulated cameras.
+
+        Parameters
+        ----------
+        numcameras : int
+            Number of simulated cameras attached to the system.
+        cameraid : int
+            Camera model ID, one of SENSOR keys.
+        monochrome : bool
+            If True, simulate monochrome instead of Bayer color sensors.
+        realtime : bool
+            If True (default), snapshots take the exposure and readout time
+            and streaming is paced at the frame rate. Else frames are
+            returned as fast as they can be generated.
+        seed : int or None
+            Seed of the random noise generator.
+
+        """
+        self.numcameras = numcameras
+        self.cameraid = cameraid
+        self.monochrome = monochrome
+        self.realtime = realtime
+        self.seed = seed
+        self._cameras = {}  # camera number -> SimulatedCamera
+        self._handles = {}  # handle -> SimulatedCamera
+        self._synchronous = {}  # handle -> [(SimulatedCamera, snapshot)]
+        self._lasterror = 0
+
+    def __getattr__(self, name):
+        """Return function failing with FunctionNotSupported error."""
+        if not name.startswith('Lucam'):
+            raise AttributeError(
+                "'LucamSimulator' object has no attribute '%s'" % name)
+
+        def not_supported(*args):
+            self._lasterror = 98
+            if args and isinstance(args[0], int) and args[0] in self._handles:
+                self._handles[args[0]].lasterror = 98
+            return 0
+
+        return not_supported
+
+    def hardware_trigger(self, number=1):
+        """Emulate a pulse on the hardware trigger input of camera."""
+        self._cameras[number].trigger.set()
+
+    def set_gpio_input(self, number, value):
+        """Set the General Purpose IO input bits of camera."""
+        self._cameras[number].gpi = value
+
+    def LucamNumCameras(self):
+        return self.numcameras
+
+    def LucamEnumCameras(self, versions, num):
+        num = min(num, self.numcameras)
+        for i in range(num):
+            self._query_version(i + 1, versions[i])
+        return num
+
+    def LucamCameraOpen(self, number):
+        if number < 1:
+            self._lasterror = 1  # NoSuchIndex
+            return None
+        if number > self.numcameras:
+            self._lasterror = 18  # CameraNotFound
+            return None
+        camera = self._cameras.get(number)
+        if camera is None:
+            seed = None if self.seed is None else self.seed + number
+            camera = SimulatedCamera(self, number, seed)
+            self._cameras[number] = camera
+        handle = 0x1000 * number + len(camera.handles) + 1
+        while handle in self._handles:
+            handle += 1
+        camera.handles.add(handle)
+        self._handles[handle] = camera
+        return handle
+
+    def LucamCameraClose(self, handle):
+        camera = self._handles.pop(handle, None)
+        if camera is None:
+            self._lasterror = 18  # CameraNotFound
+            return False
+        camera.handles.discard(handle)
+        if not camera.handles:
+            camera.stop_streaming()
+        return True
+
+    def LucamEnableSynchronousSnapshots(self, numcams, phcameras,
+                                        ppsettings):
+        entries = []
+        for i in range(numcams):
+            camera = self._handles.get(phcameras[i])
+            if camera is None:
+                self._lasterror = 18  # CameraNotFound
+                return None
+            snapshot = ppsettings[i].contents
+            entries.append((camera, type(snapshot).from_buffer_copy(snapshot)))
+        handle = 0x100000 + len(self._synchronous) + 1
+        while handle in self._synchronous:
+            handle += 1
+        self._synchronous[handle] = entries
+        return handle
+
+    def LucamTakeSynchronousSnapshots(self, handle, ppdata):
+        entries = self._synchronous.get(handle)
+        if entries is None:
+            self._lasterror = 29  # InvalidParameter
+            return False
+        errors = []
+
+        def take(camera, snapshot, dest):
+            try:
+                camera.take_snapshot(snapshot, dest)
+            except SimulatedError as error:
+                camera.lasterror = error.code
+                errors.append(error.code)
+
+        # cameras expose simultaneously
+        threads = [threading.Thread(target=take, args=(camera, snapshot,
+                                                       address(ppdata[i])))
+                   for i, (camera, snapshot) in enumerate(entries)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            self._lasterror = errors[0]
+            return False
+        return True
+
+    def LucamDisableSynchronousSnapshots(self, handle):
+        if self._synchronous.pop(handle, None) is None:
+            self._lasterror = 29  # InvalidParameter
+            return False
+        return True
+
+    @camera_function()
+    def LucamCameraReset(self, camera):
+        camera.reset()
+        return True
+
+    @camera_function()
+    def LucamQueryVersion(self, camera, version):
+        self._query_version(camera.number, version)
+        return True
+
+    def _query_version(self, number, version):
+        version.firmware = 0x00010203
+        version.fpga = 0x00010000
+        version.api = 0x05000000
+        version.driver = 0x05000000
+        version.serialnumber = 100000 + number
+        return version
+
+    @camera_function()
+    def LucamQueryExternInterface(self, camera, result):
+        result.value = self.LUCAM_EXTERN_INTERFACE_USB2
+        return True
+
+    @camera_function()
+    def LucamGetCameraId(self, camera, result):
+        result.value = camera.cameraid
+        return True
+
+    @camera_function()
+    def LucamGetProperty(self, camera, prop, value, flags):
+        value.value, flags.value = camera.get_property(prop)
+        return True
+
+    @camera_function()
+    def LucamSetProperty(self, camera, prop, value, flags):
+        camera.set_property(prop, value, flags)
+        return True
+
+    @camera_function()
+    def LucamPropertyRange(self, camera, prop, minimum, maximum, default,
+                           flags):
+        if prop not in camera.ranges:
+            raise SimulatedError(21)  # PropertyUnsupported
+        (minimum.value, maximum.value,
+         default.value, flags.value) = camera.ranges[prop]
+        return True
+
+    @camera_function()
+    def LucamGetFormat(self, camera, frameformat, framerate):
+        ctypes.memmove(ctypes.addressof(frameformat),
+                       ctypes.addressof(camera.frameformat),
+                       ctypes.sizeof(frameformat))
+        framerate.value = camera.framerate
+        return True
+
+    @camera_function()
+    def LucamSetFormat(self, camera, frameformat, framerate):
+        camera.set_format(frameformat, framerate)
+        return True
+
+    @camera_function()
+    def LucamEnumAvailableFrameRates(self, camera, size, result):
+        for i in range(min(size, len(FRAME_RATES))):
+            result[i] = FRAME_RATES[i]
+        return len(FRAME_RATES)
+
+    @camera_function()
+    def LucamGetTruePixelDepth(self, camera, result):
+        result.value = camera.depth
+        return True
+
+    @camera_function()
+    def LucamStreamVideoControl(self, camera, ctrltype, window):
+        if ctrltype in (self.START_STREAMING, self.START_DISPLAY):
+            camera.start_streaming()
+        elif ctrltype in (self.STOP_STREAMING, self.PAUSE_STREAM):
+            camera.stop_streaming()
+        else:
+            raise SimulatedError(98)  # FunctionNotSupported
+        return True
+
+    @camera_function()
+    def LucamTakeVideo(self, camera, numframes, data):
+        camera.take_video(numframes, address(data))
+        return True
+
+    @camera_function()
+    def LucamCancelTakeVideo(self, camera):
+        camera.cancel_video()
+        return True
+
+    @camera_function()
+    def LucamTakeSnapshot(self, camera, snapshot, data):
+        camera.take_snapshot(snapshot, address(data))
+        return True
+
+    @camera_function(failure=-1)
+    def LucamAddStreamingCallback(self, camera, callback, context):
+        return camera.add_callback(camera.streaming_callbacks,
+                                   callback, context)
+
+    @camera_function()
+    def LucamRemoveStreamingCallback(self, camera, callbackid):
+        return camera.remove_callback(camera.streaming_callbacks, callbackid)
+
+    @camera_function(failure=-1)
+    def LucamAddSnapshotCallback(self, camera, callback, context):
+        return camera.add_callback(camera.snapshot_callbacks,
+                                   callback, context)
+
+    @camera_function()
+    def LucamRemoveSnapshotCallback(self, camera, callbackid):
+        return camera.remove_callback(camera.snapshot_callbacks, callbackid)
+
+    @camera_function()
+    def LucamConvertFrameToRgb24(self, camera, dest, source, width, height,
+                                 pixelformat, conversion):
+        if pixelformat == self.LUCAM_PF_24:
+            ctypes.memmove(dest.ctypes.data, address(source), dest.nbytes)
+            return True
+        raw = camera.frombuffer(source, (height, width), pixelformat)
+        if pixelformat == self.LUCAM_PF_16:
+            raw = raw >> 8
+        demosaic(raw, dest, camera.monochrome)
+        return True
+
+    @camera_function()
+    def LucamConvertFrameToRgb48(self, camera, dest, source, width, height,
+                                 pixelformat, conversion):
+        raw = camera.frombuffer(source, (height, width), pixelformat)
+        if pixelformat == self.LUCAM_PF_8:
+            raw = raw.astype('<u2') << 8
+        out = camera.frombuffer(dest, (height, width, 3), self.LUCAM_PF_48)
+        demosaic(raw, out, camera.monochrome)
+        return True
+
+    @camera_function()
+    def LucamEnableFastFrames(self, camera, snapshot):
+        camera.enable_fastframes(snapshot)
+        return True
+
+    @camera_function()
+    def LucamTakeFastFrame(self, camera, data):
+        camera.take_fastframe(address(data), wait=True)
+        return True
+
+    @camera_function()
+    def LucamForceTakeFastFrame(self, camera, data):
+        camera.take_fastframe(address(data), wait=False)
+        return True
+
+    @camera_function()
+    def LucamTakeFastFrameNoTrigger(self, camera, data):
+        camera.take_fastframe(address(data), wait=False, retrieve=True)
+        return True
+
+    @camera_function()
+    def LucamDisableFastFrames(self, camera):
+        camera.fastframe = None
+        return True
+
+    @camera_function()
+    def LucamSetTriggerMode(self, camera, usehwtrigger):
+        camera.usehwtrigger = bool(usehwtrigger)
+        return True
+
+    @camera_function()
+    def LucamTriggerFastFrame(self, camera):
+        if camera.fastframe is None:
+            raise SimulatedError(14)  # NotRunning
+        camera.trigger.set()
+        return True
+
+    @camera_function()
+    def LucamCancelTakeFastFrame(self, camera):
+        camera.cancelled = True
+        camera.trigger.set()
+        return True
+
+    @camera_function()
+    def LucamSetTimeout(self, camera, still, timeout):
+        if still:
+            camera.timeout = timeout
+        return True
+
+    @camera_function()
+    def LucamGpioRead(self, camera, gpo, gpi):
+        gpo.value = camera.gpo
+        gpi.value = camera.gpi
+        return True
+
+    @camera_function()
+    def LucamGpioWrite(self, camera, gpovalues):
+        camera.gpo = gpovalues
+        return True
+
+    @camera_function()
+    def LucamGpoSelect(self, camera, gpoenable):
+        return True
+
+    @camera_function()
+    def LucamGpioConfigure(self, camera, enableoutput):
+        return True
+
+    @camera_function()
+    def LucamGetCurrentMatrix(self, camera, matrix):
+        matrix[:] = camera.matrix
+        return True
+
+    @camera_function()
+    def LucamSetupCustomMatrix(self, camera, matrix):
+        camera.matrix[:] = matrix
+        return True
+
+    def LucamGetLastError(self):
+        return self._lasterror
+
+    def LucamGetLastErrorForCamera(self, handle):
+        camera = self._handles.get(handle)
+        return self._lasterror if camera is None else camera.lasterror
+
+
+class SimulatedCamera(object):
+    """State and frame source of a simulated camera."""
+
+    def __init__(self, api, number, seed=None):
+        self.api = api
+        self.number = number
+        self.cameraid = api.cameraid
+        self.monochrome = api.monochrome
+        self.realtime = api.realtime
+        self.maxwidth, self.maxheight, self.pixelclock, self.truedepth = \
+            SENSOR[api.cameraid]
+        self.handles = set()
+        self.rng = numpy.random.default_rng(seed)
+        self.lock = threading.Condition()
+        self.streaming_callbacks = {}
+        self.snapshot_callbacks = {}
+        self._callbackid = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._bank_key = None
+        self._bank = None
+        self.reset()
+
+    def reset(self):
+        """Reset camera to its power-on default state."""
+        api = self.api
+        self.stop_streaming()
+        self.lasterror = 0
+        self.frameformat = api.LUCAM_FRAME_FORMAT(
+            0, 0, self.maxwidth, self.maxheight, api.LUCAM_PF_8,
+            binningX=1, flagsX=0, binningY=1, flagsY=0)
+        self.framerate = FRAME_RATES[3]
+        self.ranges = {}
+        self.properties = {}
+        for name, (mn, mx, default, flags) in PROPERTY_RANGE.items():
+            prop = getattr(api, 'LUCAM_PROP_' + name.upper())
+            self.ranges[prop] = (mn, mx, default, flags)
+            self.properties[prop] = [default, flags]
+        colorformat = (api.LUCAM_CF_MONO if self.monochrome
+                       else api.LUCAM_CF_BAYER_RGGB)
+        readonly = {
+            api.LUCAM_PROP_COLOR_FORMAT: (
+                colorformat, api.LUCAM_PROP_FLAG_LITTLE_ENDIAN),
+            api.LUCAM_PROP_MAX_WIDTH: (self.maxwidth, 0),
+            api.LUCAM_PROP_MAX_HEIGHT: (self.maxheight, 0),
+            api.LUCAM_PROP_TEMPERATURE: (25.0, api.LUCAM_PROP_FLAG_READONLY),
+            api.LUCAM_PROP_MEMORY: (0.0, api.LUCAM_PROP_FLAG_READONLY),
+        }
+        for prop, (value, flags) in readonly.items():
+            self.ranges[prop] = (value, value, value, flags)
+            self.properties[prop] = [value, flags]
+        self.readonly = set(readonly)
+        self.fastframe = None
+        self.usehwtrigger = False
+        self.trigger = threading.Event()
+        self.cancelled = False
+        self.timeout = 1000.0
+        self.lastframe = None
+        self.framecount = 0
+        self.gpo = 0
+        self.gpi = 0
+        self.matrix = numpy.identity(3, numpy.float32)
+
+    @property
+    def depth(self):
+        """Return pixel depth of current pixel format."""
+        if self.frameformat.pixelFormat in (self.api.LUCAM_PF_16,
+                                            self.api.LUCAM_PF_48):
+            return self.truedepth
+        return 8
+
+    def get_property(self, prop):
+        """Return value and flags of camera property."""
+        if prop not in self.properties:
+            raise SimulatedError(21)  # PropertyUnsupported
+        if prop == self.api.LUCAM_PROP_TEMPERATURE:
+            return 25.0 + 5.0 * numpy.sin(time.time() / 600.0), 0
+        return tuple(self.properties[prop])
+
+    def set_property(self, prop, value, flags):
+        """Set value and flags of camera property."""
+        if prop not in self.properties:
+            raise SimulatedError(21)  # PropertyUnsupported
+        if prop in self.readonly:
+            raise SimulatedError(22)  # PropertyAccessFailed
+        mn, mx = self.ranges[prop][:2]
+        if not mn <= value <= mx:
+            raise SimulatedError(32)  # ParameterNotWithinBoundaries
+        with self.lock:
+            self.properties[prop] = [float(value), flags]
+
+    def set_format(self, frameformat, framerate):
+        """Validate and set frame format and frame rate."""
+        api = self.api
+        f = frameformat
+        if self._thread is not None:
+            raise SimulatedError(5)  # Busy
+        if f.pixelFormat not in (api.LUCAM_PF_8, api.LUCAM_PF_16,
+                                 api.LUCAM_PF_24, api.LUCAM_PF_32,
+                                 api.LUCAM_PF_48):
+            raise SimulatedError(8)  # PixelFormatNotSupported
+        if f.binningX not in (1, 2, 4, 8) or f.binningY not in (1, 2, 4, 8):
+            raise SimulatedError(4 if not f.binningX * f.binningY else 6)
+        if (f.width < 8 or f.height < 8 or f.width % 8 or f.height % 8
+                or f.xOffset % 8 or f.yOffset % 8
+                or f.width % f.binningX or f.height % f.binningY
+                or f.xOffset + f.width > self.maxwidth
+                or f.yOffset + f.height > self.maxheight):
+            raise SimulatedError(9)  # InvalidFrameFormat
+        self.frameformat = type(f).from_buffer_copy(f)
+        self.framerate = min(FRAME_RATES, key=lambda r: abs(r - framerate))
+
+    def frame_shape(self, frameformat):
+        """Return shape and dtype of frame data."""
+        api = self.api
+        f = frameformat
+        shape = (f.height // f.binningY, f.width // f.binningX)
+        if f.pixelFormat in (api.LUCAM_PF_24, api.LUCAM_PF_48):
+            shape += (3, )
+        elif f.pixelFormat == api.LUCAM_PF_32:
+            shape += (4, )
+        if f.pixelFormat in (api.LUCAM_PF_16, api.LUCAM_PF_48):
+            dtype = numpy.dtype('<u2')
+        else:
+            dtype = numpy.dtype('u1')
+        return shape, dtype
+
+    def readout_time(self, frameformat):
+        """Return time in s to read frame from sensor and transfer to host."""
+        shape, dtype = self.frame_shape(frameformat)
+        pixels = shape[0] * shape[1]
+        nbytes = pixels * (2 if frameformat.pixelFormat in (
+            self.api.LUCAM_PF_16, self.api.LUCAM_PF_48) else 1)
+        return max(pixels / (self.pixelclock * 1e6), nbytes / BANDWIDTH)
+
+    def frame_interval(self):
+        """Return time in s between streamed frames."""
+        exposure = self.properties[self.api.LUCAM_PROP_EXPOSURE][0]
+        return max(1.0 / self.framerate, exposure / 1000.0,
+                   self.readout_time(self.frameformat))
+
+    def frombuffer(self, pointer, shape, pixelformat):
+        """Return numpy array view of frame data at pointer."""
+        dtype = numpy.dtype('<u2' if pixelformat in (
+            self.api.LUCAM_PF_16, self.api.LUCAM_PF_48) else 'u1')
+        nbytes = int(numpy.prod(shape)) * dtype.itemsize
+        buffer = (ctypes.c_char * nbytes).from_address(address(pointer))
+        return numpy.frombuffer(buffer, dtype).reshape(shape)
+
+    def frames(self, frameformat, exposure, gain):
+        """Return bank of noisy test pattern frames."""
+        key = (bytes(frameformat), exposure, gain)
+        if key != self._bank_key:
+            self._bank = test_pattern(
+                frameformat, self.frame_shape(frameformat)[0],
+                self.maxwidth, self.maxheight, self.truedepth,
+                exposure, gain, self.monochrome, self.api, self.rng)
+            self._bank_key = key
+        return self._bank
+
+    def capture(self, frameformat, exposure, gain, dest):
+        """Copy next test pattern frame to destination address."""
+        bank = self.frames(frameformat, exposure, gain)
+        frame = bank[self.framecount % len(bank)]
+        self.framecount += 1
+        ctypes.memmove(dest, frame.ctypes.data, frame.nbytes)
+        return frame.nbytes
+
+    def take_snapshot(self, snapshot, dest):
+        """Expose, read out and copy single frame to destination."""
+        self.validate(snapshot.format)
+        if self.realtime:
+            time.sleep(snapshot.exposure / 1000.0 +
+                       self.readout_time(snapshot.format))
+        with self.lock:
+            size = self.capture(snapshot.format, snapshot.exposure,
+                                snapshot.gain, dest)
+        self.call(self.snapshot_callbacks, dest, size)
+        return size
+
+    def validate(self, frameformat):
+        """Raise SimulatedError if frame format differs in size from camera."""
+        shape, dtype = self.frame_shape(frameformat)
+        if (shape, dtype) != self.frame_shape(self.frameformat):
+            raise SimulatedError(28)  # UndeterminedFrameFormat
+
+    def enable_fastframes(self, snapshot):
+        """Enter fast frames mode with copy of snapshot settings."""
+        self.validate(snapshot.format)
+        self.fastframe = type(snapshot).from_buffer_copy(snapshot)
+        self.trigger.clear()
+        self.cancelled = False
+
+    def take_fastframe(self, dest, wait=True, retrieve=False):
+        """Take snapshot in fast frames mode."""
+        snapshot = self.fastframe
+        if snapshot is None:
+            raise SimulatedError(14)  # NotRunning
+        shape, dtype = self.frame_shape(snapshot.format)
+        if retrieve and self.lastframe is not None:
+            ctypes.memmove(dest, self.lastframe.ctypes.data,
+                           self.lastframe.nbytes)
+            return
+        if wait and (self.usehwtrigger or snapshot.useHwTrigger):
+            if not self.trigger.wait(self.timeout / 1000.0):
+                raise SimulatedError(19)  # Timeout
+            self.trigger.clear()
+        if self.cancelled:
+            self.cancelled = False
+            raise SimulatedError(48)  # Cancelled
+        self.take_snapshot(snapshot, dest)
+        self.lastframe = numpy.empty(shape, dtype)
+        ctypes.memmove(self.lastframe.ctypes.data, dest,
+                       self.lastframe.nbytes)
+
+    def add_callback(self, callbacks, callback, context):
+        """Register callback function and return its id."""
+        if context is not None:
+            context = id(context.value)
+        with self.lock:
+            self._callbackid += 1
+            callbacks[self._callbackid] = (callback, context)
+        return self._callbackid
+
+    def remove_callback(self, callbacks, callbackid):
+        """Unregister callback function."""
+        with self.lock:
+            if callbackid not in callbacks:
+                raise SimulatedError(29)  # InvalidParameter
+            del callbacks[callbackid]
+        return True
+
+    def call(self, callbacks, pointer, size):
+        """Call registered callback functions with frame data."""
+        pointer = ctypes.cast(pointer, self.api.pBYTE)
+        for callback, context in list(callbacks.values()):
+            callback(context, pointer, size)
+
+    def start_streaming(self):
+        """Start timer thread streaming video frames."""
+        if self._thread is not None:
+            return
+        shape, dtype = self.frame_shape(self.frameformat)
+        self.streambuffer = numpy.empty(shape, dtype)
+        self.streamcount = 0
+        self.cancelled = False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._stream,
+                                        name='LucamSimulator%i' % self.number,
+                                        daemon=True)
+        self._thread.start()
+
+    def stop_streaming(self):
+        """Stop streaming and wait for timer thread to finish."""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        with self.lock:
+            self._thread = None
+            self.lock.notify_all()
+        if thread is not threading.current_thread():
+            thread.join()
+
+    def _stream(self):
+        """Generate video frames at frame rate and call callbacks."""
+        api = self.api
+        dest = self.streambuffer.ctypes.data
+        nexttime = time.perf_counter()
+        while not self._stop.is_set():
+            if self.realtime:
+                nexttime += self.frame_interval()
+                delay = nexttime - time.perf_counter()
+                if delay > 0.0:
+                    if self._stop.wait(delay):
+                        break
+                else:
+                    nexttime = time.perf_counter()
+            with self.lock:
+                size = self.capture(
+                    self.frameformat,
+                    self.properties[api.LUCAM_PROP_EXPOSURE][0],
+                    self.properties[api.LUCAM_PROP_GAIN][0], dest)
+                self.streamcount += 1
+                self.lock.notify_all()
+            self.call(self.streaming_callbacks, dest, size)
+
+    def take_video(self, numframes, dest):
+        """Copy next numframes streamed frames to destination."""
+        if self._thread is None:
+            raise SimulatedError(14)  # NotRunning
+        timeout = max(1.0, 2.0 * self.frame_interval())
+        with self.lock:
+            count = self.streamcount
+            nbytes = self.streambuffer.nbytes
+            for i in range(numframes):
+                while self.streamcount == count:
+                    if self.cancelled:
+                        self.cancelled = False
+                        raise SimulatedError(48)  # Cancelled
+                    if self._thread is None:
+                        raise SimulatedError(80)  # StreamingStopped
+                    if not self.lock.wait(timeout):
+                        raise SimulatedError(19)  # Timeout
+                count = self.streamcount
+                ctypes.memmove(dest + i * nbytes,
+                               self.streambuffer.ctypes.data, nbytes)
+
+    def cancel_video(self):
+        """Cancel TakeVideo call waiting in another thread."""
+        with self.lock:
+            self.cancelled = True
+            self.lock.notify_all()
+
+
+def address(pointer):
+    """Return memory address of ctypes pointer, array, or integer."""
+    if isinstance(pointer, int):
+        return pointer
+    if isinstance(pointer, numpy.ndarray):
+        return pointer.ctypes.data
+    return ctypes.cast(pointer, ctypes.c_void_p).value
+
+
+def test_pattern(frameformat, shape, maxwidth, maxheight, depth,
+                 exposure, gain, monochrome, api, rng):
+    """Return sequence of noisy test pattern frames for frame format.
+
+    The scene is a gradient with a bright spot and rings in the center of
+    the sensor, seen through an RGGB Bayer filter unless monochrome.
+    Signal scales with exposure time (ms) and gain.
+
+    """
+    f = frameformat
+    height, width = shape[:2]
+    y = (f.yOffset + (numpy.arange(height, dtype=numpy.float32) + 0.5) *
+         f.binningY) / maxheight - 0.5
+    x = (f.xOffset + (numpy.arange(width, dtype=numpy.float32) + 0.5) *
+         f.binningX) / maxwidth - 0.5
+    y = y[:, numpy.newaxis]
+    x = x[numpy.newaxis, :]
+    r2 = x * x + y * y
+    scene = 0.2 + 0.3 * (x + 0.5) + 0.5 * numpy.exp(-r2 / 0.005)
+    scene += 0.1 * numpy.cos(400.0 * r2)
+    if not monochrome:
+        scene[0::2, 0::2] *= 0.6 + 0.4 * (x[:, 0::2] + 0.5)  # red
+        scene[1::2, 1::2] *= 0.6 + 0.4 * (y[1::2] + 0.5)  # blue
+    electrons = scene * (FULL_WELL * exposure / 10.0 *
+                         f.binningX * f.binningY)
+    sigma = numpy.sqrt(electrons + READ_NOISE**2)
+    rawformat = (api.LUCAM_PF_8 if f.pixelFormat in (api.LUCAM_PF_8,
+                                                      api.LUCAM_PF_24,
+                                                      api.LUCAM_PF_32)
+                 else api.LUCAM_PF_16)
+    frames = []
+    for _ in range(NOISE_FRAMES):
+        noise = rng.standard_normal(electrons.shape, numpy.float32)
+        signal = (electrons + sigma * noise) * (gain / FULL_WELL)
+        numpy.clip(signal, 0.0, 1.0, out=signal)
+        if rawformat == api.LUCAM_PF_8:
+            raw = (signal * 255.0).astype(numpy.uint8)
+        else:
+            raw = (signal * (2**depth - 1)).astype('<u2')
+            raw <<= 16 - depth
+        if len(shape) == 2:
+            frames.append(raw)
+            continue
+        frame = numpy.empty(shape, raw.dtype)
+        demosaic(raw, frame[..., :3], monochrome)
+        if shape[2] == 4:
+            frame[..., 3] = 255
+        frames.append(frame)
+    return frames
+
+
+def demosaic(raw, out, monochrome=False):
+    """Convert raw RGGB Bayer data to BGR using nearest neighbours.
+
+    The output array must have shape raw.shape + (3,).
+
+    """
+    if monochrome:
+        out[...] = raw[..., numpy.newaxis]
+        return out
+    height, width = raw.shape
+    if height % 2 or width % 2:
+        raw = numpy.pad(raw, ((0, height % 2), (0, width % 2)), 'edge')
+    red = raw[0::2, 0::2]
+    green = raw[0::2, 1::2] // 2 + raw[1::2, 0::2] // 2
+    blue = raw[1::2, 1::2]
+    for channel, plane in ((2, red), (1, green), (0, blue)):
+        plane = plane.repeat(2, 0).repeat(2, 1)
+        out[..., channel] = plane[:height, :width]
+    return out
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+# lucam_stats.py
+
+"""Per-pixel statistics of Lumenera(r) camera frame sequences.
+
+*FrameAccumulator* sums raw frames into a preallocated integer or float32
+accumulator, such that averaging N frames costs one in-place addition per
+frame and no temporary arrays.
+
+*RunningStats* updates per-pixel mean, variance, minimum and maximum maps
+of a frame sequence in place with Welford's algorithm (1). Frames are
+processed in chunks of rows, such that the float32 temporaries are small
+compared to the frame.
+
+*to_rgb* converts averaged raw frames, which are not integer anymore, to
+RGB images in the 8 bit intensity scale of LucamConvertFrameToRgb24. Since
+demosaicing is linear, demosaicing the mean of raw frames gives the same
+result as averaging demosaiced frames. *convert_mean* converts averaged
+Bayer frames with the camera's conversion plan instead, i.e. with the
+demosaic method and color correction matrix applied to streamed frames.
+
+References
+----------
+(1) B P Welford. Note on a method for calculating corrected sums of squares
+    and products. Technometrics 4(3), 419-420, 1962.
+
+"""
+import copy
+import threading
+
+import numpy
+
+from .lucam import API
+from .lucam_demosaic import demosaic, PATTERNS
+
+__all__ = ['FrameAccumulator', 'RunningStats', 'to_rgb', 'convert_mean']
+
+
+class FrameAccumulator(object):
+    """Sum of frames in preallocated accumulator.
+
+    Examples
+    --------
+    >>> accumulator = FrameAccumulator((1216, 1616), 'uint16')
+    >>> for i in range(100):
+    ...     accumulator.add(camera.TakeFastFrame())
+    >>> mean = accumulator.mean()
+
+    """
+
+    def __init__(self, shape, dtype, accumulator='uint32'):
+        """Initialize zeroed accumulator.
+
+        Parameters
+        ----------
+        shape : tuple of int
+            Shape of frames.
+        dtype : numpy.dtype
+            Type of frames.
+        accumulator : str
+            'uint32' or 'float32'. An uint32 accumulator is exact but can
+            sum at most 2**32 / 2**bits frames of unsigned integer type.
+
+        """
+        self.dtype = numpy.dtype(dtype)
+        self.sum = numpy.zeros(shape, accumulator)
+        self.count = 0
+        if self.sum.dtype.kind == 'u':
+            if self.dtype.kind not in 'ub':
+                raise ValueError("integer accumulator requires integer frames")
+            maxval = numpy.iinfo(self.dtype).max
+            self.capacity = numpy.iinfo(self.sum.dtype).max // maxval
+        elif self.sum.dtype.kind == 'f':
+            self.capacity = None
+        else:
+            raise ValueError("accumulator must be uint32 or float32")
+        self._mean = None
+
+    def add(self, frame):
+        """Add frame to accumulator."""
+        if self.capacity is not None and self.count >= self.capacity:
+            raise OverflowError("accumulator can not sum more than %i frames"
+                                % self.capacity)
+        numpy.add(self.sum, frame, out=self.sum, casting='unsafe')
+        self.count += 1
+
+    def add_frames(self, frames):
+        """Add sequence of frames to accumulator."""
+        for frame in frames:
+            self.add(frame)
+
+    def mean(self, out=None):
+        """Return float32 mean of accumulated frames.
+
+        The same array is returned by subsequent calls if out is None.
+
+        """
+        if out is None:
+            if self._mean is None:
+                self._mean = numpy.empty(self.sum.shape, numpy.float32)
+            out = self._mean
+        if not self.count:
+            out[:] = 0
+            return out
+        numpy.multiply(self.sum, 1.0 / self.count, out=out,
+                       casting='unsafe')
+        return out
+
+    def reset(self):
+        """Clear accumulator."""
+        self.sum[:] = 0
+        self.count = 0
+
+
+class RunningStats(object):
+    """Per-pixel running mean, variance, minimum, and maximum of frames.
+
+    Memory use is fixed: two float maps, two maps of the frame type, and
+    two temporaries of chunk_rows rows. Update is thread-safe.
+
+    Examples
+    --------
+    >>> stats = RunningStats((1216, 1616, 3), 'uint8')
+    >>> for i in range(100):
+    ...     stats.update(camera.TakeFastFrame())
+    >>> noise = stats.std()
+
+    """
+
+    def __init__(self, shape, dtype, chunk_rows=64, float_type='float32',
+                 limit=None):
+        """Initialize empty statistics.
+
+        Parameters
+        ----------
+        shape : tuple of int
+            Shape of frames.
+        dtype : numpy.dtype
+            Type of frames. Minimum and maximum maps are of this type.
+        chunk_rows : int
+            Number of frame rows updated at once.
+        float_type : str
+            Type of mean and sum of squared differences maps.
+        limit : int or None
+            Maximum number of frames. Further frames are ignored by update.
+
+        """
+        self.shape = tuple(shape)
+        self.dtype = numpy.dtype(dtype)
+        self.chunk_rows = max(int(chunk_rows), 1)
+        self.limit = limit
+        self.mean = numpy.zeros(shape, float_type)
+        self.m2 = numpy.zeros(shape, float_type)
+        self.min = numpy.zeros(shape, self.dtype)
+        self.max = numpy.zeros(shape, self.dtype)
+        chunk = (min(self.chunk_rows, self.shape[0]), ) + self.shape[1:]
+        self._delta = numpy.empty(chunk, float_type)
+        self._delta2 = numpy.empty(chunk, float_type)
+        self._lock = threading.RLock()
+        self.count = 0
+
+    def update(self, frame):
+        """Add frame to statistics. Return False if limit was reached."""
+        if frame.shape != self.shape:
+            raise ValueError("frame shape %s does not match %s"
+                             % (frame.shape, self.shape))
+        with self._lock:
+            if self.limit is not None and self.count >= self.limit:
+                return False
+            self.count += 1
+            if self.count == 1:
+                self.min[:] = frame
+                self.max[:] = frame
+            scale = 1.0 / self.count
+            for y0 in range(0, self.shape[0], self.chunk_rows):
+                y1 = min(y0 + self.chunk_rows, self.shape[0])
+                x = frame[y0:y1]
+                mean = self.mean[y0:y1]
+                delta = self._delta[:y1 - y0]
+                delta2 = self._delta2[:y1 - y0]
+                # delta = x - mean; mean += delta / n
+                numpy.subtract(x, mean, out=delta, casting='unsafe')
+                numpy.multiply(delta, scale, out=delta2)
+                mean += delta2
+                # m2 += delta * (x - new mean)
+                numpy.subtract(x, mean, out=delta2, casting='unsafe')
+                delta2 *= delta
+                self.m2[y0:y1] += delta2
+                if self.count > 1:
+                    numpy.minimum(self.min[y0:y1], x, out=self.min[y0:y1])
+                    numpy.maximum(self.max[y0:y1], x, out=self.max[y0:y1])
+        return True
+
+    def variance(self, ddof=1, out=None):
+        """Return per-pixel variance of frames."""
+        if out is None:
+            out = numpy.empty_like(self.m2)
+        with self._lock:
+            if self.count <= ddof:
+                out[:] = 0
+            else:
+                numpy.multiply(self.m2, 1.0 / (self.count - ddof), out=out)
+        return out
+
+    def std(self, ddof=1, out=None):
+        """Return per-pixel standard deviation of frames."""
+        out = self.variance(ddof, out)
+        return numpy.sqrt(out, out=out)
+
+    def maps(self, ddof=1):
+        """Return dictionary of copies of all statistics maps."""
+        with self._lock:
+            return dict(count=self.count, mean=self.mean.copy(),
+                        variance=self.variance(ddof), min=self.min.copy(),
+                        max=self.max.copy())
+
+    def reset(self):
+        """Clear statistics."""
+        with self._lock:
+            self.mean[:] = 0
+            self.m2[:] = 0
+            self.count = 0
+
+
+def to_rgb(data, pixelformat, colorformat, out=None, method='bilinear'):
+    """Return float32 RGB image of raw data in 8 bit intensity scale.
+
+    Parameters
+    ----------
+    data : numpy array
+        Raw frame, e.g. the mean of raw frames. Bayer or monochrome frames
+        of shape (height, width), or BGR frames of shape (height, width, 3).
+    pixelformat : int
+        LUCAM_PF pixel format of the raw frames.
+    colorformat : int
+        LUCAM_CF color format of the camera, e.g. the value of the
+        'color_format' property.
+    out : numpy array or None
+        Float32 output array of shape (height, width, 3).
+    method : str
+        Demosaic method, see lucam_demosaic.
+
+    """
+    if pixelformat in (API.LUCAM_PF_16, API.LUCAM_PF_48):
+        scale = 1.0 / 256.0
+    else:
+        scale = 1.0
+    if out is None:
+        out = numpy.empty(data.shape[:2] + (3, ), numpy.float32)
+    if data.ndim == 3:
+        numpy.multiply(data[..., 2::-1], scale, out=out, casting='unsafe')
+    elif colorformat == API.LUCAM_CF_MONO:
+        numpy.multiply(data[..., numpy.newaxis], scale, out=out,
+                       casting='unsafe')
+    elif colorformat in PATTERNS:
+        demosaic(data, out, method, colorformat)
+        out *= scale
+    else:
+        raise ValueError("unsupported color format %r" % colorformat)
+    return out
+
+
+def convert_mean(camera, data, frameformat, out=None):
+    """Return float32 RGB image of mean raw frame in 8 bit intensity scale.
+
+    Bayer frames are converted like streamed frames by the default
+    conversion plan of the camera, see Lucam.conversion_plan. To keep the
+    fraction of the mean, it is rounded to 16 bit raw values, i.e. with 8
+    fractional bits for 8 bit frames, and converted to RGB48.
+    Other frames are converted by to_rgb.
+
+    Parameters
+    ----------
+    camera : Lucam
+        Camera the raw frames were obtained from.
+    data : numpy array
+        Mean of raw frames.
+    frameformat : API.LUCAM_FRAME_FORMAT
+        Frame format of the raw frames.
+    out : numpy array or None
+        Float32 output array of shape (height, width, 3).
+
+    """
+    colorformat = int(camera.GetProperty('color_format')[0])
+    if data.ndim == 3 or colorformat not in PATTERNS:
+        return to_rgb(data, frameformat.pixelFormat, colorformat, out)
+    if out is None:
+        out = numpy.empty(data.shape + (3, ), numpy.float32)
+    scale = 256.0 if frameformat.pixelFormat == API.LUCAM_PF_8 else 1.0
+    raw = numpy.multiply(data, scale, dtype=numpy.float32)
+    numpy.rint(raw, out=raw)
+    numpy.clip(raw, 0, 65535, out=raw)
+    format16 = copy.copy(frameformat)
+    format16.pixelFormat = API.LUCAM_PF_16
+    bgr = camera.ConvertFrameToRgb48(
+        format16, raw.astype(camera._byteorder + 'u2'))
+    numpy.multiply(bgr[..., ::-1], 1.0 / 256.0, out=out, casting='unsafe')
+    camera.release_frame(bgr)
+    return out
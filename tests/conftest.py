@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# conftest.py
+
+"""Pytest configuration of the lumenera_lucam tests.
+
+The tests run against the camera simulator. The plug-in modules are
+imported as the 'lumenera_lucam' package without running its __init__,
+which imports ScopeFoundry and Qt. Tests of the ScopeFoundry hardware and
+measurement components use the offscreen Qt platform.
+
+"""
+import os
+import sys
+import types
+
+import pytest
+
+os.environ['LUCAM_API'] = 'simulated'
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+if 'lumenera_lucam' not in sys.modules:
+    package = types.ModuleType('lumenera_lucam')
+    package.__path__ = [os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__)))]
+    sys.modules['lumenera_lucam'] = package
+
+
+@pytest.fixture
+def camera():
+    """Return camera of simulator not sleeping for exposure and readout."""
+    from lumenera_lucam.lucam import Lucam, load_api
+    from lumenera_lucam.lucam_sim import LucamSimulator
+
+    camera = Lucam(1, api=load_api(LucamSimulator(realtime=False)))
+    yield camera
+    if camera._handle:
+        camera.CameraClose()
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """Return ScopeFoundry app with lucam hardware and measurement."""
+    pytest.importorskip('ScopeFoundry')
+    from ScopeFoundry import BaseMicroscopeApp
+    from lumenera_lucam.lucam_hw import LucamHW
+    from lumenera_lucam.lucam_measure import LucamMeasure
+
+    class App(BaseMicroscopeApp):
+        name = 'lucam_test'
+
+        def setup(self):
+            self.add_hardware(LucamHW(self))
+            self.add_measurement(LucamMeasure(self))
+
+    cwd = os.getcwd()
+    os.chdir(str(tmp_path_factory.mktemp('app')))
+    try:
+        app = App([])
+        app.settings['save_dir'] = os.getcwd()
+        yield app
+    finally:
+        hw = app.hardware['lucam']
+        if hw.settings['connected']:
+            hw.settings['connected'] = False
+        os.chdir(cwd)
+
+
+@pytest.fixture
+def hw(app):
+    """Return connected LucamHW of app."""
+    hw = app.hardware['lucam']
+    hw.settings['connected'] = True
+    yield hw
+    hw.settings['connected'] = False
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+# test_lucam.py
+
+"""Tests of the lucam caches and frame buffers with the camera simulator.
+
+Run ``python -m pytest tests``.
+
+"""
+import threading
+import time
+
+import numpy
+
+from lumenera_lucam.lucam import (API, Lucam, CapabilityCache, PropertyCache,
+                                  FramePool, FrameRing, FrameDispatcher,
+                                  ConversionPlan, PreTriggerCapture)
+
+
+def frame_format(width=16, height=8):
+    """Return 8 bit frame format of size."""
+    return API.LUCAM_FRAME_FORMAT(0, 0, width, height, API.LUCAM_PF_8,
+                                  binningX=1, flagsX=0, binningY=1, flagsY=0)
+
+
+def fill_ring(ring, count):
+    """Pass count frames with values 0, 1, ... to ring callback."""
+    frame = numpy.empty(ring.data.shape[1:], ring.data.dtype)
+    for i in range(count):
+        frame[:] = i
+        ring.callback(None, frame.ctypes.data, frame.nbytes)
+
+
+def test_property_cache_ttl():
+    """Test PropertyCache values expire after ttl."""
+    gain = Lucam.PROPERTY['gain']
+    cache = PropertyCache(ttl=0.05, ttls={'exposure': None})
+    cache.set(gain, 2.0, 0)
+    assert cache.get(gain) == (2.0, 0)
+    cache.set(Lucam.PROPERTY['exposure'], 10.0, 0)
+    time.sleep(0.1)
+    assert cache.get(gain) is None
+    assert cache.get(Lucam.PROPERTY['exposure']) == (10.0, 0)
+    assert cache.stats()['hits'] == 2
+
+
+def test_property_cache_exclude():
+    """Test PropertyCache does not cache volatile and auto properties."""
+    cache = PropertyCache(ttl=None)
+    temperature = Lucam.PROPERTY['temperature']
+    exposure = Lucam.PROPERTY['exposure']
+    cache.set(temperature, 25.0, 0)
+    assert cache.get(temperature) is None
+    cache.set(exposure, 10.0, API.LUCAM_PROP_FLAG_AUTO)
+    assert cache.get(exposure) is None
+
+
+def test_property_cache_invalidate():
+    """Test PropertyCache.invalidate accepts property names and numbers."""
+    cache = PropertyCache(ttl=None)
+    gain = Lucam.PROPERTY['gain']
+    exposure = Lucam.PROPERTY['exposure']
+    cache.set(gain, 2.0, 0)
+    cache.set(exposure, 10.0, 0)
+    cache.invalidate('gain')
+    assert cache.get(gain) is None
+    assert cache.get(exposure) == (10.0, 0)
+    cache.invalidate()
+    assert cache.get(exposure) is None
+
+
+def test_camera_property_cache(camera):
+    """Test cached property reads and invalidation by SetProperty."""
+    cache = camera.enable_property_cache(ttl=None)
+    value = camera.GetProperty('gain')[0]
+    assert camera.GetProperty('gain')[0] == value
+    assert cache.stats()['hits'] == 1
+    camera.SetProperty('gain', value + 1.0)
+    assert camera.GetProperty('gain')[0] == value + 1.0
+
+
+def test_capability_cache(tmp_path):
+    """Test CapabilityCache persists entries and clears file."""
+    filename = str(tmp_path / 'capabilities.json')
+    entry = dict(properties=['gain'], ranges={'gain': [0.0, 8.0, 1.0, 0]},
+                 frame_rates=[7.5, 15.0], max_width=16, max_height=8)
+    CapabilityCache(filename).set('0A2/1.2.3', entry)
+    cache = CapabilityCache(filename)
+    result = cache.get('0A2/1.2.3')
+    assert result['ranges']['gain'] == (0.0, 8.0, 1.0, 0)
+    assert result['frame_rates'] == (7.5, 15.0)
+    assert cache.get('0A2/0.0.0') is None
+    cache.clear()
+    assert CapabilityCache(filename).get('0A2/1.2.3') is None
+
+
+def test_camera_capabilities(camera, tmp_path):
+    """Test Lucam.capabilities are discovered once and cached."""
+    cache = CapabilityCache(str(tmp_path / 'capabilities.json'))
+    caps = camera.capabilities(refresh=True, cache=cache)
+    assert camera.capabilities() is caps
+    assert (caps['max_width'], caps['max_height']) == (1616, 1216)
+    assert 'gain' in caps['properties']
+    assert len(cache._load()) == 1
+    assert camera.capabilities(refresh=True, cache=cache) is not caps
+
+
+def test_frame_ring_overwrite():
+    """Test FrameRing 'overwrite' policy keeps newest frames."""
+    ring = FrameRing(frame_format(), 4, 'overwrite')
+    reader = ring.reader()
+    fill_ring(ring, 6)
+    frame = reader.read(timeout=0)
+    assert frame.sequence == 2
+    assert frame.data[0, 0] == 2
+    assert reader.missed == 2
+    assert ring.stats()['dropped'] == 0
+    assert reader.read(timeout=0, latest=True).sequence == 5
+    assert reader.read(timeout=0) is None
+
+
+def test_frame_ring_drop():
+    """Test FrameRing 'drop' policy discards new frames of full ring."""
+    ring = FrameRing(frame_format(), 4, 'drop')
+    reader = ring.reader()
+    fill_ring(ring, 6)
+    assert ring.stats()['dropped'] == 2
+    sequences = [reader.read(timeout=0).sequence for _ in range(4)]
+    assert sequences == [0, 1, 2, 3]
+    assert reader.missed == 0
+    fill_ring(ring, 1)
+    frame = reader.read(timeout=0)
+    assert frame.sequence == 6
+    assert ring.valid(frame)
+
+
+def test_frame_ring_camera(camera):
+    """Test FrameRing attached to streaming camera."""
+    ring = FrameRing(camera.GetFormat()[0], 4)
+    ring.attach(camera)
+    camera.StreamVideoControl('start_streaming')
+    try:
+        frame = ring.reader().read(timeout=5.0)
+    finally:
+        camera.StreamVideoControl('stop_streaming')
+        ring.detach()
+    assert frame.data.shape == (1216, 1616)
+
+
+def test_frame_pool():
+    """Test FramePool reuses released arrays within byte budget."""
+    pool = FramePool(maxbytes=256)
+    data = pool.acquire('key', (8, 16), 'uint8')
+    address = data.ctypes.data
+    assert pool.release(data[2:])
+    assert pool.acquire('key', (8, 16), 'uint8').ctypes.data == address
+    assert pool.stats()['hits'] == 1
+    assert not pool.release(numpy.empty((8, 16), 'uint8'))
+    large = pool.acquire('large', (32, 16), 'uint8')
+    assert pool.release(large)  # larger than maxbytes, not pooled
+    pool.acquire('large', (32, 16), 'uint8')
+    assert pool.stats()['misses'] == 3
+
+
+def test_camera_frame_pool(camera):
+    """Test TakeSnapshot reuses released frames."""
+    data = camera.TakeSnapshot()
+    address = data.ctypes.data
+    camera.release_frame(data)
+    assert camera.TakeSnapshot().ctypes.data == address
+
+
+def test_snapshot_settings_invalidated(camera):
+    """Test cached snapshot settings follow exposure changed by camera."""
+    exposure = camera.snapshot_settings().exposure
+    simulated = camera._api._handles[camera._handle]
+
+    def auto_exposure(handle, *args):
+        # the camera adjusts exposure without SetProperty
+        simulated.properties[API.LUCAM_PROP_EXPOSURE][0] = exposure + 1.0
+        return True
+
+    camera._api.LucamOneShotAutoExposure = auto_exposure
+    camera.OneShotAutoExposure(128, 0, 0, 64, 64)
+    assert camera.snapshot_settings().exposure == exposure + 1.0
+    camera._invalidate_properties('gain')
+    assert camera._snapshot is None
+
+
+def test_fast_frames_prefetch(camera):
+    """Test fast_frames alternates two buffers filled by one worker."""
+    threads = threading.active_count()
+    with camera.fast_frames(numframes=6, prefetch=True) as frames:
+        addresses = [frame.ctypes.data for frame in frames]
+        assert threading.active_count() <= threads + 1
+    assert frames.count == 6
+    assert len(set(addresses)) == 2
+    assert addresses[0::2] == [addresses[0]] * 3
+    assert threading.active_count() == threads
+
+
+def test_conversion_plan_buffers(camera):
+    """Test ConversionPlan allocates its output ring only when used."""
+    frameformat = camera.GetFormat()[0]
+    raw = camera.TakeSnapshot()
+    image = camera.ConvertFrameToRgb24(frameformat, raw)
+    plan = camera.conversion_plan(frameformat)
+    assert list(camera._conversion_plans.values()) == [plan]
+    assert image.shape == plan.shape
+    assert plan.buffers is None
+    first = plan(raw)
+    assert len(plan.buffers) == plan.numbuffers == 3
+    assert first is plan.buffers[0]
+    assert plan(raw) is plan.buffers[1]
+
+
+def test_dispatcher_workers_convert(camera):
+    """Test concurrent workers deliver distinct and intact conversions."""
+    numframes = 48
+    frameformat = frame_format()
+    plan = ConversionPlan(camera, frameformat, API.LUCAM_CONVERSION(),
+                          'grey8', numbuffers=numframes)
+    ring = FrameRing(frameformat, numframes, 'drop')
+    dispatcher = FrameDispatcher(ring, workers=4)
+    frames = []
+    lock = threading.Lock()
+
+    def callback(frame):
+        time.sleep(0.001)
+        with lock:
+            frames.append(frame)
+
+    dispatcher.subscribe(callback, convert=plan)
+    dispatcher.start()
+    try:
+        fill_ring(ring, numframes)
+        deadline = time.perf_counter() + 5.0
+        while dispatcher.dispatched < numframes:
+            assert time.perf_counter() < deadline
+            time.sleep(0.01)
+    finally:
+        dispatcher.stop()
+    assert len(frames) == numframes
+    assert dispatcher.stats()['subscribers'][1]['errors'] == 0
+    assert len(set(frame.data.ctypes.data for frame in frames)) == numframes
+    for frame in frames:
+        # raw frames are filled with their sequence number
+        assert frame.data.shape == plan.shape
+        assert (frame.data == frame.sequence).all()
+
+
+def test_pretrigger_capture(camera):
+    """Test software trigger captures frames before and after trigger."""
+    captures = []
+
+    def save(frames, sequences, timestamps, trigger):
+        captures.append((frames[:, 0, 0].copy(), sequences.copy(), trigger))
+
+    def statistic(data):
+        time.sleep(0.002)  # slow monitor misses frames
+        return 0.0
+
+    capture = PreTriggerCapture(frame_format(), 4, 2, save, margin=2,
+                                source='threshold', threshold=1.0,
+                                statistic=statistic)
+    assert capture.stats()['missed'] == 0
+    capture.arm(camera)
+    try:
+        fill_ring(capture.ring, 10)
+        time.sleep(0.05)
+        capture.trigger()
+        frame = numpy.empty((8, 16), 'uint8')
+        deadline = time.perf_counter() + 5.0
+        i = 10
+        while not capture.saved:
+            assert time.perf_counter() < deadline
+            frame[:] = i
+            capture.ring.callback(None, frame.ctypes.data, frame.nbytes)
+            i += 1
+            time.sleep(0.01)
+        missed = capture.stats()['missed']
+    finally:
+        capture.disarm()
+    assert missed > 0
+    assert capture.stats()['missed'] == missed
+    values, sequences, trigger = captures[0]
+    assert trigger['source'] == 'software'
+    assert trigger['pre_frames'] == 4
+    assert len(sequences) == 6
+    assert list(sequences) == list(range(sequences[0], sequences[0] + 6))
+    assert list(values) == list(sequences)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# test_lucam_async.py
+
+"""Tests of the lucam_async module with the camera simulator.
+
+Run ``python -m pytest tests``.
+
+"""
+import asyncio
+import threading
+import time
+
+import numpy
+import pytest
+
+from lumenera_lucam.lucam import Lucam, load_api
+from lumenera_lucam.lucam_async import AsyncLucam
+from lumenera_lucam.lucam_sim import LucamSimulator
+
+
+def small_format(camera, framerate=None):
+    """Set 64x64 pixel format of camera."""
+    frameformat, rate = camera.GetFormat()
+    frameformat.width = frameformat.height = 64
+    camera.SetFormat(frameformat, rate if framerate is None else framerate)
+
+
+def test_open_snapshot():
+    """Test AsyncLucam opens, takes snapshots, and closes camera."""
+
+    async def main():
+        api = load_api(LucamSimulator(realtime=False))
+        async with await AsyncLucam.open(1, api) as camera:
+            await camera.call(small_format, camera.camera)
+            images = await asyncio.gather(
+                *[camera.TakeSnapshot() for _ in range(3)])
+            fmt = await camera.call('GetFormat')
+        return camera, images, fmt
+
+    camera, images, (frameformat, rate) = asyncio.run(main())
+    assert not camera.camera._handle
+    assert frameformat.width == 64
+    for image in images:
+        assert image.shape == (64, 64) and image.dtype == numpy.uint8
+
+
+def test_call_thread(camera):
+    """Test calls run serialized in one camera thread."""
+    threads = []
+
+    def record(delay):
+        threads.append(threading.current_thread())
+        time.sleep(delay)
+        return len(threads)
+
+    async def main():
+        acamera = AsyncLucam(camera)
+        results = await asyncio.gather(*[acamera.call(record, 0.01)
+                                         for _ in range(4)])
+        await acamera.close()
+        return results
+
+    assert asyncio.run(main()) == [1, 2, 3, 4]
+    assert len(set(threads)) == 1
+    assert threads[0] is not threading.current_thread()
+    assert camera._handle
+
+
+def test_cancel_video():
+    """Test cancelled TakeVideo is aborted and frees camera thread."""
+    camera = Lucam(1, api=load_api(LucamSimulator(realtime=True)))
+
+    async def main():
+        async with AsyncLucam(camera, owner=True) as acamera:
+            await acamera.call(small_format, camera, 3.75)
+            await acamera.call('StreamVideoControl', 'start_streaming')
+            start = time.perf_counter()
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(acamera.TakeVideo(100), 0.2)
+            elapsed = time.perf_counter() - start
+            await acamera.call('StreamVideoControl', 'stop_streaming')
+            image = await acamera.TakeSnapshot()
+        return elapsed, image
+
+    elapsed, image = asyncio.run(main())
+    assert elapsed < 2.0
+    assert image.shape == (64, 64)
+    assert not camera._handle
+
+
+def test_frame_stream(camera):
+    """Test FrameStream delivers frames and drops those without slot."""
+    small_format(camera)
+
+    async def main():
+        frames = []
+        async with AsyncLucam(camera) as acamera:
+            async with acamera.frames(numslots=2) as stream:
+                async for frame in stream:
+                    frames.append((frame.data.copy(), frame.sequence))
+                    if len(frames) == 8:
+                        break
+                    await asyncio.sleep(0.02)
+            stats = stream.stats()
+        return frames, stats, stream
+
+    frames, stats, stream = asyncio.run(main())
+    assert camera._streaming is None
+    assert len(frames) == 8
+    assert stats['delivered'] == 8
+    assert stats['dropped'] > 0
+    assert stats['received'] >= stats['delivered'] + stats['dropped']
+    sequences = [sequence for data, sequence in frames]
+    assert sequences == sorted(set(sequences))
+    assert frames[0][0].shape == (64, 64)
+    with pytest.raises(ValueError):
+        AsyncLucam(camera).frames(numslots=1)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# test_lucam_h5.py
+
+"""Tests of the lucam_h5 module.
+
+Run ``python -m pytest tests``.
+
+"""
+import numpy
+import pytest
+
+from lumenera_lucam.lucam import Frame
+from lumenera_lucam.lucam_h5 import (H5Writer, FrameRecorder,
+                                     dataset_options, storage_array,
+                                     mean_atol, write_datasets)
+
+h5py = pytest.importorskip('h5py')
+
+
+def test_storage_array_float32():
+    """Test float64 data are stored as float32 unless disabled."""
+    data = numpy.linspace(0, 65535, 101)
+    assert storage_array(data).dtype == numpy.float32
+    assert storage_array(data, float32=False).dtype == numpy.float64
+    frames = numpy.arange(10, dtype=numpy.uint16)
+    assert storage_array(frames).dtype == numpy.uint16
+
+
+def test_storage_array_atol():
+    """Test float64 data are kept if float32 exceeds absolute tolerance."""
+    # mean of 100 frames of 16 bit integers: quantization step 0.01
+    mean = numpy.array([0.01, 655.35, 65534.99])
+    assert storage_array(mean, atol=0.005).dtype == numpy.float32
+    assert storage_array(mean + 1e9, atol=0.005).dtype == numpy.float64
+    assert storage_array(numpy.array([numpy.nan, 1.0]),
+                         atol=0.5).dtype == numpy.float32
+
+
+def test_storage_array_range():
+    """Test float64 data exceeding float32 range are kept."""
+    data = numpy.array([1.0, 1e300, numpy.inf])
+    assert storage_array(data).dtype == numpy.float64
+    assert storage_array(data[[0, 2]]).dtype == numpy.float32
+
+
+def test_mean_atol():
+    """Test tolerance is half the quantization step of mean of frames."""
+    assert mean_atol(1) == 0.5
+    assert mean_atol(100) == 0.005
+    assert mean_atol(100, bits=16) == 0.005 / 256
+    assert mean_atol(0) == 0.5
+
+
+def test_write_datasets(tmp_path):
+    """Test datasets are written with options and float32 tolerance."""
+    mean = numpy.array([[0.25, 100.5], [65000.125, 3.0]])
+    # float32 rounds 123456789 to 123456792
+    data = {'mean': mean, 'count': numpy.array(4),
+            'large': mean + 123456789.0}
+    with h5py.File(str(tmp_path / 'test.h5'), 'w') as h5file:
+        write_datasets(h5file, data, dataset_options('gzip', 1, True, (1, )),
+                       atol=mean_atol(4))
+        assert h5file['mean'].dtype == numpy.float32
+        assert h5file['mean'].chunks == (1, 2)
+        assert h5file['mean'].compression == 'gzip'
+        assert h5file['large'].dtype == numpy.float64
+        assert h5file['count'][()] == 4
+        numpy.testing.assert_array_equal(h5file['mean'][:], mean)
+
+
+def test_h5writer():
+    """Test H5Writer runs jobs in order and counts errors."""
+    writer = H5Writer(maxsize=2)
+    results = []
+
+    def fail():
+        raise RuntimeError('expected')
+
+    for i in range(5):
+        writer.submit(results.append, i)
+    writer.submit(fail)
+    writer.flush()
+    assert results == [0, 1, 2, 3, 4]
+    assert writer.pending() == 0
+    writer.close()
+    assert (writer.written, writer.errors) == (5, 1)
+
+
+def test_frame_recorder(tmp_path):
+    """Test FrameRecorder appends frames in chunks up to limit."""
+    with h5py.File(str(tmp_path / 'test.h5'), 'w') as h5file:
+        recorder = FrameRecorder(h5file, (4, 8), 'uint16', frames_per_chunk=3,
+                                 queue_frames=16, limit=10)
+        frame = numpy.empty((4, 8), 'uint16')
+        for i in range(12):
+            frame[:] = i
+            recorder.put(Frame(frame, i, i * 0.1))
+        assert recorder.done()
+        recorder.close()
+        assert recorder.stats()['recorded'] == 10
+        assert h5file['frames'].shape == (10, 4, 8)
+        assert h5file['frames'].chunks == (3, 4, 8)
+        numpy.testing.assert_array_equal(h5file['frames'][:, 0, 0],
+                                         numpy.arange(10))
+        numpy.testing.assert_array_equal(h5file['frames_sequence'][:],
+                                         numpy.arange(10))
+        numpy.testing.assert_allclose(h5file['frames_timestamp'][-1], 0.9)
+
+
+def test_frame_recorder_drop(tmp_path):
+    """Test FrameRecorder drops frames while its queue is full."""
+    with h5py.File(str(tmp_path / 'test.h5'), 'w') as h5file:
+        recorder = FrameRecorder(h5file, (4, 8), 'uint8', queue_frames=2)
+        frame = Frame(numpy.zeros((4, 8), 'uint8'), 0, 0.0)
+        # occupy all slots as if the writer fell behind
+        slots = [recorder._free.get_nowait() for _ in range(2)]
+        recorder.put(frame)
+        assert recorder.dropped == 1
+        for slot in slots:
+            recorder._free.put(slot)
+        recorder.put(frame)
+        recorder.close()
+        assert (recorder.recorded, recorder.dropped) == (1, 1)
+        with pytest.raises(ValueError):
+            recorder.put(Frame(numpy.zeros((2, 2), 'uint8'), 1, 0.0))
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+# test_lucam_hw.py
+
+"""Tests of the LucamHW ScopeFoundry hardware with the camera simulator.
+
+Run ``python -m pytest tests``.
+
+"""
+import threading
+
+import numpy
+
+
+def collect(hw, count, fmt='rgb', timeout=5.0):
+    """Return list of first count frames delivered by frame bus."""
+    frames = []
+    done = threading.Event()
+
+    def callback(frame):
+        frames.append(frame)
+        if len(frames) >= count:
+            done.set()
+
+    subscriber = hw.subscribe(callback, fmt)
+    try:
+        assert done.wait(timeout)
+    finally:
+        hw.unsubscribe(subscriber)
+    return frames[:count]
+
+
+def test_read_snapshot(hw):
+    """Test snapshots are RGB images not reused by later snapshots."""
+    images = [hw.read_snapshot() for _ in range(4)]
+    assert images[0].shape[2] == 3 and images[0].dtype == numpy.uint8
+    assert not numpy.shares_memory(images[0], images[3])
+
+
+def test_bus_workers(hw):
+    """Test frame bus workers deliver images owned by subscribers."""
+    hw.settings['streaming_workers'] = 3
+    try:
+        frames = collect(hw, 12, 'rgb')
+    finally:
+        hw.settings['streaming_workers'] = 1
+    images = [frame.data for frame in frames]
+    for i, image in enumerate(images):
+        assert image.shape[2] == 3
+        for other in images[i + 1:]:
+            assert not numpy.shares_memory(image, other)
+    raw = collect(hw, 2, 'raw')
+    grey = collect(hw, 2, 'grey')
+    assert grey[0].data.shape == raw[0].data.shape
+    assert hw.bus_stats() == {}
+
+
+def test_write_format_cached(hw, monkeypatch):
+    """Test write_format compares settings with the cached camera format."""
+    hw.write_format(force=True)
+    calls = []
+    getformat = hw.dev._api.LucamGetFormat
+
+    def counting(*args):
+        calls.append(args)
+        return getformat(*args)
+
+    monkeypatch.setattr(hw.dev._api, 'LucamGetFormat', counting)
+    assert not hw.write_format()
+    assert not calls
+    frameformat, rate = hw.dev.GetFormat()
+    hw.dev.SetFormat(frameformat, rate / 2)
+    assert hw.write_format()
+    assert hw.dev.GetFormat()[1] == hw.settings['frame_rate']
+    del calls[:]
+    assert not hw.write_format()
+    assert not calls
+    hw.dev.CameraReset()
+    hw.write_format()
+    assert calls
+
+
+def test_write_format_rate(hw):
+    """Test frame rate changes keep the frame bus running."""
+    frames = []
+    received = threading.Event()
+
+    def callback(frame):
+        frames.append(frame)
+        received.set()
+
+    hw.write_format()
+    subscriber = hw.subscribe(callback, 'raw')
+    try:
+        assert received.wait(5.0)
+        ring = hw._ring
+        rate = hw.settings['frame_rate']
+        hw.settings['frame_rate'] = rate / 2
+        try:
+            assert hw.write_format()
+            assert hw._ring is ring
+            assert hw.dev.GetFormat()[1] == rate / 2
+            count = len(frames)
+            received.clear()
+            assert received.wait(5.0)
+            assert len(frames) > count
+        finally:
+            hw.settings['frame_rate'] = rate
+            hw.write_format()
+        hw.settings['width'] = hw.settings['width'] // 2
+        try:
+            assert hw.write_format()
+            assert hw._ring is not ring
+        finally:
+            hw.settings['width'] = hw.settings['width'] * 2
+            hw.write_format()
+    finally:
+        hw.unsubscribe(subscriber)
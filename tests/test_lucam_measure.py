@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# test_lucam_measure.py
+
+"""Tests of the LucamMeasure modes with the camera simulator.
+
+Run ``python -m pytest tests``.
+
+"""
+import os
+import time
+
+import numpy
+import pytest
+
+
+def run(app, mode, timeout=30.0, **settings):
+    """Run measurement in mode to completion and return it."""
+    measure = app.measurements['lucam']
+    measure.settings['mode'] = mode
+    measure.settings['save_h5'] = False
+    for key, value in settings.items():
+        measure.settings[key] = value
+    measure.start()
+    deadline = time.perf_counter() + timeout
+    while measure.is_measuring():
+        if time.perf_counter() > deadline:
+            measure.interrupt()
+        app.qtapp.processEvents()
+        time.sleep(0.01)
+    return measure
+
+
+def test_averaging(app, hw):
+    """Test averaged image is converted like streamed frames."""
+    hw.settings['pixel_format'] = 0
+    measure = run(app, 'averaging', N_avg=4)
+    image = measure.data['image']
+    snapshot = hw.read_snapshot()
+    assert image.shape == snapshot.shape
+    assert image.dtype == numpy.float32
+    # frames differ by noise only
+    assert abs(float(image.mean()) - float(snapshot.mean())) < 2.0
+
+
+def test_statistics(app, hw):
+    """Test statistics of concurrent bus workers include exactly N frames."""
+    hw.settings['pixel_format'] = 0
+    hw.settings['streaming_workers'] = 3
+    try:
+        measure = run(app, 'statistics', N_avg=6, stats_format='raw')
+    finally:
+        hw.settings['streaming_workers'] = 1
+    assert measure.data['frame_count'][0] == 6
+    assert measure.data['mean'].shape == measure.data['variance'].shape
+    assert measure.data['image'].shape == measure.data['mean'].shape + (3, )
+
+
+def test_float32_atol(app):
+    """Test HDF5 float32 tolerance follows N_avg and pixel format."""
+    measure = app.measurements['lucam']
+    hw = app.hardware['lucam']
+    measure.settings['N_avg'] = 100
+    hw.settings['pixel_format'] = 0
+    assert measure.float32_atol() == 0.005
+    hw.settings['pixel_format'] = 1
+    assert measure.float32_atol() == 0.005 / 256
+
+
+def test_recording(app, hw):
+    """Test recording mode writes record_frames frames to HDF5."""
+    h5py = pytest.importorskip('h5py')
+    save_dir = app.settings['save_dir']
+    before = set(os.listdir(save_dir))
+    measure = run(app, 'recording', record_frames=5, compression='none')
+    assert measure.settings['frames_recorded'] == 5
+    (fname, ) = set(os.listdir(save_dir)) - before
+    with h5py.File(os.path.join(save_dir, fname), 'r') as h5file:
+        group = h5file['measurement/lucam']
+        assert group['frames'].shape[0] == 5
+        assert group['frames_sequence'].shape == (5, )
+
+
+def test_pretrigger(app, hw):
+    """Test software trigger of pretrigger mode saves a capture."""
+    pytest.importorskip('h5py')
+    measure = app.measurements['lucam']
+    measure.settings['mode'] = 'pretrigger'
+    measure.settings['pre_seconds'] = 0.2
+    measure.settings['pre_megabytes'] = 0.0
+    measure.settings['post_frames'] = 2
+    measure.settings['trigger_source'] = 'software'
+    measure.start()
+    deadline = time.perf_counter() + 10.0
+    try:
+        while measure.capture is None:
+            assert time.perf_counter() < deadline
+            app.qtapp.processEvents()
+            time.sleep(0.01)
+        time.sleep(0.3)
+        measure.trigger()
+        while measure.settings['captures'] < 1:
+            assert time.perf_counter() < deadline
+            app.qtapp.processEvents()
+            time.sleep(0.01)
+    finally:
+        measure.interrupt()
+        while measure.is_measuring():
+            app.qtapp.processEvents()
+            time.sleep(0.01)
+    assert measure.settings['captures'] == 1
+
+
+def test_burst(app, hw):
+    """Test burst at maximum frame rate restores the frame rate."""
+    hw.settings['pixel_format'] = 0
+    frame_rate = min(hw.get_available_frame_rates())
+    hw.settings['frame_rate'] = frame_rate
+    measure = run(app, 'burst', burst_frames=8, burst_chunk=3,
+                  burst_max_rate=True, burst_storage='memory')
+    assert measure.settings['burst_fps'] > 0.0
+    assert hw.settings['frame_rate'] == frame_rate
+    assert hw.dev.GetFormat()[1] == frame_rate
+    assert measure.data['image'].ndim == 3
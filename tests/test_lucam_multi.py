@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# test_lucam_multi.py
+
+"""Tests of the lucam_multi module with two simulated cameras.
+
+Run ``python -m pytest tests``.
+
+"""
+import pytest
+
+from lumenera_lucam.lucam import API
+from lumenera_lucam.lucam_multi import CameraManager, camera_number
+
+
+@pytest.fixture
+def cameras(monkeypatch):
+    """Return CameraManager of two simulated cameras in small format."""
+    monkeypatch.setattr(API.bind(), 'numcameras', 2)
+    manager = CameraManager()
+    try:
+        for camera in manager.cameras.values():
+            frameformat, rate = camera.GetFormat()
+            frameformat.width = frameformat.height = 64
+            camera.SetFormat(frameformat, rate)
+        yield manager
+    finally:
+        manager.close()
+
+
+def test_camera_number(monkeypatch):
+    """Test camera_number finds camera by serial number."""
+    monkeypatch.setattr(API.bind(), 'numcameras', 2)
+    assert camera_number(100001) == 1
+    assert camera_number(100002) == 2
+    with pytest.raises(ValueError):
+        camera_number(1)
+
+
+def test_serials(cameras):
+    """Test cameras are addressed by serial number."""
+    assert cameras.serials == (100001, 100002)
+    assert len(cameras) == 2
+    for serial in cameras.serials:
+        assert cameras[serial].QueryVersion().serialnumber == serial
+    with pytest.raises(ValueError):
+        CameraManager([100003])
+    with pytest.raises(ValueError):
+        cameras.start('triggered')
+
+
+@pytest.mark.parametrize('mode', CameraManager.MODES)
+def test_acquisition(cameras, mode):
+    """Test frame tuples of both cameras are matched by timestamp."""
+    cameras.start(mode, numsets=4)
+    try:
+        with pytest.raises(RuntimeError):
+            cameras.start(mode)
+        tuples = list(cameras.frames(5, timeout=5.0))
+    finally:
+        cameras.stop()
+    assert len(tuples) == 5
+    for frames in tuples:
+        assert len(frames) == 2
+        assert frames[0].data.shape == frames[1].data.shape == (64, 64)
+        assert (abs(frames[0].timestamp - frames[1].timestamp)
+                <= cameras.tolerance)
+        if mode == 'synchronized':
+            assert frames[0].sequence == frames[1].sequence
+    stats = cameras.stats()
+    assert stats['mode'] is None
+    assert stats['matched'] >= 5
+    assert set(stats['cameras']) == set(cameras.serials)
+    for counts in stats['cameras'].values():
+        assert counts['received'] >= 5
+    # matched frames remain readable after stop
+    assert len(list(cameras.frames(timeout=0.1))) == stats['queued']
+    assert cameras.read(timeout=0.1) is None
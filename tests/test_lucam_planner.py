@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# test_lucam_planner.py
+
+"""Tests of the lucam_planner module with the camera simulator.
+
+Run ``python -m pytest tests``.
+
+"""
+import pytest
+
+from lumenera_lucam.lucam import API
+from lumenera_lucam.lucam_planner import (
+    plan_formats, measure_fps, predict_fps, frame_formats, MeasurementCache,
+    _span)
+
+
+def test_span():
+    """Test _span rounds region to valid offset and size."""
+    assert _span(0, 100, 8, 1616) == (0, 104)
+    assert _span(13, 100, 8, 1616) == (8, 112)
+    assert _span(13, 100, 16, 1616) == (8, 112)
+    assert _span(12, 100, 48, 1616) == (8, 144)
+    assert _span(1600, 100, 8, 1616) == (1600, 16)
+    assert _span(0, 5000, 16, 1616) == (0, 1616)
+
+
+def test_frame_formats():
+    """Test frame_formats covers region at all binnings and formats."""
+    formats = frame_formats((10, 20, 300, 200), 1616, 1216, (1, 2, 4, 16))
+    assert len(formats) == 8
+    for f in formats:
+        step = max(8, f.binningX)
+        assert f.xOffset % 8 == 0 and f.yOffset % 8 == 0
+        assert f.width % step == 0 and f.height % step == 0
+        assert f.xOffset <= 10 and f.xOffset + f.width >= 310
+        assert f.yOffset <= 20 and f.yOffset + f.height >= 220
+        assert f.xOffset + f.width <= 1616
+        assert f.yOffset + f.height <= 1216
+    assert {f.pixelFormat for f in formats} == {API.LUCAM_PF_8,
+                                                API.LUCAM_PF_16}
+    with pytest.raises(ValueError):
+        frame_formats((0, 0, 0, 10), 1616, 1216)
+
+
+def test_predict_fps():
+    """Test predict_fps scales by rows and limits by bandwidth, exposure."""
+    f = frame_formats((0, 0, 1616, 608), 1616, 1216, (1, ),
+                      (API.LUCAM_PF_8, ))[0]
+    assert predict_fps(f, 30.0, 1216) == pytest.approx(60.0)
+    assert predict_fps(f, 30.0, 1216, bandwidth=1616 * 608 * 10.0) == (
+        pytest.approx(10.0))
+    assert predict_fps(f, 30.0, 1216, exposure=50.0) == pytest.approx(20.0)
+
+
+def test_plan_formats(camera, tmp_path):
+    """Test plan_formats ranks candidates meeting target frame rate."""
+    cache = MeasurementCache(str(tmp_path / 'formats.json'))
+    plan = plan_formats(camera, (100, 100, 400, 300), target_fps=60.0,
+                        cache=cache)
+    assert plan
+    first = plan[0]
+    assert first.measured_fps is None
+    if first.predicted_fps >= 60.0:
+        for candidate in plan:
+            if candidate.predicted_fps >= 60.0:
+                assert (candidate.frameformat.binningX
+                        >= first.frameformat.binningX)
+    for candidate in plan:
+        assert candidate.bandwidth > 0
+    plan = plan_formats(camera, (100, 100, 400, 300), min_bits=10,
+                        cache=cache)
+    assert all(c.frameformat.pixelFormat == API.LUCAM_PF_16 for c in plan)
+    with pytest.raises(ValueError):
+        plan_formats(camera, (100, 100, 400, 300), min_bits=17, cache=cache)
+
+
+def test_plan_formats_measure(camera, tmp_path):
+    """Test plan_formats measures top candidates and caches results."""
+    cache = MeasurementCache(str(tmp_path / 'formats.json'))
+    previous = camera.GetFormat()
+    plan = plan_formats(camera, (0, 0, 64, 64), binnings=(1, ), measure=1,
+                        duration=0.2, cache=cache)
+    assert plan[0].measured_fps > 0
+    key = cache.key(camera.GetCameraId(), plan[0].frameformat,
+                    plan[0].framerate)
+    assert cache.get(key)['fps'] == plan[0].measured_fps
+    current = camera.GetFormat()
+    assert current[1] == previous[1]
+    assert bytes(current[0]) == bytes(previous[0])
+    # measurements are reused from the persistent table
+    cache = MeasurementCache(cache.filename)
+    again = plan_formats(camera, (0, 0, 64, 64), binnings=(1, ), measure=1,
+                         duration=0.2, cache=cache)
+    assert again[0].measured_fps == plan[0].measured_fps
+
+
+def test_measure_fps(camera, tmp_path):
+    """Test measure_fps restores format and refuses streaming camera."""
+    cache = MeasurementCache(str(tmp_path / 'formats.json'))
+    previous = camera.GetFormat()
+    f = frame_formats((0, 0, 64, 64), 1616, 1216, (1, ),
+                      (API.LUCAM_PF_8, ))[0]
+    fps = measure_fps(camera, f, previous[1], 0.2, cache)
+    assert fps > 0
+    assert cache.get(cache.key(camera.GetCameraId(), f,
+                               previous[1]))['fps'] == fps
+    assert bytes(camera.GetFormat()[0]) == bytes(previous[0])
+    camera.StreamVideoControl('start_streaming')
+    try:
+        with pytest.raises(RuntimeError):
+            measure_fps(camera, f, previous[1], 0.2)
+    finally:
+        camera.StreamVideoControl('stop_streaming')
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# test_lucam_stats.py
+
+"""Tests of the lucam_stats module with the camera simulator.
+
+Run ``python -m pytest tests``.
+
+"""
+import threading
+
+import numpy
+import pytest
+
+from lumenera_lucam.lucam import API
+from lumenera_lucam.lucam_stats import (FrameAccumulator, RunningStats,
+                                        to_rgb, convert_mean)
+
+
+def test_frame_accumulator():
+    """Test FrameAccumulator mean of integer frames."""
+    accumulator = FrameAccumulator((4, 8), 'uint16')
+    frames = numpy.arange(3 * 4 * 8, dtype='uint16').reshape(3, 4, 8)
+    accumulator.add_frames(frames)
+    assert accumulator.count == 3
+    mean = accumulator.mean()
+    assert mean.dtype == numpy.float32
+    numpy.testing.assert_allclose(mean, frames.mean(axis=0))
+    assert accumulator.mean() is mean
+    accumulator.reset()
+    assert not accumulator.mean().any()
+
+
+def test_frame_accumulator_capacity():
+    """Test uint32 accumulator refuses frames that could overflow it."""
+    accumulator = FrameAccumulator((2, 2), 'uint16')
+    assert accumulator.capacity == (2**32 - 1) // (2**16 - 1)
+    accumulator.count = accumulator.capacity
+    with pytest.raises(OverflowError):
+        accumulator.add(numpy.zeros((2, 2), 'uint16'))
+    accumulator = FrameAccumulator((2, 2), 'uint16', 'float32')
+    assert accumulator.capacity is None
+    with pytest.raises(ValueError):
+        FrameAccumulator((2, 2), 'float32', 'uint32')
+
+
+def test_running_stats():
+    """Test RunningStats maps match statistics of all frames."""
+    rng = numpy.random.default_rng(42)
+    frames = rng.integers(0, 4096, (10, 20, 6), 'uint16')
+    stats = RunningStats(frames.shape[1:], frames.dtype, chunk_rows=7)
+    for frame in frames:
+        assert stats.update(frame)
+    maps = stats.maps()
+    assert maps['count'] == 10
+    numpy.testing.assert_allclose(maps['mean'], frames.mean(axis=0),
+                                  rtol=1e-5)
+    numpy.testing.assert_allclose(maps['variance'],
+                                  frames.var(axis=0, ddof=1), rtol=1e-3)
+    numpy.testing.assert_array_equal(maps['min'], frames.min(axis=0))
+    numpy.testing.assert_array_equal(maps['max'], frames.max(axis=0))
+    with pytest.raises(ValueError):
+        stats.update(frames[0, :10])
+
+
+def test_running_stats_limit():
+    """Test concurrent updates add no more than limit frames."""
+    stats = RunningStats((64, 64), 'uint8', chunk_rows=8, limit=50)
+    frame = numpy.ones((64, 64), 'uint8')
+    added = []
+
+    def worker():
+        added.append(sum(stats.update(frame) for _ in range(20)))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stats.count == sum(added) == 50
+    assert not stats.update(frame)
+    assert (stats.mean == 1.0).all()
+
+
+def test_to_rgb_mono():
+    """Test to_rgb scales 16 bit monochrome frames to 8 bit intensity."""
+    mean = numpy.full((2, 4), 512.5, numpy.float32)
+    rgb = to_rgb(mean, API.LUCAM_PF_16, API.LUCAM_CF_MONO)
+    assert rgb.shape == (2, 4, 3)
+    numpy.testing.assert_allclose(rgb, 512.5 / 256.0)
+
+
+def test_convert_mean(camera):
+    """Test mean of raw frames is converted like streamed frames."""
+    frameformat = camera.GetFormat()[0]
+    raw = camera.TakeSnapshot()
+    expected = camera.ConvertFrameToRgb24(frameformat, raw)[..., ::-1]
+    rgb = convert_mean(camera, raw.astype(numpy.float32), frameformat)
+    assert rgb.dtype == numpy.float32
+    assert rgb.shape == expected.shape
+    assert numpy.abs(rgb - expected).max() <= 1.0
+    # the fraction of the mean is kept
+    half = convert_mean(camera, raw + numpy.float32(0.5), frameformat)
+    numpy.testing.assert_allclose((half - rgb)[8:-8, 8:-8], 0.5, atol=0.01)